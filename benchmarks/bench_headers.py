@@ -0,0 +1,66 @@
+"""Benchmark the per-request cost of building request headers.
+
+Compares rebuilding the ``Authorization`` dict and merging it with the
+client defaults on every request, as before header caching, against the
+cached immutable header sets now used by both clients.
+
+Usage:
+    python benchmarks/bench_headers.py [--iterations N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, Dict, Mapping
+
+from replicated import ReplicatedClient
+
+
+def legacy_headers(client: ReplicatedClient) -> Dict[str, str]:
+    """Build headers from scratch, as every request did before caching."""
+    token = client.state_manager.get_dynamic_token()
+    auth = {"Authorization": f"Bearer {token or client.publishable_key}"}
+    headers = {
+        "Content-Type": "application/json",
+        "User-Agent": "replicated-python/1.0.0",
+        **client.http_client.default_headers,
+    }
+    headers.update(auth)
+    return headers
+
+
+def cached_headers(client: ReplicatedClient) -> Mapping[str, str]:
+    """Look up the precomputed headers, as requests do now."""
+    return client.http_client._build_headers(client._get_auth_headers())
+
+
+def measure(fn: Callable[[ReplicatedClient], object], client: ReplicatedClient, n: int):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(client)
+    return (time.perf_counter() - start) / n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as state_home:
+        os.environ["XDG_STATE_HOME"] = state_home
+        client = ReplicatedClient(publishable_key="pk_bench", app_slug="bench-app")
+        client.state_manager.set_dynamic_token("token_" + "x" * 64)
+        assert dict(legacy_headers(client)) == dict(cached_headers(client))
+
+        results = {}
+        for name, fn in (("legacy", legacy_headers), ("cached", cached_headers)):
+            results[name] = measure(fn, client, args.iterations)
+            print(f"{name:>7}: {results[name] * 1e6:8.3f} us/request")
+
+        saved = results["legacy"] - results["cached"]
+        print(f"  saved: {saved * 1e6:8.3f} us/request")
+
+
+if __name__ == "__main__":
+    main()
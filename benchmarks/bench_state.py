@@ -0,0 +1,139 @@
+"""Benchmark the per-request cost of reading SDK state.
+
+Compares building auth headers the way every request does against the
+pre-cache behaviour of re-reading and re-parsing ``state.json`` on each
+call. File operations are counted by instrumenting ``os.stat`` and the
+``open`` audit event; when ``strace`` is available, ``--strace`` also
+reports the real syscall counts of each mode.
+
+Usage:
+    python benchmarks/bench_state.py [--iterations N] [--strace]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+from replicated.state import StateManager
+
+_counts: Dict[str, int] = {"open": 0, "stat": 0}
+_counting = False
+
+
+def _audit(event: str, args: tuple) -> None:
+    if _counting and event == "open":
+        _counts["open"] += 1
+
+
+def _install_counters() -> None:
+    real_stat = os.stat
+
+    def counting_stat(*args, **kwargs):  # type: ignore[no-untyped-def]
+        if _counting:
+            _counts["stat"] += 1
+        return real_stat(*args, **kwargs)
+
+    os.stat = counting_stat  # type: ignore[assignment]
+    sys.addaudithook(_audit)
+
+
+def legacy_auth_headers(manager: StateManager) -> Dict[str, str]:
+    """Build auth headers by reading state from disk, as before caching."""
+    state = manager._read_state() if manager._state_file.exists() else {}
+    return {"Authorization": f"Bearer {state.get('dynamic_token')}"}
+
+
+def cached_auth_headers(manager: StateManager) -> Dict[str, str]:
+    """Build auth headers from the in-memory state cache."""
+    return {"Authorization": f"Bearer {manager.get_dynamic_token()}"}
+
+
+def measure(fn: Callable[[StateManager], object], manager: StateManager, n: int):
+    global _counting
+    for key in _counts:
+        _counts[key] = 0
+    _counting = True
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(manager)
+    elapsed = time.perf_counter() - start
+    _counting = False
+    return elapsed / n, {k: v / n for k, v in _counts.items()}
+
+
+def strace_counts(mode: str, n: int) -> Dict[str, int]:
+    """Run one mode under ``strace -c`` and return per-syscall totals."""
+    with tempfile.NamedTemporaryFile("r", suffix=".strace") as out:
+        subprocess.run(
+            ["strace", "-f", "-c", "-o", out.name, sys.executable, __file__]
+            + ["--only", mode, "--iterations", str(n)],
+            check=True,
+            capture_output=True,
+        )
+        totals: Dict[str, int] = {}
+        for line in out.read().splitlines():
+            parts = line.split()
+            if len(parts) >= 5 and parts[0][0].isdigit():
+                totals[parts[-1]] = int(parts[3])
+        return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--strace", action="store_true")
+    parser.add_argument("--only", choices=["legacy", "cached"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as state_home:
+        os.environ["XDG_STATE_HOME"] = state_home
+        manager = StateManager("bench-app")
+        manager.save_state(
+            {
+                "customer_id": "customer_123",
+                "customer_email": "user@example.com",
+                "instance_id": "instance_456",
+                "dynamic_token": "token_" + "x" * 64,
+            }
+        )
+
+        if args.only:
+            fn = legacy_auth_headers if args.only == "legacy" else cached_auth_headers
+            for _ in range(args.iterations):
+                fn(manager)
+            return
+
+        _install_counters()
+        results = {}
+        for name, fn in (
+            ("legacy", legacy_auth_headers),
+            ("cached", cached_auth_headers),
+        ):
+            per_call, ops = measure(fn, manager, args.iterations)
+            results[name] = {"us_per_call": per_call * 1e6, "file_ops": ops}
+            print(
+                f"{name:>7}: {per_call * 1e6:8.2f} us/request  "
+                f"open={ops['open']:.1f} stat={ops['stat']:.1f}"
+            )
+
+        saved = results["legacy"]["us_per_call"] - results["cached"]["us_per_call"]
+        print(f"  saved: {saved:8.2f} us/request")
+
+        if args.strace:
+            if not shutil.which("strace"):
+                sys.exit("strace not found on PATH")
+            for mode in ("legacy", "cached"):
+                totals = strace_counts(mode, args.iterations)
+                per_request = sum(totals.values()) / args.iterations
+                print(f"{mode:>7}: {per_request:6.1f} syscalls/request")
+                print(f"         {json.dumps(totals, sort_keys=True)}")
+
+
+if __name__ == "__main__":
+    main()
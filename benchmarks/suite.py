@@ -0,0 +1,270 @@
+"""Microbenchmarks of the SDK's client-side overhead.
+
+Every request is answered in-process by ``httpx.MockTransport``, so the
+numbers are the SDK's own cost per call with no network involved. State
+is kept in a temporary directory.
+
+Usage:
+    python benchmarks/suite.py                       # run and print
+    python benchmarks/suite.py --save baseline.json  # store a baseline
+    python benchmarks/suite.py --compare baseline.json [--threshold 0.25]
+
+``--compare`` exits non-zero when any benchmark is slower than the
+baseline by more than ``--threshold`` (a fraction, default 25%).
+"""
+
+import argparse
+import array
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+import replicated
+from replicated import AsyncReplicatedClient, ReplicatedClient
+from replicated.aggregators import Histogram
+from replicated.fingerprint import _compute_machine_fingerprint, get_machine_fingerprint
+from replicated.resources import AsyncInstance, Instance
+from replicated.state import StateManager
+
+# name -> function(iterations) returning the seconds taken per operation
+BENCHMARKS: Dict[str, Callable[[int], float]] = {}
+
+
+def benchmark(name: str) -> Callable[[Callable[[int], float]], Callable[[int], float]]:
+    def register(fn: Callable[[int], float]) -> Callable[[int], float]:
+        BENCHMARKS[name] = fn
+        return fn
+
+    return register
+
+
+def api(request: httpx.Request) -> httpx.Response:
+    """A minimal stand-in for the Replicated API."""
+    path = request.url.path
+    if path == "/v3/customer":
+        body = json.loads(request.content)
+        customer_id = "cust_" + body["email_address"].split("@")[0]
+        return httpx.Response(
+            201, json={"customer": {"id": customer_id, "serviceToken": "svc_tok"}}
+        )
+    if path.endswith("/instances"):
+        return httpx.Response(201, json={"id": "inst_1"})
+    return httpx.Response(200, json={})
+
+
+def timed(fn: Callable[[], Any], iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def sync_client() -> ReplicatedClient:
+    return ReplicatedClient(
+        publishable_key="pk_bench",
+        app_slug="bench-app",
+        transport=httpx.MockTransport(api),
+        fingerprint="bench-host",
+    )
+
+
+@benchmark("send_metric")
+def bench_send_metric(iterations: int) -> float:
+    with sync_client() as client:
+        instance = Instance(client, "cust_bench", "inst_1")
+        return timed(lambda: instance.send_metric("cpu", 0.5), iterations)
+
+
+@benchmark("async_send_metric_concurrent")
+def bench_async_send_metric(iterations: int) -> float:
+    concurrency = 50
+
+    async def run() -> float:
+        async with AsyncReplicatedClient(
+            publishable_key="pk_bench",
+            app_slug="bench-app",
+            transport=httpx.MockTransport(api),
+            fingerprint="bench-host",
+        ) as client:
+            instance = AsyncInstance(client, "cust_bench", "inst_1")
+
+            async def worker(n: int) -> None:
+                for _ in range(n):
+                    await instance.send_metric("cpu", 0.5)
+
+            per_worker = max(1, iterations // concurrency)
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+            return (time.perf_counter() - start) / (per_worker * concurrency)
+
+    return asyncio.run(run())
+
+
+# Latencies recorded per batch by the sample-ingestion benchmarks.
+SAMPLE_BATCH = array.array(
+    "d", (random.Random(0).lognormvariate(-3, 1) for _ in range(10000))
+)
+
+
+@benchmark("histogram_observe_per_sample")
+def bench_histogram_observe(iterations: int) -> float:
+    """Seconds per sample when a batch is looped through ``observe``."""
+    histogram = Histogram("latency")
+
+    def observe_all() -> None:
+        for value in SAMPLE_BATCH:
+            histogram.observe(value)
+
+    batches = max(1, iterations // 100)
+    return timed(observe_all, batches) / len(SAMPLE_BATCH)
+
+
+@benchmark("record_samples_per_sample")
+def bench_record_samples(iterations: int) -> float:
+    """Seconds per sample when a batch goes through ``record_samples``."""
+    with sync_client() as client:
+        instance = Instance(client, "cust_bench", "inst_1")
+        batches = max(1, iterations // 100)
+        return timed(
+            lambda: instance.record_samples("latency", SAMPLE_BATCH), batches
+        ) / len(SAMPLE_BATCH)
+
+
+@benchmark("get_or_create_cached")
+def bench_get_or_create_cached(iterations: int) -> float:
+    with sync_client() as client:
+        client.customer.get_or_create("bench@example.com")
+        return timed(
+            lambda: client.customer.get_or_create("bench@example.com"), iterations
+        )
+
+
+@benchmark("get_or_create_uncached")
+def bench_get_or_create_uncached(iterations: int) -> float:
+    with sync_client() as client:
+        # A new email each call misses the cache and creates the customer.
+        emails = (f"user{i}@example.com" for i in itertools.count())
+        return timed(lambda: client.customer.get_or_create(next(emails)), iterations)
+
+
+@benchmark("state_read")
+def bench_state_read(iterations: int) -> float:
+    manager = StateManager("bench-app")
+    manager.set_dynamic_token("token")
+    return timed(manager.get_dynamic_token, iterations)
+
+
+@benchmark("state_write")
+def bench_state_write(iterations: int) -> float:
+    manager = StateManager("bench-app")
+    values = itertools.count()
+    return timed(lambda: manager.set_instance_id(f"inst_{next(values)}"), iterations)
+
+
+@benchmark("fingerprint_cached")
+def bench_fingerprint_cached(iterations: int) -> float:
+    get_machine_fingerprint()
+    return timed(get_machine_fingerprint, iterations)
+
+
+@benchmark("fingerprint_uncached")
+def bench_fingerprint_uncached(iterations: int) -> float:
+    return timed(_compute_machine_fingerprint, max(1, iterations // 100))
+
+
+def run(names: List[str], iterations: int, repeats: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name in names:
+        fn = BENCHMARKS[name]
+        fn(max(1, iterations // 10))  # Warm up caches and imports
+        samples = [fn(iterations) for _ in range(repeats)]
+        per_op = statistics.median(samples)
+        results[name] = {
+            "us_per_op": per_op * 1e6,
+            "ops_per_sec": 1.0 / per_op if per_op else float("inf"),
+            "stdev_us": statistics.pstdev(samples) * 1e6,
+        }
+        print(
+            f"{name:>30}: {per_op * 1e6:10.2f} us/op  "
+            f"{results[name]['ops_per_sec']:12.0f} ops/s"
+        )
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """Print a comparison and return the names that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':>30}  {'baseline':>10}  {'current':>10}  change")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:>30}  {'-':>10}  {current['us_per_op']:10.2f}  new")
+            continue
+        change = current["us_per_op"] / before["us_per_op"] - 1.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:>30}  {before['us_per_op']:10.2f}  "
+            f"{current['us_per_op']:10.2f}  {change:+7.1%}{flag}"
+        )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS))
+    parser.add_argument("--save", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as state_home:
+        os.environ["XDG_STATE_HOME"] = state_home
+        results = run(args.only or list(BENCHMARKS), args.iterations, args.repeats)
+
+    if args.save:
+        document = {
+            "meta": {
+                "sdk_version": replicated.__version__,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "iterations": args.iterations,
+                "repeats": args.repeats,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+            "results": results,
+        }
+        with open(args.save, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,46 @@
 from .async_client import AsyncReplicatedClient
+from .background import BackgroundConfig
+from .batching import BatchConfig
+from .circuit import CircuitBreaker
 from .client import ReplicatedClient
-from .enums import InstanceStatus
+from .compression import CompressionConfig
+from .enums import CircuitState, InstanceStatus, OverflowPolicy
 from .exceptions import (
     ReplicatedAPIError,
     ReplicatedAuthError,
+    ReplicatedCircuitOpenError,
+    ReplicatedDeadlineExceededError,
     ReplicatedError,
     ReplicatedNetworkError,
+    ReplicatedQueueFullError,
     ReplicatedRateLimitError,
+    ReplicatedTimeoutError,
 )
+from .outbox import OutboxConfig
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
 
 __version__ = "1.0.0"
 __all__ = [
     "ReplicatedClient",
     "AsyncReplicatedClient",
     "InstanceStatus",
+    "OverflowPolicy",
+    "CircuitState",
+    "BatchConfig",
+    "BackgroundConfig",
+    "RetryPolicy",
+    "OutboxConfig",
+    "RateLimiter",
+    "CircuitBreaker",
+    "CompressionConfig",
     "ReplicatedError",
     "ReplicatedAPIError",
     "ReplicatedAuthError",
     "ReplicatedRateLimitError",
     "ReplicatedNetworkError",
+    "ReplicatedCircuitOpenError",
+    "ReplicatedTimeoutError",
+    "ReplicatedDeadlineExceededError",
+    "ReplicatedQueueFullError",
 ]
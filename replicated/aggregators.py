@@ -0,0 +1,400 @@
+import math
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional, pip install replicated[numpy]
+    np = None  # type: ignore[assignment]
+
+# Quantiles reported for every histogram, as (metric suffix, quantile).
+QUANTILES: Tuple[Tuple[str, float], ...] = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+
+# Values closer to zero than this are counted in the sketch's zero bucket.
+_MIN_INDEXABLE = 1e-9
+
+
+class QuantileSketch:
+    """A mergeable quantile sketch with bounded memory and relative error.
+
+    Values fall into logarithmic buckets, so every quantile is within
+    ``relative_accuracy`` of a true sample value (DDSketch). Adding a value
+    is one ``log`` and one dict update. Once either sign holds more than
+    ``max_buckets`` buckets, the ones nearest zero are merged, trading
+    accuracy for small values against memory. Count, sum, min and max are
+    exact. NaN and infinite values have no bucket and are ignored.
+    """
+
+    def __init__(
+        self, relative_accuracy: float = 0.01, max_buckets: int = 2048
+    ) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._positive: Dict[int, int] = {}
+        self._negative: Dict[int, int] = {}
+        self._zero = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        if not math.isfinite(value):
+            return
+        if value > _MIN_INDEXABLE:
+            store = self._positive
+            key = math.ceil(math.log(value) / self._log_gamma)
+        elif value < -_MIN_INDEXABLE:
+            store = self._negative
+            key = math.ceil(math.log(-value) / self._log_gamma)
+        else:
+            self._zero += 1
+            self._add_summary(1, value, value, value)
+            return
+        store[key] = store.get(key, 0) + 1
+        if len(store) > self.max_buckets:
+            self._collapse(store)
+        self._add_summary(1, value, value, value)
+
+    def add_buckets(
+        self,
+        positive: Dict[int, int],
+        negative: Dict[int, int],
+        zero: int,
+        count: int,
+        total: float,
+        low: float,
+        high: float,
+    ) -> None:
+        """Fold in bucket counts and a summary computed elsewhere."""
+        for store, counts in ((self._positive, positive), (self._negative, negative)):
+            for key, n in counts.items():
+                store[key] = store.get(key, 0) + n
+            if len(store) > self.max_buckets:
+                self._collapse(store)
+        self._zero += zero
+        self._add_summary(count, total, low, high)
+
+    def add_samples(self, samples: Iterable[float]) -> None:
+        """Add many values at once.
+
+        ``samples`` may be any iterable or buffer-protocol object (a NumPy
+        array, ``array.array``, ``memoryview``...). With NumPy installed,
+        buffers of float64 are read in place and bucketed in vectorized
+        operations; otherwise the values are bucketed in one pass without
+        the per-value bookkeeping of ``add``.
+        """
+        if np is not None:
+            self._add_array(_as_array(samples))
+        else:
+            self._add_iterable(samples)
+
+    def _add_array(self, values: Any) -> None:
+        finite = np.isfinite(values)
+        if not finite.all():
+            values = values[finite]
+        if values.size == 0:
+            return
+        positive = values[values > _MIN_INDEXABLE]
+        negative = values[values < -_MIN_INDEXABLE]
+        self.add_buckets(
+            self._bucket_counts(positive),
+            self._bucket_counts(-negative),
+            int(values.size - positive.size - negative.size),
+            int(values.size),
+            float(values.sum()),
+            float(values.min()),
+            float(values.max()),
+        )
+
+    def _bucket_counts(self, magnitudes: Any) -> Dict[int, int]:
+        if magnitudes.size == 0:
+            return {}
+        keys, counts = np.unique(
+            np.ceil(np.log(magnitudes) / self._log_gamma), return_counts=True
+        )
+        return dict(zip(keys.astype(np.int64).tolist(), counts.tolist()))
+
+    def _add_iterable(self, samples: Iterable[float]) -> None:
+        log, ceil, isfinite, log_gamma = (
+            math.log,
+            math.ceil,
+            math.isfinite,
+            self._log_gamma,
+        )
+        positive: Dict[int, int] = {}
+        negative: Dict[int, int] = {}
+        zero = count = 0
+        total = 0.0
+        low, high = math.inf, -math.inf
+        for value in samples:
+            if not isfinite(value):
+                continue
+            if value > _MIN_INDEXABLE:
+                key = ceil(log(value) / log_gamma)
+                positive[key] = positive.get(key, 0) + 1
+            elif value < -_MIN_INDEXABLE:
+                key = ceil(log(-value) / log_gamma)
+                negative[key] = negative.get(key, 0) + 1
+            else:
+                zero += 1
+            count += 1
+            total += value
+            if value < low:
+                low = value
+            if value > high:
+                high = value
+        if count:
+            self.add_buckets(positive, negative, zero, count, total, low, high)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.gamma != self.gamma:
+            raise ValueError("cannot merge sketches with different accuracy")
+        self.add_buckets(
+            other._positive,
+            other._negative,
+            other._zero,
+            other.count,
+            other.sum,
+            other.min,
+            other.max,
+        )
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the ``q`` quantile, or None if the sketch is empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > rank:
+                return self._clamp(-self._value(key))
+        seen += self._zero
+        if seen > rank:
+            return self._clamp(0.0)
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > rank:
+                return self._clamp(self._value(key))
+        return self.max
+
+    def _add_summary(self, count: int, total: float, low: float, high: float) -> None:
+        self.count += count
+        self.sum += total
+        if low < self.min:
+            self.min = low
+        if high > self.max:
+            self.max = high
+
+    def _value(self, key: int) -> float:
+        """The representative value of a bucket, within the accuracy bound."""
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def _clamp(self, value: float) -> float:
+        return min(max(value, self.min), self.max)
+
+    def _collapse(self, store: Dict[int, int]) -> None:
+        """Merge the buckets nearest zero until ``max_buckets`` remain."""
+        keys = sorted(store)
+        excess = len(keys) - self.max_buckets
+        target = keys[excess]
+        for key in keys[:excess]:
+            store[target] += store.pop(key)
+
+
+def _as_array(samples: Iterable[float]) -> Any:
+    """View ``samples`` as a flat float64 array, copying only when needed."""
+    try:
+        memoryview(samples)  # type: ignore[arg-type]
+    except TypeError:
+        if not isinstance(samples, (list, tuple)):
+            return np.fromiter(samples, dtype=np.float64)
+    return np.asarray(samples, dtype=np.float64).reshape(-1)
+
+
+class Counter:
+    """A monotonic counter reported as its running total."""
+
+    kind = "counter"
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._total = 0.0
+        self._changed = False
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("counters can only increase")
+        with self._lock:
+            self._total += amount
+            self._changed = True
+
+    @property
+    def value(self) -> float:
+        return self._total
+
+    def collect(self) -> Dict[str, float]:
+        """The total, if it changed since the last collection."""
+        with self._lock:
+            changed, self._changed = self._changed, False
+            return {self.name: self._total} if changed else {}
+
+
+class Gauge:
+    """A value reported as the last one set."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._value: Optional[float] = None
+        self._changed = False
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+            self._changed = True
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._value
+
+    def collect(self) -> Dict[str, float]:
+        """The last value, if one was set since the last collection."""
+        with self._lock:
+            changed, self._changed = self._changed, False
+            if not changed or self._value is None:
+                return {}
+            return {self.name: self._value}
+
+
+class Histogram:
+    """Summarizes the samples observed in each reporting interval.
+
+    Every collection reports ``<name>_count``, ``_sum``, ``_min``,
+    ``_max``, ``_p50``, ``_p95`` and ``_p99`` for the samples observed
+    since the previous one, then starts a new interval.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, relative_accuracy: float = 0.01, max_buckets: int = 2048
+    ) -> None:
+        self.name = name
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._sketch = self._new_sketch()
+
+    def _new_sketch(self) -> QuantileSketch:
+        return QuantileSketch(self.relative_accuracy, self.max_buckets)
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._sketch.add(value)
+
+    def observe_many(self, samples: Iterable[float]) -> None:
+        """Observe every value in ``samples``, see ``QuantileSketch.add_samples``."""
+        sketch = self._new_sketch()
+        sketch.add_samples(samples)  # Outside the lock; merging is cheap
+        self.merge(sketch)
+
+    def merge(self, sketch: QuantileSketch) -> None:
+        """Fold a sketch of samples gathered elsewhere into this interval."""
+        with self._lock:
+            self._sketch.merge(sketch)
+
+    def collect(self) -> Dict[str, float]:
+        """Summarize and reset the current interval; empty if it had no samples."""
+        with self._lock:
+            sketch, self._sketch = self._sketch, self._new_sketch()
+        if sketch.count == 0:
+            return {}
+        name = self.name
+        summary = {
+            f"{name}_count": float(sketch.count),
+            f"{name}_sum": sketch.sum,
+            f"{name}_min": sketch.min,
+            f"{name}_max": sketch.max,
+        }
+        for suffix, q in QUANTILES:
+            value = sketch.quantile(q)
+            if value is not None:
+                summary[f"{name}_{suffix}"] = value
+        return summary
+
+
+Aggregator = Union[Counter, Gauge, Histogram]
+
+
+class Aggregators:
+    """The aggregators of one instance, keyed by metric name."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._by_name: Dict[str, Aggregator] = {}
+
+    def get(
+        self, name: str, factory: Callable[[], Aggregator], kind: str
+    ) -> Aggregator:
+        """Return the aggregator called ``name``, creating it if needed."""
+        aggregator = self._by_name.get(name)
+        if aggregator is None:
+            with self._lock:
+                aggregator = self._by_name.get(name)
+                if aggregator is None:
+                    aggregator = self._by_name[name] = factory()
+        if aggregator.kind != kind:
+            raise ValueError(f"{name!r} is already a {aggregator.kind}")
+        return aggregator
+
+    def collect(self) -> List[Tuple[str, float]]:
+        """Collect every aggregator's metrics for one interval."""
+        metrics: List[Tuple[str, float]] = []
+        for aggregator in list(self._by_name.values()):
+            metrics.extend(aggregator.collect().items())
+        return metrics
+
+
+class AggregateReporter:
+    """Background thread that calls ``report`` every ``interval`` seconds."""
+
+    def __init__(self, interval: float, report: Callable[[], None]) -> None:
+        self.interval = interval
+        self.report = report
+        self.last_error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start reporting unless the thread is already running."""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="replicated-aggregates", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.report()
+            except Exception as e:
+                self.last_error = e
@@ -1,8 +1,26 @@
-from typing import Any, Dict
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Mapping, Optional, Tuple, Union
 
-from .http_client import AsyncHTTPClient
+import httpx
+
+from .aggregators import Aggregators
+from .batching import AsyncMetricBatcher, BatchConfig
+from .circuit import CircuitBreaker
+from .compression import CompressionConfig
+from .deadline import clear_deadline
+from .fingerprint import get_machine_fingerprint
+from .http_client import AsyncHTTPClient, bearer_auth
+from .outbox import Outbox, OutboxConfig
+from .ratelimit import RateLimiter
+from .resources import AsyncInstance
+from .retry import RetryPolicy
 from .services import AsyncCustomerService
-from .state import StateManager
+from .singleflight import AsyncSingleFlight
+from .state import AsyncStateManager, StateManager, to_thread
+from .stats import Hook
+from .store import TenantStore
 
 
 class AsyncReplicatedClient:
@@ -13,32 +31,235 @@ class AsyncReplicatedClient:
         publishable_key: str,
         app_slug: str,
         base_url: str = "https://replicated.app",
-        timeout: float = 30.0,
+        timeout: Union[float, httpx.Timeout] = 30.0,
+        batching: Optional[BatchConfig] = None,
+        patch_debounce: Optional[float] = None,
+        retry: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        limits: Optional[httpx.Limits] = None,
+        http2: bool = False,
+        http_client: Optional[httpx.AsyncClient] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        fingerprint: Optional[str] = None,
+        multi_tenant: bool = False,
+        outbox: Optional[OutboxConfig] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        compression: Optional[CompressionConfig] = None,
+        aggregation_interval: float = 10.0,
     ) -> None:
         self.publishable_key = publishable_key
         self.app_slug = app_slug
         self.base_url = base_url
         self.timeout = timeout
+        self.patch_debounce = patch_debounce
+        self.fingerprint = fingerprint
 
         self.http_client = AsyncHTTPClient(
             base_url=base_url,
             timeout=timeout,
+            retry=retry,
+            rate_limiter=rate_limiter,
+            circuit_breaker=circuit_breaker,
+            compression=compression,
+            limits=limits,
+            http2=http2,
+            client=http_client,
+            transport=transport,
         )
         self.state_manager = StateManager(app_slug)
+        self.state = AsyncStateManager(self.state_manager)
+        self.tenant_store: Optional[TenantStore] = (
+            TenantStore(self.state_manager.state_dir / "tenants.db")
+            if multi_tenant
+            else None
+        )
+        self._single_flight = AsyncSingleFlight()
+        self._debounced_instances: "weakref.WeakSet[AsyncInstance]" = weakref.WeakSet()
         self.customer = AsyncCustomerService(self)
+        self.batching = batching
+        self._metric_batcher: Optional[AsyncMetricBatcher] = (
+            AsyncMetricBatcher(batching) if batching is not None else None
+        )
+        self.aggregation_interval = aggregation_interval
+        # customer ID -> (instance that reports, its aggregators)
+        self._aggregates: Dict[str, Tuple[AsyncInstance, Aggregators]] = {}
+        self._aggregate_task: Optional["asyncio.Task[None]"] = None
+        self.last_aggregate_error: Optional[BaseException] = None
+        self._outbox: Optional[Outbox] = None
+        self._outbox_task: Optional["asyncio.Task[None]"] = None
+        if outbox is not None:
+            self._outbox = Outbox(self.state_manager.state_dir / "outbox", outbox)
+            # Keep operations in order behind those left from a past run.
+            self._outbox.offline = self._outbox.has_pending()
 
     async def __aenter__(self) -> "AsyncReplicatedClient":
         await self.http_client.__aenter__()
+        if self._outbox is not None and self._outbox.offline:
+            self._start_outbox_replay()
+        if self._aggregates:
+            self._start_aggregate_reports()
         return self
 
     async def __aexit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
+        if self._aggregate_task is not None:
+            self._aggregate_task.cancel()
+            self._aggregate_task = None
+        await self._report_aggregates()
+        # A failed final update must not keep the rest from shutting down.
+        await self._flush_patches(record_errors=True)
+        if self._metric_batcher is not None:
+            await self._metric_batcher.close()
+        if self._outbox_task is not None:
+            self._outbox_task.cancel()
+            self._outbox_task = None
         await self.http_client.__aexit__(exc_type, exc_val, exc_tb)
 
-    def _get_auth_headers(self) -> Dict[str, str]:
-        """Get authentication headers for API requests."""
+    def _get_metric_batcher(self) -> AsyncMetricBatcher:
+        """Return the metric pipeline, creating a default one on first use."""
+        if self._metric_batcher is None:
+            self._metric_batcher = AsyncMetricBatcher(BatchConfig())
+        return self._metric_batcher
+
+    async def drain(self) -> None:
+        """Wait until queued metrics and debounced updates have been sent."""
+        await self._report_aggregates()
+        await self._flush_patches()
+        if self._metric_batcher is not None:
+            await self._metric_batcher.drain()
+
+    def _aggregators_for(self, instance: AsyncInstance) -> Aggregators:
+        """Return the aggregators of the instance's customer, reporting them.
+
+        Keyed by customer so that every ``AsyncInstance`` object for the
+        same customer shares them.
+        """
+        entry = self._aggregates.get(instance.customer_id)
+        if entry is None:
+            entry = self._aggregates[instance.customer_id] = (instance, Aggregators())
+            self._start_aggregate_reports()
+        return entry[1]
+
+    def _start_aggregate_reports(self) -> None:
+        if self._aggregate_task is not None and not self._aggregate_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Started by __aenter__ instead
+        self._aggregate_task = loop.create_task(self._run_aggregate_reports())
+
+    async def _run_aggregate_reports(self) -> None:
+        clear_deadline()
+        while True:
+            await asyncio.sleep(self.aggregation_interval)
+            await self._report_aggregates()
+
+    async def _report_aggregates(self) -> None:
+        """Send one interval's worth of every aggregator's metrics."""
+        for instance, aggregators in list(self._aggregates.values()):
+            try:
+                for name, value in aggregators.collect():
+                    await instance.send_metric(name, value)
+            except Exception as e:
+                self.last_aggregate_error = e
+
+    async def _flush_patches(self, record_errors: bool = False) -> None:
+        """Send pending debounced updates; see ``ReplicatedClient``."""
+        for instance in list(self._debounced_instances):
+            try:
+                await instance._flush_patch()
+            except Exception as e:
+                if not record_errors:
+                    raise
+                instance.last_patch_error = e
+
+    def add_hook(self, event: str, hook: Hook) -> None:
+        """Call ``hook`` with a ``RequestInfo`` on each request ``event``.
+
+        Events are ``on_request_start``, ``on_request_end``, ``on_error``
+        and ``on_retry``; hooks run synchronously on the request path.
+        """
+        self.http_client.hooks.add(event, hook)
+
+    def remove_hook(self, event: str, hook: Hook) -> None:
+        """Unregister a hook added with ``add_hook``."""
+        self.http_client.hooks.remove(event, hook)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return request counters and latency histograms per endpoint."""
+        return self.http_client.stats.snapshot()
+
+    def _start_outbox_replay(self) -> None:
+        if self._outbox_task is None or self._outbox_task.done():
+            self._outbox_task = asyncio.ensure_future(self._run_outbox_replay())
+
+    async def _run_outbox_replay(self) -> None:
+        """Drain the outbox once the API is reachable again."""
+        clear_deadline()
+        assert self._outbox is not None
+        outbox = self._outbox
+        while True:
+            await asyncio.sleep(outbox.config.replay_interval)
+            try:
+                while await outbox.replay_async(self._replay_record):
+                    if not await to_thread(outbox.has_pending):
+                        break
+            except Exception:
+                pass  # Disk errors: try again next interval
+            if not await to_thread(outbox.has_pending):
+                outbox.offline = False
+                return
+
+    async def _replay_record(self, record: Dict[str, Any]) -> None:
+        """Send one operation taken from the outbox."""
+        instance = AsyncInstance(self, record["customer_id"], record.get("instance_id"))
+        await instance._replay(record)
+
+    async def _get_fingerprint(self) -> str:
+        """Get the machine fingerprint, computing and persisting it once.
+
+        The lookup may read files or run a subprocess, so it runs in the
+        default executor instead of on the event loop.
+        """
+        if self.fingerprint:
+            return get_machine_fingerprint(self.fingerprint)
+        fingerprint = await self.state.get_fingerprint()
+        if not fingerprint:
+            fingerprint = await to_thread(get_machine_fingerprint)
+            await self.state.update(fingerprint=fingerprint)
+        return fingerprint
+
+    @asynccontextmanager
+    async def _creation_lock(self, kind: str, key: str) -> AsyncIterator[None]:
+        """Cross-process lock held while creating a customer or instance.
+
+        See ``ReplicatedClient._creation_lock``. The lock is waited for in
+        a worker thread, and cached state is re-read once it is held.
+        """
+        lock_key = f"{kind}:{key}" if self.tenant_store is not None else "state"
+        async with self.state.key_lock(lock_key):
+            # Another process may have created it while we waited.
+            self.state.expire()
+            yield
+
+    async def _get_auth_headers(
+        self, customer_id: Optional[str] = None
+    ) -> Mapping[str, str]:
+        """Get authentication headers for API requests.
+
+        The returned mapping is shared and immutable; a new one is used
+        only when the token changes.
+        """
         # Try to use dynamic token first, fall back to publishable key
-        dynamic_token = self.state_manager.get_dynamic_token()
-        if dynamic_token:
-            return {"Authorization": f"Bearer {dynamic_token}"}
+        if self.tenant_store is not None:
+            dynamic_token = None
+            if customer_id:
+                # Most lookups hit the LRU tier; only a miss leaves the loop.
+                store = self.tenant_store
+                record = store.cached_customer_by_id(customer_id)
+                if record is None:
+                    record = await to_thread(store.get_customer_by_id, customer_id)
+                dynamic_token = record.dynamic_token if record else None
         else:
-            return {"Authorization": f"Bearer {self.publishable_key}"}
+            dynamic_token = await self.state.get_dynamic_token()
+        return bearer_auth(dynamic_token or self.publishable_key)
@@ -0,0 +1,186 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .deadline import cap_timeout
+from .enums import OverflowPolicy
+from .exceptions import ReplicatedDeadlineExceededError, ReplicatedQueueFullError
+from .log import get_logger
+
+logger = get_logger("background")
+
+# Called with the operation name (e.g. "send_metric") and the error that
+# failed or dropped it.
+ErrorCallback = Callable[[str, BaseException], None]
+
+
+class BackgroundConfig:
+    """Settings for sending from a worker pool instead of the caller's thread."""
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        max_queue_size: int = 1000,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_NEWEST,
+        block_timeout: Optional[float] = None,
+        on_error: Optional[ErrorCallback] = None,
+    ) -> None:
+        if max_workers < 1 or max_queue_size < 0:
+            raise ValueError("max_workers must be positive and max_queue_size >= 0")
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.on_error = on_error
+
+
+class BackgroundSender:
+    """Runs client operations on a bounded ``ThreadPoolExecutor``.
+
+    ``submit`` returns a ``Future`` at once. At most ``max_workers`` plus
+    ``max_queue_size`` operations are pending; beyond that the overflow
+    policy drops the new operation, cancels the oldest one still queued,
+    or blocks the caller. Failures are reported to ``on_error`` and left
+    on the future, never raised to the caller.
+    """
+
+    def __init__(self, config: BackgroundConfig) -> None:
+        self.config = config
+        self.dropped = 0
+        self.failed = 0
+        self.last_error: Optional[BaseException] = None
+        self._capacity = config.max_workers + config.max_queue_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._cond = threading.Condition()
+        # Accepted operations not yet finished, oldest first, with their names.
+        self._pending: Dict["Future[None]", str] = {}
+        self._local = threading.local()
+
+    def in_worker(self) -> bool:
+        """Whether the current thread is running a background operation."""
+        return getattr(self._local, "active", False)
+
+    def submit(
+        self,
+        operation: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        timeout: Optional[float] = None,
+    ) -> "Future[None]":
+        """Queue ``fn(*args, timeout=...)``; ``timeout`` includes time queued.
+
+        Under ``BLOCK``, waiting for room also counts against ``timeout``.
+        """
+        submitted = time.monotonic()
+        evicted: List[str] = []
+        with self._cond:
+            full = len(self._pending) >= self._capacity
+            if full and not self._make_room(evicted, timeout):
+                self.dropped += 1
+                dropped = True
+            else:
+                dropped = False
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        self.config.max_workers,
+                        thread_name_prefix="replicated-background",
+                    )
+                future = self._executor.submit(
+                    self._run, operation, fn, args, timeout, submitted
+                )
+                self._pending[future] = operation
+                future.add_done_callback(self._finished)
+        for name in evicted:
+            self._report(name, _queue_full(name))
+        if dropped:
+            error = _queue_full(operation)
+            future = Future()
+            future.set_exception(error)
+            self._report(operation, error)
+        return future
+
+    def wait_all(self, timeout: Optional[float] = None) -> bool:
+        """Wait for every pending operation; returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout=timeout)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """Wait for pending operations and stop the worker threads."""
+        finished = self.wait_all(timeout)
+        with self._cond:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=finished)
+        return finished
+
+    def _make_room(self, evicted: List[str], timeout: Optional[float]) -> bool:
+        """Apply the overflow policy to a full queue; caller holds the lock.
+
+        The names of operations cancelled to make room are added to
+        ``evicted``, to be reported once the lock is released. ``BLOCK``
+        waits no longer than ``block_timeout`` or the call's ``timeout``.
+        """
+        policy = self.config.overflow_policy
+        if policy == OverflowPolicy.DROP_OLDEST:
+            # Only operations no worker has started can be cancelled.
+            for future, operation in list(self._pending.items()):
+                if future.cancel():
+                    self.dropped += 1
+                    evicted.append(operation)
+                    return True
+            return False
+        if policy == OverflowPolicy.BLOCK:
+            wait = self.config.block_timeout
+            if timeout is not None:
+                wait = timeout if wait is None else min(wait, timeout)
+            return self._cond.wait_for(
+                lambda: len(self._pending) < self._capacity,
+                timeout=cap_timeout(wait),
+            )
+        return False
+
+    def _run(
+        self,
+        operation: str,
+        fn: Callable[..., Any],
+        args: Any,
+        timeout: Optional[float],
+        submitted: float,
+    ) -> None:
+        self._local.active = True
+        try:
+            if timeout is not None:
+                timeout -= time.monotonic() - submitted
+                if timeout <= 0:
+                    raise ReplicatedDeadlineExceededError(
+                        "Deadline exceeded while queued"
+                    )
+            fn(*args, timeout=timeout)
+        except BaseException as e:
+            with self._cond:
+                self.failed += 1
+                self.last_error = e
+            self._report(operation, e)
+            raise
+        finally:
+            self._local.active = False
+
+    def _finished(self, future: "Future[None]") -> None:
+        with self._cond:
+            self._pending.pop(future, None)
+            self._cond.notify_all()
+
+    def _report(self, operation: str, error: BaseException) -> None:
+        on_error = self.config.on_error
+        if on_error is None:
+            logger.debug("Background %s failed: %s", operation, error)
+            return
+        try:
+            on_error(operation, error)
+        except Exception:
+            logger.exception("Background error callback failed")
+
+
+def _queue_full(operation: str) -> ReplicatedQueueFullError:
+    return ReplicatedQueueFullError(f"Background queue full; {operation} dropped")
@@ -0,0 +1,324 @@
+import asyncio
+import atexit
+import functools
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Tuple, Union
+
+from .deadline import cap_timeout, clear_deadline
+from .enums import OverflowPolicy
+
+if TYPE_CHECKING:
+    from .resources import AsyncInstance, Instance
+
+MetricValue = Union[int, float, str]
+_AsyncItem = Tuple["AsyncInstance", str, MetricValue]
+
+
+class BatchConfig:
+    """Settings for buffered metric sending."""
+
+    def __init__(
+        self,
+        max_batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        block_timeout: Optional[float] = None,
+        flush_timeout: Optional[float] = 5.0,
+    ) -> None:
+        if max_batch_size < 1 or max_queue_size < 1:
+            raise ValueError("max_batch_size and max_queue_size must be positive")
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.flush_timeout = flush_timeout
+
+
+def coalesce_metrics(
+    batch: List[Tuple[Any, str, MetricValue]],
+) -> List[Tuple[Any, str, MetricValue]]:
+    """Keep only the latest value per (target, metric name) in a batch."""
+    latest: Dict[Tuple[int, str], Tuple[Any, str, MetricValue]] = {}
+    for target, name, value in batch:
+        key = (id(target), name)
+        latest.pop(key, None)
+        latest[key] = (target, name, value)
+    return list(latest.values())
+
+
+class MetricBatcher:
+    """Buffers metrics and sends them from a background flush thread.
+
+    ``submit`` only appends to a bounded deque. A daemon thread wakes up
+    when ``max_batch_size`` metrics are queued or ``flush_interval``
+    seconds have passed, coalesces the batch and sends it.
+    """
+
+    def __init__(self, config: BatchConfig) -> None:
+        self.config = config
+        self.dropped = 0
+        self.failed = 0
+        self.last_error: Optional[BaseException] = None
+        self._queue: Deque[Tuple["Instance", str, MetricValue]] = deque()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._flush_requested = False
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        # Registered with atexit while the flush thread runs.
+        self._close_at_exit = functools.partial(self.close, config.flush_timeout)
+
+    def submit(self, instance: "Instance", name: str, value: MetricValue) -> bool:
+        """Queue a metric; returns False if it was dropped."""
+        with self._cond:
+            if len(self._queue) >= self.config.max_queue_size:
+                if not self._make_room():
+                    self.dropped += 1
+                    return False
+            self._queue.append((instance, name, value))
+            self._ensure_thread()
+            size = len(self._queue)
+            if size == 1 or size >= self.config.max_batch_size:
+                self._cond.notify_all()
+            return True
+
+    def _make_room(self) -> bool:
+        """Apply the overflow policy to a full queue; caller holds the lock."""
+        policy = self.config.overflow_policy
+        if policy == OverflowPolicy.DROP_OLDEST:
+            self._queue.popleft()
+            self.dropped += 1
+            return True
+        if policy == OverflowPolicy.BLOCK:
+            self._ensure_thread()
+            self._cond.notify_all()
+            return self._cond.wait_for(
+                lambda: len(self._queue) < self.config.max_queue_size,
+                timeout=cap_timeout(self.config.block_timeout),
+            )
+        return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Send everything queued so far; returns False on timeout."""
+        with self._cond:
+            if not self._queue and not self._in_flight:
+                return True
+            self._ensure_thread()
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(
+                lambda: not self._queue and not self._in_flight, timeout=timeout
+            )
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Drain the queue and stop the flush thread.
+
+        Metrics still queued when ``timeout`` expires are dropped.
+        """
+        started = time.monotonic()
+        finished = self.flush(timeout)
+        with self._cond:
+            if not finished:
+                self.dropped += len(self._queue)
+                self._queue.clear()
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            if timeout is not None:
+                timeout = max(0.0, timeout - (time.monotonic() - started))
+            thread.join(timeout)
+        with self._cond:
+            self._thread = None
+            self._stopping = False
+        atexit.unregister(self._close_at_exit)
+
+    def _ensure_thread(self) -> None:
+        """Start the flush thread on first use; caller holds the lock."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="replicated-metric-flush", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self._close_at_exit)
+
+    def _next_batch(self) -> Optional[List[Tuple["Instance", str, MetricValue]]]:
+        """Wait for a size or interval trigger and take one batch."""
+        config = self.config
+        with self._cond:
+            # Park while idle; the interval starts with the first queued metric.
+            while not self._queue and not self._stopping:
+                self._cond.wait()
+            deadline = time.monotonic() + config.flush_interval
+            while not self._stopping and not self._flush_requested:
+                if len(self._queue) >= config.max_batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if not self._queue:
+                self._flush_requested = False
+                return None
+            count = min(len(self._queue), config.max_batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+            if not self._queue:
+                self._flush_requested = False
+            self._in_flight += len(batch)
+            # Wake producers blocked on a full queue.
+            self._cond.notify_all()
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                for instance, name, value in coalesce_metrics(batch):
+                    try:
+                        instance._post_metric(name, value)
+                    except Exception as e:
+                        self.failed += 1
+                        self.last_error = e
+                    else:
+                        instance._mark_reported(name, value)
+            finally:
+                with self._cond:
+                    self._in_flight -= len(batch)
+                    self._cond.notify_all()
+
+
+class AsyncMetricBatcher:
+    """Buffers metrics in an ``asyncio.Queue`` drained by one consumer task.
+
+    The consumer takes the first queued metric, waits up to
+    ``flush_interval`` for ``max_batch_size`` metrics to arrive, then
+    coalesces and sends whatever is queued. With ``OverflowPolicy.BLOCK``
+    awaiting ``submit`` suspends while the queue is full, which applies
+    backpressure to producers instead of growing memory.
+    """
+
+    def __init__(self, config: BatchConfig) -> None:
+        self.config = config
+        self.dropped = 0
+        self.failed = 0
+        self.last_error: Optional[BaseException] = None
+        # Created lazily so they bind to the loop the client is used on.
+        self._queue: "Optional[asyncio.Queue[_AsyncItem]]" = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._draining = 0
+
+    def _ensure_started(self) -> "asyncio.Queue[_AsyncItem]":
+        """Create the queue and (re)start the consumer task if needed."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.config.max_queue_size)
+            self._wake = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._queue
+
+    def submit_nowait(
+        self, instance: "AsyncInstance", name: str, value: MetricValue
+    ) -> bool:
+        """Queue a metric without suspending; returns False if dropped.
+
+        A full queue drops the oldest metric under ``DROP_OLDEST`` and the
+        new one otherwise, since waiting for room is not an option here.
+        """
+        queue = self._ensure_started()
+        item = (instance, name, value)
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.config.overflow_policy != OverflowPolicy.DROP_OLDEST:
+                return False
+            queue.get_nowait()
+            queue.task_done()
+            queue.put_nowait(item)
+        self._notify_if_full(queue)
+        return True
+
+    async def submit(
+        self, instance: "AsyncInstance", name: str, value: MetricValue
+    ) -> bool:
+        """Queue a metric, waiting for room under ``OverflowPolicy.BLOCK``."""
+        if self.config.overflow_policy != OverflowPolicy.BLOCK:
+            return self.submit_nowait(instance, name, value)
+
+        queue = self._ensure_started()
+        try:
+            await asyncio.wait_for(
+                queue.put((instance, name, value)),
+                cap_timeout(self.config.block_timeout),
+            )
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            return False
+        self._notify_if_full(queue)
+        return True
+
+    def _notify_if_full(self, queue: "asyncio.Queue[_AsyncItem]") -> None:
+        if self._wake is not None and queue.qsize() >= self.config.max_batch_size:
+            self._wake.set()
+
+    async def drain(self) -> None:
+        """Wait until every queued metric has been sent."""
+        if self._queue is None:
+            return
+        queue = self._ensure_started()
+        self._draining += 1
+        try:
+            assert self._wake is not None
+            self._wake.set()
+            await queue.join()
+        finally:
+            self._draining -= 1
+
+    async def close(self) -> None:
+        """Drain the queue and stop the consumer task."""
+        await self.drain()
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        clear_deadline()
+        assert self._queue is not None and self._wake is not None
+        queue, wake = self._queue, self._wake
+        config = self.config
+        while True:
+            batch = [await queue.get()]
+            if queue.qsize() + 1 < config.max_batch_size and not self._draining:
+                try:
+                    await asyncio.wait_for(wake.wait(), config.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            wake.clear()
+            while len(batch) < config.max_batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                for instance, name, value in coalesce_metrics(batch):
+                    try:
+                        await instance._post_metric(name, value)
+                    except Exception as e:
+                        self.failed += 1
+                        self.last_error = e
+                    else:
+                        instance._mark_reported(name, value)
+            finally:
+                for _ in batch:
+                    queue.task_done()
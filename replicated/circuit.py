@@ -0,0 +1,180 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .enums import CircuitState
+from .exceptions import (
+    ReplicatedCircuitOpenError,
+    ReplicatedDeadlineExceededError,
+    ReplicatedError,
+    ReplicatedNetworkError,
+)
+from .log import get_logger
+
+logger = get_logger("circuit")
+
+# Called with (method, url, json_data) instead of a request the open
+# circuit rejected; its return value stands in for the response body.
+Fallback = Callable[[str, str, Optional[Dict[str, Any]]], Dict[str, Any]]
+
+# Called with (old state, new state) after every transition.
+StateChangeCallback = Callable[[CircuitState, CircuitState], None]
+
+
+def is_failure(error: ReplicatedError) -> bool:
+    """Whether ``error`` says the API is unhealthy, not that the request was bad."""
+    if isinstance(error, ReplicatedDeadlineExceededError):
+        return False  # The caller stopped waiting
+    if isinstance(error, ReplicatedNetworkError):
+        return True
+    return error.http_status is not None and error.http_status >= 500
+
+
+class CircuitBreaker:
+    """Fails requests fast while the API keeps failing.
+
+    Outcomes of the last ``window_size`` requests are kept in a ring;
+    once at least ``minimum_requests`` are recorded and the fraction of
+    failures (network errors and 5xx) reaches ``failure_threshold``, the
+    circuit opens. Requests then raise ``ReplicatedCircuitOpenError``
+    without touching the network until ``cooldown`` seconds have passed.
+    The circuit is then half-open: up to ``half_open_probes`` requests go
+    through, and it closes once that many succeed or reopens on the first
+    failure. Like ``RateLimiter``, one breaker can be shared by clients.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        minimum_requests: int = 10,
+        window_size: int = 50,
+        cooldown: float = 30.0,
+        half_open_probes: int = 1,
+        fallback: Optional[Fallback] = None,
+        on_state_change: Optional[StateChangeCallback] = None,
+    ) -> None:
+        if not 0 < failure_threshold <= 1:
+            raise ValueError("failure_threshold must be in (0, 1]")
+        if minimum_requests < 1 or half_open_probes < 1:
+            raise ValueError("minimum_requests and half_open_probes must be positive")
+        self.failure_threshold = failure_threshold
+        self.minimum_requests = minimum_requests
+        self.window_size = max(window_size, minimum_requests)
+        self.cooldown = cooldown
+        self.half_open_probes = half_open_probes
+        self.fallback = fallback
+        self.on_state_change = on_state_change
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._outcomes: List[bool] = []  # Ring of outcomes, True for a failure
+        self._next = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            return self._state
+
+    def before_request(self) -> None:
+        """Raise ``ReplicatedCircuitOpenError`` if a request may not be sent."""
+        if self._state is CircuitState.CLOSED:
+            return
+        with self._lock:
+            old = self._state
+            if old is CircuitState.OPEN:
+                retry_in = self._opened_at + self.cooldown - time.monotonic()
+                if retry_in > 0:
+                    raise ReplicatedCircuitOpenError(
+                        "Circuit breaker is open", retry_in=retry_in
+                    )
+                self._set_state(CircuitState.HALF_OPEN)
+            if self._state is CircuitState.HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    raise ReplicatedCircuitOpenError(
+                        "Circuit breaker is half-open and probing"
+                    )
+                self._probes += 1
+            new = self._state
+        self._notify(old, new)
+
+    def record(self, error: Optional[ReplicatedError] = None) -> None:
+        """Record the outcome of a request allowed by ``before_request``."""
+        if isinstance(error, ReplicatedCircuitOpenError):
+            return
+        if isinstance(error, ReplicatedDeadlineExceededError):
+            # Cut short by the caller, so neither a success nor a failure.
+            self.release()
+            return
+        failed = error is not None and is_failure(error)
+        with self._lock:
+            old = self._state
+            if old is CircuitState.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if failed:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_probes:
+                        self._set_state(CircuitState.CLOSED)
+            elif old is CircuitState.CLOSED:
+                self._add_outcome(failed)
+                if self._tripped():
+                    self._open()
+            new = self._state
+        self._notify(old, new)
+
+    def release(self) -> None:
+        """Give back a permission from ``before_request`` that went unused."""
+        with self._lock:
+            if self._state is CircuitState.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def reset(self) -> None:
+        """Close the circuit and forget recorded outcomes."""
+        with self._lock:
+            old = self._state
+            self._set_state(CircuitState.CLOSED)
+        self._notify(old, CircuitState.CLOSED)
+
+    def _add_outcome(self, failed: bool) -> None:
+        if len(self._outcomes) < self.window_size:
+            self._outcomes.append(failed)
+        else:
+            self._failures -= self._outcomes[self._next]
+            self._outcomes[self._next] = failed
+            self._next = (self._next + 1) % self.window_size
+        self._failures += failed
+
+    def _tripped(self) -> bool:
+        recorded = len(self._outcomes)
+        return (
+            recorded >= self.minimum_requests
+            and self._failures >= self.failure_threshold * recorded
+        )
+
+    def _open(self) -> None:
+        self._set_state(CircuitState.OPEN)
+        self._opened_at = time.monotonic()
+
+    def _set_state(self, state: CircuitState) -> None:
+        """Enter ``state``, clearing the counters it starts from; holds the lock."""
+        self._state = state
+        self._probes = 0
+        self._probe_successes = 0
+        if state is CircuitState.CLOSED:
+            self._outcomes = []
+            self._next = 0
+            self._failures = 0
+
+    def _notify(self, old: CircuitState, new: CircuitState) -> None:
+        if old is new:
+            return
+        logger.info("Circuit breaker %s -> %s", old.value, new.value)
+        if self.on_state_change is not None:
+            try:
+                self.on_state_change(old, new)
+            except Exception:
+                logger.exception("Circuit breaker state change callback failed")
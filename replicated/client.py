@@ -1,44 +1,261 @@
-from typing import Any, Dict
+import threading
+import time
+import weakref
+from typing import Any, ContextManager, Dict, Mapping, Optional, Tuple, Union
 
-from .http_client import SyncHTTPClient
+import httpx
+
+from .aggregators import AggregateReporter, Aggregators
+from .background import BackgroundConfig, BackgroundSender
+from .batching import BatchConfig, MetricBatcher
+from .circuit import CircuitBreaker
+from .compression import CompressionConfig
+from .fingerprint import get_machine_fingerprint
+from .http_client import SyncHTTPClient, bearer_auth
+from .outbox import Outbox, OutboxConfig, OutboxReplayer
+from .ratelimit import RateLimiter
+from .resources import Instance
+from .retry import RetryPolicy
 from .services import CustomerService
+from .singleflight import SingleFlight
 from .state import StateManager
+from .stats import Hook
+from .store import TenantStore
 
 
 class ReplicatedClient:
     """Synchronous client for the Replicated SDK."""
 
+    # Seconds between checks of the state file for a token changed by
+    # another process; changes made through this client apply at once.
+    auth_recheck_interval = 1.0
+
     def __init__(
         self,
         publishable_key: str,
         app_slug: str,
         base_url: str = "https://replicated.app",
-        timeout: float = 30.0,
+        timeout: Union[float, httpx.Timeout] = 30.0,
+        batching: Optional[BatchConfig] = None,
+        patch_debounce: Optional[float] = None,
+        retry: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        limits: Optional[httpx.Limits] = None,
+        http2: bool = False,
+        http_client: Optional[httpx.Client] = None,
+        transport: Optional[httpx.BaseTransport] = None,
+        fingerprint: Optional[str] = None,
+        multi_tenant: bool = False,
+        outbox: Optional[OutboxConfig] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        compression: Optional[CompressionConfig] = None,
+        background: Optional[BackgroundConfig] = None,
+        aggregation_interval: float = 10.0,
     ) -> None:
         self.publishable_key = publishable_key
         self.app_slug = app_slug
         self.base_url = base_url
         self.timeout = timeout
+        self.patch_debounce = patch_debounce
+        self.fingerprint = fingerprint
 
         self.http_client = SyncHTTPClient(
             base_url=base_url,
             timeout=timeout,
+            retry=retry,
+            rate_limiter=rate_limiter,
+            circuit_breaker=circuit_breaker,
+            compression=compression,
+            limits=limits,
+            http2=http2,
+            client=http_client,
+            transport=transport,
         )
         self.state_manager = StateManager(app_slug)
+        self.tenant_store: Optional[TenantStore] = (
+            TenantStore(self.state_manager.state_dir / "tenants.db")
+            if multi_tenant
+            else None
+        )
+        self._single_flight = SingleFlight()
+        # (state generation, time checked, headers) for the state token.
+        self._auth_cache: Optional[Tuple[int, float, Mapping[str, str]]] = None
+        self._debounced_instances: "weakref.WeakSet[Instance]" = weakref.WeakSet()
         self.customer = CustomerService(self)
+        self._metric_batcher: Optional[MetricBatcher] = (
+            MetricBatcher(batching) if batching is not None else None
+        )
+        self.aggregation_interval = aggregation_interval
+        # customer ID -> (instance that reports, its aggregators)
+        self._aggregates: Dict[str, Tuple[Instance, Aggregators]] = {}
+        self._aggregates_lock = threading.Lock()
+        self._aggregate_reporter = AggregateReporter(
+            aggregation_interval, self._report_aggregates
+        )
+        self._background: Optional[BackgroundSender] = (
+            BackgroundSender(background) if background is not None else None
+        )
+        self._outbox: Optional[Outbox] = None
+        self._outbox_replayer: Optional[OutboxReplayer] = None
+        if outbox is not None:
+            self._outbox = Outbox(self.state_manager.state_dir / "outbox", outbox)
+            self._outbox_replayer = OutboxReplayer(self._outbox, self._replay_record)
+            if self._outbox.has_pending():
+                # Keep operations in order behind those left from a past run.
+                self._outbox.offline = True
+                self._outbox_replayer.start()
 
     def __enter__(self) -> "ReplicatedClient":
         self.http_client.__enter__()
         return self
 
     def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
+        self._aggregate_reporter.stop()
+        self._report_aggregates()
+        if self._background is not None:
+            self._background.close()
+        # A failed final update must not keep the rest from shutting down.
+        self._flush_patches(record_errors=True)
+        if self._metric_batcher is not None:
+            self._metric_batcher.close()
+        if self._outbox_replayer is not None:
+            self._outbox_replayer.stop()
         self.http_client.__exit__(exc_type, exc_val, exc_tb)
 
-    def _get_auth_headers(self) -> Dict[str, str]:
-        """Get authentication headers for API requests."""
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Send buffered metrics and pending debounced instance updates.
+
+        Returns False if ``timeout`` expired before all metrics were sent.
+        """
+        started = time.monotonic()
+        self._report_aggregates()
+        if not self.wait_all(timeout):
+            return False
+        self._flush_patches()
+        if self._metric_batcher is None:
+            return True
+        if timeout is not None:
+            timeout = max(0.0, timeout - (time.monotonic() - started))
+        return self._metric_batcher.flush(timeout)
+
+    def _aggregators_for(self, instance: Instance) -> Aggregators:
+        """Return the aggregators of the instance's customer, reporting them.
+
+        Keyed by customer so that every ``Instance`` object for the same
+        customer shares them.
+        """
+        entry = self._aggregates.get(instance.customer_id)
+        if entry is None:
+            with self._aggregates_lock:
+                entry = self._aggregates.setdefault(
+                    instance.customer_id, (instance, Aggregators())
+                )
+            self._aggregate_reporter.start()
+        return entry[1]
+
+    def _report_aggregates(self) -> None:
+        """Send one interval's worth of every aggregator's metrics."""
+        for instance, aggregators in list(self._aggregates.values()):
+            try:
+                for name, value in aggregators.collect():
+                    instance.send_metric(name, value)
+            except Exception as e:
+                self._aggregate_reporter.last_error = e
+
+    def wait_all(self, timeout: Optional[float] = None) -> bool:
+        """Wait for operations handed to the ``background`` worker pool.
+
+        Returns False if ``timeout`` expired first.
+        """
+        if self._background is None:
+            return True
+        return self._background.wait_all(timeout)
+
+    def _flush_patches(self, record_errors: bool = False) -> None:
+        """Send pending debounced updates.
+
+        With ``record_errors`` a failure is kept on the instance's
+        ``last_patch_error`` instead of being raised.
+        """
+        for instance in list(self._debounced_instances):
+            try:
+                instance._flush_patch()
+            except Exception as e:
+                if not record_errors:
+                    raise
+                instance.last_patch_error = e
+
+    def add_hook(self, event: str, hook: Hook) -> None:
+        """Call ``hook`` with a ``RequestInfo`` on each request ``event``.
+
+        Events are ``on_request_start``, ``on_request_end``, ``on_error``
+        and ``on_retry``; hooks run synchronously on the request path.
+        """
+        self.http_client.hooks.add(event, hook)
+
+    def remove_hook(self, event: str, hook: Hook) -> None:
+        """Unregister a hook added with ``add_hook``."""
+        self.http_client.hooks.remove(event, hook)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return request counters and latency histograms per endpoint."""
+        return self.http_client.stats.snapshot()
+
+    def _start_outbox_replay(self) -> None:
+        if self._outbox_replayer is not None:
+            self._outbox_replayer.start()
+
+    def _replay_record(self, record: Dict[str, Any]) -> None:
+        """Send one operation taken from the outbox."""
+        instance = Instance(self, record["customer_id"], record.get("instance_id"))
+        instance._replay(record)
+
+    def _get_fingerprint(self) -> str:
+        """Get the machine fingerprint, computing and persisting it once."""
+        if self.fingerprint:
+            return get_machine_fingerprint(self.fingerprint)
+        fingerprint = self.state_manager.get_fingerprint()
+        if not fingerprint:
+            fingerprint = get_machine_fingerprint()
+            self.state_manager.set_fingerprint(fingerprint)
+        return fingerprint
+
+    def _creation_lock(self, kind: str, key: str) -> ContextManager[None]:
+        """Cross-process lock held while creating a customer or instance.
+
+        Multi-tenant state locks each customer separately, so tenants are
+        created in parallel; the single-tenant state file holds one
+        customer, so creations there take turns.
+        """
+        if self.tenant_store is not None:
+            return self.state_manager.key_lock(f"{kind}:{key}")
+        return self.state_manager.key_lock("state")
+
+    def _get_auth_headers(self, customer_id: Optional[str] = None) -> Mapping[str, str]:
+        """Get authentication headers for API requests.
+
+        The returned mapping is shared and immutable; a new one is used
+        only when the token changes.
+        """
+        if self.tenant_store is None:
+            return self._state_auth_headers()
         # Try to use dynamic token first, fall back to publishable key
+        dynamic_token = (
+            self.tenant_store.get_dynamic_token(customer_id) if customer_id else None
+        )
+        return bearer_auth(dynamic_token or self.publishable_key)
+
+    def _state_auth_headers(self) -> Mapping[str, str]:
+        """Auth headers for the token in state, rechecking the file rarely."""
+        now = time.monotonic()
+        cached = self._auth_cache
+        if (
+            cached is not None
+            and cached[0] == self.state_manager.generation
+            and now - cached[1] < self.auth_recheck_interval
+        ):
+            return cached[2]
         dynamic_token = self.state_manager.get_dynamic_token()
-        if dynamic_token:
-            return {"Authorization": f"Bearer {dynamic_token}"}
-        else:
-            return {"Authorization": f"Bearer {self.publishable_key}"}
+        headers = bearer_auth(dynamic_token or self.publishable_key)
+        self._auth_cache = (self.state_manager.generation, now, headers)
+        return headers
@@ -0,0 +1,78 @@
+import gzip
+import json
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple
+
+from .log import get_logger
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional, pip install replicated[zstd]
+    zstandard = None  # type: ignore[assignment]
+
+logger = get_logger("http")
+
+# Encodings the SDK can compress with, most preferred first.
+ENCODINGS: Tuple[str, ...] = ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+class CompressionConfig:
+    """Settings for compressing request bodies.
+
+    ``encoding`` is ``"gzip"`` or ``"zstd"``; zstd needs the
+    ``zstandard`` package and falls back to gzip without it. Bodies
+    smaller than ``min_size`` bytes are sent uncompressed.
+    """
+
+    def __init__(
+        self, encoding: str = "gzip", min_size: int = 1024, level: Optional[int] = None
+    ) -> None:
+        if encoding not in ("gzip", "zstd"):
+            raise ValueError(f"unsupported encoding {encoding!r}")
+        if encoding not in ENCODINGS:
+            logger.debug("zstandard is not installed; compressing with gzip")
+            encoding = "gzip"
+        self.encoding = encoding
+        self.min_size = min_size
+        self.level = level
+
+
+class EncodedBody(NamedTuple):
+    """A serialized request body, with the encoding applied to it if any."""
+
+    content: bytes
+    encoding: Optional[str]
+    size: int  # Length before compression
+
+    @property
+    def saved(self) -> int:
+        return self.size - len(self.content)
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return bytes(compressor.compress(data))
+    return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return bytes(zstandard.ZstdDecompressor().decompressobj().decompress(data))
+    return gzip.decompress(data)
+
+
+def encode_body(
+    json_data: Dict[str, Any], encoding: str, config: CompressionConfig
+) -> EncodedBody:
+    """Serialize ``json_data``, compressing it if it reaches ``min_size``."""
+    raw = json.dumps(json_data, separators=(",", ":")).encode()
+    if len(raw) < config.min_size:
+        return EncodedBody(raw, None, len(raw))
+    return EncodedBody(compress(raw, encoding, config.level), encoding, len(raw))
+
+
+def accepted_encodings(headers: Mapping[str, str]) -> Tuple[str, ...]:
+    """The encodings a 415 response's ``Accept-Encoding`` header allows."""
+    offered = headers.get("accept-encoding", "")
+    names = {part.split(";")[0].strip().lower() for part in offered.split(",")}
+    return tuple(encoding for encoding in ENCODINGS if encoding in names)
@@ -0,0 +1,65 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from .exceptions import ReplicatedDeadlineExceededError
+
+# time.monotonic() by which the current call must finish, if any. A context
+# variable, so it follows a call through helpers and into its tasks.
+_deadline: ContextVar[Optional[float]] = ContextVar("replicated_deadline", default=None)
+
+
+@contextmanager
+def within(timeout: Optional[float]) -> Iterator[None]:
+    """Bound every SDK operation run inside the block to ``timeout`` seconds.
+
+    Nested blocks can only shorten the enclosing deadline; ``None`` leaves
+    it unchanged.
+    """
+    if timeout is None:
+        yield
+        return
+    deadline = time.monotonic() + timeout
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline() -> Optional[float]:
+    """Like ``time_remaining``, but raise once the deadline has passed."""
+    left = time_remaining()
+    if left is not None and left <= 0:
+        raise ReplicatedDeadlineExceededError("Deadline exceeded")
+    return left
+
+
+def clear_deadline() -> None:
+    """Drop the deadline for the rest of the current task.
+
+    Background tasks copy the context of whoever started them; they call
+    this so they are not bound by that caller's deadline.
+    """
+    _deadline.set(None)
+
+
+def cap_timeout(timeout: Optional[float]) -> Optional[float]:
+    """Shorten a wait of ``timeout`` seconds (None: forever) to the deadline."""
+    left = time_remaining()
+    if left is None:
+        return timeout
+    left = max(0.0, left)
+    return left if timeout is None else min(timeout, left)
@@ -6,3 +6,19 @@ class InstanceStatus(Enum):
 
     RUNNING = "running"
     DEGRADED = "degraded"
+
+
+class OverflowPolicy(Enum):
+    """What to do when a bounded metric buffer is full."""
+
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    BLOCK = "block"
+
+
+class CircuitState(Enum):
+    """State of a circuit breaker."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
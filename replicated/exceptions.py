@@ -12,6 +12,7 @@ class ReplicatedError(Exception):
         json_body: Optional[Dict[str, Any]] = None,
         headers: Optional[Dict[str, str]] = None,
         code: Optional[str] = None,
+        attempts: int = 1,
     ) -> None:
         super().__init__(message)
         self.message = message
@@ -20,6 +21,7 @@ class ReplicatedError(Exception):
         self.json_body = json_body
         self.headers = headers
         self.code = code
+        self.attempts = attempts
 
     def __str__(self) -> str:
         if self.http_status and self.code:
@@ -51,3 +53,32 @@ class ReplicatedNetworkError(ReplicatedError):
     """Raised when network communication fails."""
 
     pass
+
+
+class ReplicatedCircuitOpenError(ReplicatedNetworkError):
+    """Raised without sending a request while the circuit breaker is open."""
+
+    def __init__(self, message: str, retry_in: float = 0.0) -> None:
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+class ReplicatedTimeoutError(ReplicatedNetworkError):
+    """Raised when a request times out or a call runs past its deadline."""
+
+    pass
+
+
+class ReplicatedDeadlineExceededError(ReplicatedTimeoutError):
+    """Raised when a call runs past the deadline its caller gave it.
+
+    Unlike other timeouts, this says nothing about the API's health.
+    """
+
+    pass
+
+
+class ReplicatedQueueFullError(ReplicatedError):
+    """Raised when a background operation is dropped because the queue is full."""
+
+    pass
@@ -1,14 +1,39 @@
 import hashlib
 import platform
 import subprocess
+import threading
+from typing import Optional
 
+_fingerprint: Optional[str] = None
+_fingerprint_lock = threading.Lock()
 
-def get_machine_fingerprint() -> str:
+
+def get_machine_fingerprint(override: Optional[str] = None) -> str:
     """
     Get a unique machine fingerprint based on platform.
 
-    Returns a SHA256 hash of the platform-specific identifier.
+    Returns a SHA256 hash of the platform-specific identifier. The machine
+    identifier is looked up once per process and cached. An ``override``
+    (for example a stable container or pod identity) is hashed instead.
     """
+    if override:
+        return _hash_identifier(override)
+
+    global _fingerprint
+    if _fingerprint is None:
+        with _fingerprint_lock:
+            if _fingerprint is None:
+                _fingerprint = _compute_machine_fingerprint()
+    return _fingerprint
+
+
+def _hash_identifier(identifier: str) -> str:
+    """Hash the identifier for privacy."""
+    return hashlib.sha256(identifier.encode()).hexdigest()
+
+
+def _compute_machine_fingerprint() -> str:
+    """Look up the platform-specific machine identifier and hash it."""
     system = platform.system().lower()
     identifier = ""
     try:
@@ -64,5 +89,4 @@ def get_machine_fingerprint() -> str:
 
         identifier = str(uuid.getnode())  # MAC address as fallback
 
-    # Hash the identifier for privacy
-    return hashlib.sha256(identifier.encode()).hexdigest()
+    return _hash_identifier(identifier)
@@ -1,14 +1,86 @@
+import asyncio
+import functools
 import json
-from typing import Any, Dict, Optional
+import logging
+import time
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
 
 import httpx
 
+from .circuit import CircuitBreaker
+from .compression import (
+    CompressionConfig,
+    EncodedBody,
+    accepted_encodings,
+    encode_body,
+)
+from .deadline import check_deadline, time_remaining
 from .exceptions import (
     ReplicatedAPIError,
     ReplicatedAuthError,
+    ReplicatedCircuitOpenError,
+    ReplicatedDeadlineExceededError,
+    ReplicatedError,
     ReplicatedNetworkError,
     ReplicatedRateLimitError,
+    ReplicatedTimeoutError,
 )
+from .log import LogRateLimiter, Truncated, get_logger
+from .ratelimit import RateLimiter, route_for
+from .retry import RetryPolicy, is_retryable_request, parse_retry_after
+from .stats import Hooks, RequestInfo, RequestStats
+
+logger = get_logger("http")
+
+# Error responses often repeat (e.g. during a 429 storm); log a few per
+# status and path each minute and count the rest.
+_error_log_limiter = LogRateLimiter()
+
+# The httpx.Timeout phase each httpx timeout exception belongs to.
+_TIMEOUT_PHASES: Dict[type, str] = {
+    httpx.ConnectTimeout: "connect",
+    httpx.ReadTimeout: "read",
+    httpx.WriteTimeout: "write",
+    httpx.PoolTimeout: "pool",
+}
+
+# (headers passed for a request, the same merged with the client defaults)
+_MergedHeaders = Tuple[Mapping[str, str], Mapping[str, str]]
+
+
+@functools.lru_cache(maxsize=1024)
+def bearer_auth(token: str) -> Mapping[str, str]:
+    """Return the immutable ``Authorization`` header set for ``token``.
+
+    Built once per token, so callers can hand the same mapping to every
+    request and ``HTTPClient`` can cache its merged headers by identity.
+    """
+    return MappingProxyType({"Authorization": f"Bearer {token}"})
+
+
+def _capped(timeout: Optional[float], limit: float) -> float:
+    return limit if timeout is None else min(timeout, limit)
+
+
+def _fits_deadline(delay: float) -> bool:
+    """Whether waiting ``delay`` seconds still leaves time to retry."""
+    left = time_remaining()
+    return left is None or delay < left
+
+
+def _require_h2() -> None:
+    """Fail at construction, not on the first request, if h2 is missing."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            "http2=True needs the h2 package: pip install replicated[http2]"
+        ) from None
+
+
+def _body_size(content: Any) -> int:
+    return len(content) if isinstance(content, (bytes, bytearray)) else 0
 
 
 class HTTPClient:
@@ -17,25 +89,63 @@ class HTTPClient:
     def __init__(
         self,
         base_url: str = "https://replicated.app",
-        timeout: float = 30.0,
-        headers: Optional[Dict[str, str]] = None,
+        timeout: Union[float, httpx.Timeout] = 30.0,
+        headers: Optional[Mapping[str, str]] = None,
+        retry: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        limits: Optional[httpx.Limits] = None,
+        http2: bool = False,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        compression: Optional[CompressionConfig] = None,
     ) -> None:
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
+        self.limits = limits
+        if http2:
+            _require_h2()
+        self.http2 = http2
         self.default_headers = headers or {}
+        self._base_headers: Mapping[str, str] = MappingProxyType(
+            {
+                "Content-Type": "application/json",
+                "User-Agent": "replicated-python/1.0.0",
+                **self.default_headers,
+            }
+        )
+        # id(headers) -> (headers, merged) for immutable per-request headers.
+        # A plain dict: single get/set calls are safe across threads.
+        self._merged_headers: Dict[int, _MergedHeaders] = {}
+        # Without a policy every request is attempted exactly once.
+        self.retry = retry or RetryPolicy(max_attempts=1)
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self.compression = compression
+        # Downgraded when the server answers 415 to a compressed body.
+        self._content_encoding = compression.encoding if compression else None
+        self.hooks = Hooks()
+        self.stats = RequestStats()
 
     def _build_headers(
-        self, headers: Optional[Dict[str, str]] = None
-    ) -> Dict[str, str]:
-        """Build request headers."""
-        request_headers = {
-            "Content-Type": "application/json",
-            "User-Agent": "replicated-python/1.0.0",
-            **self.default_headers,
-        }
-        if headers:
-            request_headers.update(headers)
-        return request_headers
+        self, headers: Optional[Mapping[str, str]] = None
+    ) -> Mapping[str, str]:
+        """Build request headers.
+
+        Immutable ``headers`` (such as those from ``bearer_auth``) are
+        merged once and the result reused for later requests.
+        """
+        if not headers:
+            return self._base_headers
+        if not isinstance(headers, MappingProxyType):
+            return {**self._base_headers, **headers}
+        cached = self._merged_headers.get(id(headers))
+        if cached is not None and cached[0] is headers:
+            return cached[1]
+        merged = MappingProxyType({**self._base_headers, **headers})
+        if len(self._merged_headers) >= 256:
+            self._merged_headers.clear()
+        # Keep a reference to ``headers`` so its id is not reused.
+        self._merged_headers[id(headers)] = (headers, merged)
+        return merged
 
     def _handle_response(self, response: httpx.Response) -> Dict[str, Any]:
         """Handle HTTP response and raise appropriate exceptions."""
@@ -51,10 +161,8 @@ class HTTPClient:
         error_message = json_body.get("message", default_msg)
         error_code = json_body.get("code")
 
-        # Debug: print the full error response
-        print(f"DEBUG: HTTP {response.status_code} Error Response:")
-        print(f"DEBUG: Response body: {response.text}")
-        print(f"DEBUG: JSON body: {json_body}")
+        if logger.isEnabledFor(logging.DEBUG):
+            self._log_error_response(response)
 
         if response.status_code == 401:
             raise ReplicatedAuthError(
@@ -93,13 +201,211 @@ class HTTPClient:
                 code=error_code,
             )
 
+    def _log_error_response(self, response: httpx.Response) -> None:
+        """Log an error response, rate-limited per status and route."""
+        status = response.status_code
+        try:
+            method, path = response.request.method, response.request.url.path
+        except RuntimeError:  # A response built without a request
+            method, path = "-", "-"
+        # Keyed on the route, not the path, so per-instance URLs share one
+        # entry and the limiter's table stays small.
+        allowed, suppressed = _error_log_limiter.allow(
+            (status, route_for(method, path))
+        )
+        if not allowed:
+            return
+        logger.debug(
+            "HTTP %s from %s %s (%d similar suppressed): %s",
+            status,
+            method,
+            path,
+            suppressed,
+            Truncated(response.text),
+        )
+
+    def _prepare_request(
+        self,
+        method: str,
+        headers: Optional[Mapping[str, str]],
+        idempotent: Optional[bool],
+        idempotency_key: Optional[str],
+    ) -> Tuple[Mapping[str, str], bool]:
+        """Build request headers and decide whether the request may be retried."""
+        request_headers = self._build_headers(headers)
+        if idempotency_key:
+            request_headers = {**request_headers, "Idempotency-Key": idempotency_key}
+        return request_headers, is_retryable_request(
+            method, idempotent, idempotency_key
+        )
+
+    def _observe_rate_limit(
+        self, route: str, error: Optional[ReplicatedError] = None
+    ) -> None:
+        """Report the outcome of an attempt to the rate limiter."""
+        if self.rate_limiter is None:
+            return
+        if error is None:
+            self.rate_limiter.on_response(route, 200)
+        elif error.http_status is not None:
+            self.rate_limiter.on_response(
+                route, error.http_status, parse_retry_after(error.headers)
+            )
+
+    def _check_circuit(
+        self, method: str, url: str, json_data: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """Let a request through the circuit breaker, or answer it without one.
+
+        Returns None when the request may be sent. While the circuit is
+        open, returns the fallback's response or raises
+        ``ReplicatedCircuitOpenError``.
+        """
+        if self.circuit_breaker is None:
+            return None
+        try:
+            self.circuit_breaker.before_request()
+        except ReplicatedCircuitOpenError:
+            if self.circuit_breaker.fallback is None:
+                raise
+            return self.circuit_breaker.fallback(method, url, json_data)
+        return None
+
+    def _client_timeout(self) -> httpx.Timeout:
+        if isinstance(self.timeout, httpx.Timeout):
+            return self.timeout
+        return httpx.Timeout(self.timeout)
+
+    def _timeout_error(
+        self, error: httpx.TimeoutException, timeout: Optional[httpx.Timeout]
+    ) -> ReplicatedTimeoutError:
+        """Map an httpx timeout, telling apart one the deadline cut short."""
+        phase = _TIMEOUT_PHASES.get(type(error))
+        if isinstance(timeout, httpx.Timeout) and phase is not None:
+            limit = getattr(self._client_timeout(), phase)
+            if limit is None or getattr(timeout, phase) < limit:
+                return ReplicatedDeadlineExceededError(f"Deadline exceeded: {error}")
+        return ReplicatedTimeoutError(f"Timed out: {str(error)}")
+
+    def _attempt_timeout(self) -> Optional[httpx.Timeout]:
+        """The client's timeout, with every phase capped by the deadline.
+
+        None, without a deadline, leaves the client's own timeout in place.
+        """
+        left = time_remaining()
+        if left is None:
+            return None
+        if left <= 0:
+            raise ReplicatedDeadlineExceededError("Deadline exceeded")
+        timeout = self._client_timeout()
+        return httpx.Timeout(
+            connect=_capped(timeout.connect, left),
+            read=_capped(timeout.read, left),
+            write=_capped(timeout.write, left),
+            pool=_capped(timeout.pool, left),
+        )
+
+    def _encode_body(
+        self, json_data: Optional[Dict[str, Any]]
+    ) -> Optional[EncodedBody]:
+        """Serialize ``json_data`` when compression is on; None sends it as JSON."""
+        encoding = self._content_encoding
+        if json_data is None or encoding is None or self.compression is None:
+            return None
+        return encode_body(json_data, encoding, self.compression)
+
+    def _encoding_rejected(
+        self,
+        encoding: str,
+        error: ReplicatedError,
+        json_data: Optional[Dict[str, Any]],
+        rejected: List[str],
+    ) -> Optional[EncodedBody]:
+        """Stop using an encoding the server rejected and re-encode the body.
+
+        ``rejected`` holds the encodings already refused for this request.
+        The body is re-encoded once; a second refusal sends it uncompressed,
+        so a server offering encodings it then refuses cannot loop us.
+        """
+        rejected.append(encoding)
+        fallback = None
+        if len(rejected) == 1:
+            accepted = accepted_encodings(error.headers or {})
+            fallback = next((e for e in accepted if e not in rejected), None)
+        if self._content_encoding == encoding:
+            self._content_encoding = fallback
+            logger.warning(
+                "Server rejected %s request bodies; sending them %s",
+                encoding,
+                f"with {fallback}" if fallback else "uncompressed",
+            )
+        if fallback is None or json_data is None or self.compression is None:
+            return None
+        return encode_body(json_data, fallback, self.compression)
+
+    def _body_options(
+        self,
+        headers: Mapping[str, str],
+        json_data: Optional[Dict[str, Any]],
+        body: Optional[EncodedBody],
+    ) -> Dict[str, Any]:
+        """The ``httpx`` request arguments carrying headers and the body."""
+        if body is None:
+            return {"headers": headers, "json": json_data}
+        if body.encoding is not None:
+            headers = {**headers, "Content-Encoding": body.encoding}
+        return {"headers": headers, "content": body.content}
+
+    def _release_circuit(self) -> None:
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.release()
+
+    def _start_attempt(
+        self, method: str, url: str, endpoint: str, attempt: int
+    ) -> RequestInfo:
+        info = RequestInfo(method, url, endpoint, attempt)
+        self.hooks.emit("on_request_start", info)
+        return info
+
+    def _end_attempt(
+        self, info: RequestInfo, error: Optional[ReplicatedError] = None
+    ) -> None:
+        """Record a finished attempt and run the end (and error) hooks."""
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(error)
+        info.elapsed = time.perf_counter() - info.started
+        if error is not None:
+            info.error = error
+            if info.status is None:
+                info.status = error.http_status
+        self.stats.record(info)
+        self.hooks.emit("on_request_end", info)
+        if error is not None:
+            self.hooks.emit("on_error", info)
+
+    def _retrying(self, info: RequestInfo, delay: float) -> None:
+        info.retry_delay = delay
+        self.stats.record_retry(info)
+        self.hooks.emit("on_retry", info)
+
+    def _measure(self, response: httpx.Response, info: RequestInfo) -> None:
+        """Copy the status and body sizes of ``response`` into ``info``."""
+        info.status = response.status_code
+        info.bytes_received = _body_size(response.content)
+        try:
+            info.bytes_sent = _body_size(response.request.content)
+        except RuntimeError:  # A response built without a request
+            pass
+
     def _make_request(
         self,
         method: str,
         url: str,
-        headers: Optional[Dict[str, str]] = None,
+        headers: Optional[Mapping[str, str]] = None,
         json_data: Optional[Dict[str, Any]] = None,
         params: Optional[Dict[str, Any]] = None,
+        idempotent: Optional[bool] = None,
+        idempotency_key: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Make a synchronous HTTP request."""
         raise NotImplementedError("Subclasses must implement _make_request")
@@ -108,9 +414,11 @@ class HTTPClient:
         self,
         method: str,
         url: str,
-        headers: Optional[Dict[str, str]] = None,
+        headers: Optional[Mapping[str, str]] = None,
         json_data: Optional[Dict[str, Any]] = None,
         params: Optional[Dict[str, Any]] = None,
+        idempotent: Optional[bool] = None,
+        idempotency_key: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Make an asynchronous HTTP request."""
         raise NotImplementedError("Subclasses must implement _make_request_async")
@@ -119,86 +427,296 @@ class HTTPClient:
 class SyncHTTPClient(HTTPClient):
     """Synchronous HTTP client."""
 
-    def __init__(self, **kwargs: Any) -> None:
+    def __init__(
+        self,
+        client: Optional[httpx.Client] = None,
+        transport: Optional[httpx.BaseTransport] = None,
+        **kwargs: Any,
+    ) -> None:
         super().__init__(**kwargs)
-        self._client: Optional[httpx.Client] = None
+        # A client passed in is shared with the caller, who closes it.
+        self._client: Optional[httpx.Client] = client
+        self._owns_client = client is None
+        self._transport = transport
 
     def __enter__(self) -> "SyncHTTPClient":
-        self._client = httpx.Client(timeout=self.timeout)
+        if not self._client:
+            self._client = self._new_client()
         return self
 
     def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
-        if self._client:
+        if self._client and self._owns_client:
             self._client.close()
             self._client = None
 
+    def _new_client(self) -> httpx.Client:
+        """Create the pooled httpx client used for all requests."""
+        options: Dict[str, Any] = {"timeout": self.timeout, "http2": self.http2}
+        if self.limits is not None:
+            options["limits"] = self.limits
+        if self._transport is not None:
+            options["transport"] = self._transport
+        return httpx.Client(**options)
+
     def _make_request(
         self,
         method: str,
         url: str,
-        headers: Optional[Dict[str, str]] = None,
+        headers: Optional[Mapping[str, str]] = None,
         json_data: Optional[Dict[str, Any]] = None,
         params: Optional[Dict[str, Any]] = None,
+        idempotent: Optional[bool] = None,
+        idempotency_key: Optional[str] = None,
     ) -> Dict[str, Any]:
-        """Make a synchronous HTTP request."""
-        if not self._client:
-            self._client = httpx.Client(timeout=self.timeout)
-
+        """Make a synchronous HTTP request, retrying per the retry policy."""
         full_url = f"{self.base_url}{url}"
-        request_headers = self._build_headers(headers)
+        request_headers, retryable = self._prepare_request(
+            method, headers, idempotent, idempotency_key
+        )
+
+        body = self._encode_body(json_data)
+        route = route_for(method, url)
+        endpoint = f"{method} {route}"
+        started = time.monotonic()
+        attempt = 0
+        delay = 0.0
+        rejected: List[str] = []
+        while True:
+            attempt += 1
+            left = check_deadline()
+            fallback = self._check_circuit(method, url, json_data)
+            if fallback is not None:
+                return fallback
+            # The circuit's permission must be given back however the
+            # attempt ends, or a half-open probe slot is lost for good.
+            recorded = False
+            try:
+                if self.rate_limiter is not None:
+                    if not self.rate_limiter.acquire(route, left):
+                        raise ReplicatedDeadlineExceededError(
+                            "Deadline exceeded waiting to send"
+                        )
+                timeout = self._attempt_timeout()
+                info = self._start_attempt(method, url, endpoint, attempt)
+                try:
+                    result = self._send(
+                        method,
+                        full_url,
+                        request_headers,
+                        json_data,
+                        body,
+                        params,
+                        timeout,
+                        info,
+                    )
+                except ReplicatedError as e:
+                    recorded = True
+                    self._end_attempt(info, e)
+                    if body is not None and body.encoding and e.http_status == 415:
+                        body = self._encoding_rejected(
+                            body.encoding, e, json_data, rejected
+                        )
+                        continue
+                    self._observe_rate_limit(route, e)
+                    e.attempts = attempt
+                    next_delay = self.retry.next_delay(
+                        e, retryable, attempt, delay, started
+                    )
+                    if next_delay is None or not _fits_deadline(next_delay):
+                        raise
+                    delay = next_delay
+                    self._retrying(info, delay)
+                else:
+                    recorded = True
+                    self._end_attempt(info)
+                    self._observe_rate_limit(route)
+                    return result
+            finally:
+                if not recorded:
+                    self._release_circuit()
+            time.sleep(delay)
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Mapping[str, str],
+        json_data: Optional[Dict[str, Any]],
+        body: Optional[EncodedBody],
+        params: Optional[Dict[str, Any]],
+        timeout: Optional[httpx.Timeout],
+        info: RequestInfo,
+    ) -> Dict[str, Any]:
+        """Send a single request attempt."""
+        if not self._client:
+            self._client = self._new_client()
 
+        options = self._body_options(headers, json_data, body)
+        if timeout is not None:
+            options["timeout"] = timeout
         try:
             response = self._client.request(
-                method=method,
-                url=full_url,
-                headers=request_headers,
-                json=json_data,
-                params=params,
+                method=method, url=url, params=params, **options
             )
-            return self._handle_response(response)
+        except httpx.TimeoutException as e:
+            raise self._timeout_error(e, timeout) from e
         except httpx.RequestError as e:
-            raise ReplicatedNetworkError(f"Network error: {str(e)}")
+            raise ReplicatedNetworkError(f"Network error: {str(e)}") from e
+        self._measure(response, info)
+        if body is not None:
+            info.bytes_saved = body.saved
+        # httpx times each socket read separately, so a body that trickles
+        # in can finish after the deadline; a late answer is a timeout.
+        check_deadline()
+        return self._handle_response(response)
 
 
 class AsyncHTTPClient(HTTPClient):
     """Asynchronous HTTP client."""
 
-    def __init__(self, **kwargs: Any) -> None:
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        **kwargs: Any,
+    ) -> None:
         super().__init__(**kwargs)
-        self._client: Optional[httpx.AsyncClient] = None
+        # A client passed in is shared with the caller, who closes it.
+        self._client: Optional[httpx.AsyncClient] = client
+        self._owns_client = client is None
+        self._transport = transport
 
     async def __aenter__(self) -> "AsyncHTTPClient":
-        self._client = httpx.AsyncClient(timeout=self.timeout)
+        if not self._client:
+            self._client = self._new_client()
         return self
 
     async def __aexit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
-        if self._client:
+        if self._client and self._owns_client:
             await self._client.aclose()
             self._client = None
 
+    def _new_client(self) -> httpx.AsyncClient:
+        """Create the pooled httpx client used for all requests."""
+        options: Dict[str, Any] = {"timeout": self.timeout, "http2": self.http2}
+        if self.limits is not None:
+            options["limits"] = self.limits
+        if self._transport is not None:
+            options["transport"] = self._transport
+        return httpx.AsyncClient(**options)
+
     async def _make_request_async(
         self,
         method: str,
         url: str,
-        headers: Optional[Dict[str, str]] = None,
+        headers: Optional[Mapping[str, str]] = None,
         json_data: Optional[Dict[str, Any]] = None,
         params: Optional[Dict[str, Any]] = None,
+        idempotent: Optional[bool] = None,
+        idempotency_key: Optional[str] = None,
     ) -> Dict[str, Any]:
-        """Make an asynchronous HTTP request."""
-        if not self._client:
-            self._client = httpx.AsyncClient(timeout=self.timeout)
-
+        """Make an asynchronous HTTP request, retrying per the retry policy."""
         full_url = f"{self.base_url}{url}"
-        request_headers = self._build_headers(headers)
+        request_headers, retryable = self._prepare_request(
+            method, headers, idempotent, idempotency_key
+        )
+
+        body = self._encode_body(json_data)
+        route = route_for(method, url)
+        endpoint = f"{method} {route}"
+        started = time.monotonic()
+        attempt = 0
+        delay = 0.0
+        rejected: List[str] = []
+        while True:
+            attempt += 1
+            left = check_deadline()
+            fallback = self._check_circuit(method, url, json_data)
+            if fallback is not None:
+                return fallback
+            # The circuit's permission must be given back however the
+            # attempt ends, or a half-open probe slot is lost for good.
+            recorded = False
+            try:
+                if self.rate_limiter is not None:
+                    if not await self.rate_limiter.acquire_async(route, left):
+                        raise ReplicatedDeadlineExceededError(
+                            "Deadline exceeded waiting to send"
+                        )
+                timeout = self._attempt_timeout()
+                info = self._start_attempt(method, url, endpoint, attempt)
+                try:
+                    result = await self._send_async(
+                        method,
+                        full_url,
+                        request_headers,
+                        json_data,
+                        body,
+                        params,
+                        timeout,
+                        info,
+                    )
+                except ReplicatedError as e:
+                    recorded = True
+                    self._end_attempt(info, e)
+                    if body is not None and body.encoding and e.http_status == 415:
+                        body = self._encoding_rejected(
+                            body.encoding, e, json_data, rejected
+                        )
+                        continue
+                    self._observe_rate_limit(route, e)
+                    e.attempts = attempt
+                    next_delay = self.retry.next_delay(
+                        e, retryable, attempt, delay, started
+                    )
+                    if next_delay is None or not _fits_deadline(next_delay):
+                        raise
+                    delay = next_delay
+                    self._retrying(info, delay)
+                else:
+                    recorded = True
+                    self._end_attempt(info)
+                    self._observe_rate_limit(route)
+                    return result
+            finally:
+                if not recorded:
+                    self._release_circuit()
+            await asyncio.sleep(delay)
+
+    async def _send_async(
+        self,
+        method: str,
+        url: str,
+        headers: Mapping[str, str],
+        json_data: Optional[Dict[str, Any]],
+        body: Optional[EncodedBody],
+        params: Optional[Dict[str, Any]],
+        timeout: Optional[httpx.Timeout],
+        info: RequestInfo,
+    ) -> Dict[str, Any]:
+        """Send a single request attempt."""
+        if not self._client:
+            self._client = self._new_client()
 
+        options = self._body_options(headers, json_data, body)
+        if timeout is not None:
+            options["timeout"] = timeout
+        request = self._client.request(method=method, url=url, params=params, **options)
+        left = time_remaining()
         try:
-            response = await self._client.request(
-                method=method,
-                url=full_url,
-                headers=request_headers,
-                json=json_data,
-                params=params,
-            )
-            return self._handle_response(response)
+            if left is None:
+                response = await request
+            else:
+                # httpx times each socket read separately; bound the whole
+                # attempt so a slowly trickling body cannot outlive the deadline.
+                response = await asyncio.wait_for(request, max(0.0, left))
+        except asyncio.TimeoutError:
+            raise ReplicatedDeadlineExceededError("Deadline exceeded") from None
+        except httpx.TimeoutException as e:
+            raise self._timeout_error(e, timeout) from e
         except httpx.RequestError as e:
-            raise ReplicatedNetworkError(f"Network error: {str(e)}")
+            raise ReplicatedNetworkError(f"Network error: {str(e)}") from e
+        self._measure(response, info)
+        if body is not None:
+            info.bytes_saved = body.saved
+        return self._handle_response(response)
@@ -0,0 +1,60 @@
+import logging
+import threading
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+# Parent of every logger in the SDK; configure this one to see SDK output.
+logger = logging.getLogger("replicated")
+
+# Longest response body, in characters, included in a log record.
+MAX_BODY_LENGTH = 512
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return a child of the ``replicated`` logger."""
+    return logger.getChild(name)
+
+
+class Truncated:
+    """Defers truncating text until a log record is actually formatted."""
+
+    __slots__ = ("text", "limit")
+
+    def __init__(self, text: str, limit: int = MAX_BODY_LENGTH) -> None:
+        self.text = text
+        self.limit = limit
+
+    def __str__(self) -> str:
+        if len(self.text) <= self.limit:
+            return self.text
+        return f"{self.text[: self.limit]}... ({len(self.text)} chars)"
+
+
+class LogRateLimiter:
+    """Lets at most ``burst`` records per key through in each ``interval``.
+
+    ``allow`` returns whether to log and, when it does, how many records
+    for the key were suppressed since the last one that was logged.
+    """
+
+    def __init__(self, interval: float = 60.0, burst: int = 5) -> None:
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        # key -> (window start, records logged in window, records suppressed)
+        self._windows: Dict[Hashable, Tuple[float, int, int]] = {}
+
+    def allow(self, key: Hashable) -> Tuple[bool, int]:
+        now = time.monotonic()
+        with self._lock:
+            window: Optional[Tuple[float, int, int]] = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = (now, 1, 0)
+                return True, suppressed
+            start, logged, suppressed = window
+            if logged < self.burst:
+                self._windows[key] = (start, logged + 1, 0)
+                return True, suppressed
+            self._windows[key] = (start, logged, suppressed + 1)
+            return False, 0
@@ -0,0 +1,374 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from .exceptions import ReplicatedError, ReplicatedNetworkError
+from .state import to_thread
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+Record = Dict[str, Any]
+
+SEGMENT_SUFFIX = ".log"
+
+
+class OutboxConfig:
+    """Settings for the durable on-disk outbox."""
+
+    def __init__(
+        self,
+        max_bytes: int = 16 * 1024 * 1024,
+        segment_bytes: int = 1024 * 1024,
+        replay_interval: float = 5.0,
+        replay_batch_size: int = 500,
+    ) -> None:
+        if segment_bytes > max_bytes:
+            raise ValueError("segment_bytes must not exceed max_bytes")
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.replay_interval = replay_interval
+        self.replay_batch_size = replay_batch_size
+
+
+def compact(records: List[Record]) -> List[Record]:
+    """Keep the latest value per metric and per instance field.
+
+    A metric deletion supersedes earlier sends of that metric (and the
+    reverse). Status/version updates for an instance are merged into one
+    record, the last value of each field winning.
+    """
+    latest: Dict[Tuple[Hashable, ...], Record] = {}
+    for record in records:
+        target = (record.get("customer_id"), record.get("instance_id"))
+        if record["op"] == "patch":
+            key: Tuple[Hashable, ...] = ("patch",) + target
+            previous = latest.pop(key, None)
+            if previous is not None:
+                fields = {**previous["fields"], **record["fields"]}
+                record = dict(record, fields=fields)
+        else:
+            key = ("metric",) + target + (record["name"],)
+            latest.pop(key, None)
+        latest[key] = record
+    return list(latest.values())
+
+
+def is_transient(error: ReplicatedError) -> bool:
+    """Whether a failed replay should be kept and tried again later."""
+    if isinstance(error, ReplicatedNetworkError):
+        return True
+    status = error.http_status
+    return status is not None and (status == 429 or status >= 500)
+
+
+class Outbox:
+    """Append-only, segment-rotated log of operations waiting to be sent.
+
+    Records are JSON lines appended to the newest ``*.log`` segment in the
+    outbox directory. A new segment starts once the current one reaches
+    ``segment_bytes``. When the outbox would exceed ``max_bytes`` it is
+    compacted to the latest value per metric and field, and if that is
+    not enough the oldest records are dropped. File operations hold an
+    ``fcntl`` lock so processes sharing a state directory can share it,
+    and a replay holds a second one from ``take`` to ``commit`` so only
+    one replayer at a time sends the records.
+    """
+
+    def __init__(self, directory: Path, config: OutboxConfig) -> None:
+        self.directory = directory
+        self.config = config
+        # Set while the API is unreachable, so callers spool immediately.
+        self.offline = False
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._replay_fd: Optional[int] = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._lock:
+            fd = None
+            if fcntl is not None:
+                fd = os.open(self.directory / ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fd is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    os.close(fd)
+
+    def _claim_replay(self) -> bool:
+        """Take the replay lock without waiting; False if a replay holds it."""
+        if not self._replay_lock.acquire(blocking=False):
+            return False
+        if fcntl is None:
+            return True
+        try:
+            fd = os.open(self.directory / ".replay.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        except BaseException:
+            self._replay_lock.release()
+            raise
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            self._replay_lock.release()
+            return False
+        self._replay_fd = fd
+        return True
+
+    def _release_replay(self) -> None:
+        fd, self._replay_fd = self._replay_fd, None
+        if fd is not None:
+            os.close(fd)  # Also releases the flock
+        self._replay_lock.release()
+
+    def _segments(self) -> List[Path]:
+        return sorted(
+            p for p in self.directory.iterdir() if p.name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _new_segment(self, segments: List[Path]) -> Path:
+        seq = int(segments[-1].stem) + 1 if segments else 1
+        path = self.directory / f"{seq:012d}{SEGMENT_SUFFIX}"
+        path.touch()
+        return path
+
+    def _read(self, segments: List[Path]) -> List[Record]:
+        records = []
+        for path in segments:
+            try:
+                lines = path.read_bytes().splitlines()
+            except OSError:
+                continue
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # A torn write at the end of a segment
+        return records
+
+    def _write_segment(self, path: Path, records: List[Record]) -> None:
+        """Atomically replace ``path`` with ``records``."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for record in records:
+                    f.write(_encode(record))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def append(self, record: Record) -> None:
+        """Add a record, rotating, compacting or dropping to stay in bounds."""
+        line = _encode(record)
+        with self._locked():
+            segments = self._segments()
+            sizes = [p.stat().st_size for p in segments]
+            if not segments or sizes[-1] + len(line) > self.config.segment_bytes:
+                if sum(sizes) + len(line) > self.config.max_bytes:
+                    segments = self._shrink(segments, len(line))
+                segments.append(self._new_segment(segments))
+            with open(segments[-1], "ab") as f:
+                f.write(line)
+
+    def _shrink(self, segments: List[Path], incoming: int) -> List[Path]:
+        """Compact, then drop the oldest records until ``incoming`` fits."""
+        records = compact(self._read(segments))
+        for path in segments[1:]:
+            path.unlink()
+        if not records:
+            segments[0].unlink()
+            return []
+        self._write_segment(segments[0], records)
+        segments = segments[:1]
+        while segments:
+            size = segments[0].stat().st_size
+            if size + incoming <= self.config.max_bytes:
+                break
+            # Even compacted, the backlog does not fit: drop the oldest half.
+            drop = len(records) - len(records) // 2
+            self.dropped += drop
+            records = records[drop:]
+            if records:
+                self._write_segment(segments[0], records)
+            else:
+                segments[0].unlink()
+                segments = []
+        return segments
+
+    def has_pending(self) -> bool:
+        """Whether any records are waiting to be sent."""
+        try:
+            return any(p.stat().st_size > 0 for p in self._segments())
+        except OSError:
+            return False
+
+    def take(self) -> Tuple[List[Record], List[Path]]:
+        """Seal the current segments and return their compacted records.
+
+        New records are appended to a fresh segment, so they are neither
+        replayed nor lost while the taken ones are being sent.
+        """
+        with self._locked():
+            segments = self._segments()
+            if not any(p.stat().st_size > 0 for p in segments):
+                return [], []
+            self._new_segment(segments)
+            return compact(self._read(segments)), segments
+
+    def commit(self, segments: List[Path], remaining: List[Record]) -> None:
+        """Replace taken segments with the records that were not sent."""
+        if not segments:
+            return
+        with self._locked():
+            if remaining:
+                self._write_segment(segments[0], remaining)
+                segments = segments[1:]
+            for path in segments:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def _settle(self, error: Exception) -> bool:
+        """Handle a failed replay; returns True to stop and retry later."""
+        if isinstance(error, ReplicatedError) and is_transient(error):
+            return True
+        # Rejected by the API, or a record that cannot be sent at all:
+        # retrying will not help, and keeping it would block the rest.
+        self.dropped += 1
+        return False
+
+    def replay(
+        self,
+        send: Callable[[Record], None],
+        stop: Optional[threading.Event] = None,
+    ) -> bool:
+        """Send up to one batch of records.
+
+        Returns False if the batch stopped early, on a transient failure,
+        on ``stop`` being set or because another replay is running; the
+        unsent records stay in the outbox.
+        """
+        if not self._claim_replay():
+            return False
+        try:
+            records, segments = self.take()
+            batch_size = self.config.replay_batch_size
+            sent = 0
+            try:
+                for record in records[:batch_size]:
+                    if stop is not None and stop.is_set():
+                        break
+                    try:
+                        send(record)
+                    except Exception as e:
+                        if self._settle(e):
+                            break
+                    sent += 1
+            finally:
+                self.commit(segments, records[sent:])
+        finally:
+            self._release_replay()
+        return sent == min(len(records), batch_size)
+
+    async def replay_async(self, send: Callable[[Record], Awaitable[None]]) -> bool:
+        """Async version of ``replay``; disk work runs in a worker thread."""
+        if not await to_thread(self._claim_replay):
+            return False
+        try:
+            records, segments = await to_thread(self.take)
+            batch_size = self.config.replay_batch_size
+            sent = 0
+            try:
+                for record in records[:batch_size]:
+                    try:
+                        await send(record)
+                    except Exception as e:
+                        if self._settle(e):
+                            break
+                    sent += 1
+            finally:
+                await to_thread(self.commit, segments, records[sent:])
+        finally:
+            await to_thread(self._release_replay)
+        return sent == min(len(records), batch_size)
+
+
+class OutboxReplayer:
+    """Background thread that drains the outbox once the API is reachable."""
+
+    def __init__(self, outbox: Outbox, send: Callable[[Record], None]) -> None:
+        self.outbox = outbox
+        self.send = send
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start replaying unless a replay thread is already running."""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="replicated-outbox-replay", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """Stop replaying; pending records stay on disk.
+
+        Waits up to ``timeout`` seconds for a send in progress to finish.
+        """
+        self._stop.set()
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.outbox.config.replay_interval):
+            try:
+                # Keep going while batches succeed; otherwise wait again.
+                while self.outbox.replay(self.send, self._stop):
+                    if not self.outbox.has_pending():
+                        break
+            except Exception:
+                pass  # Disk errors: try again next interval
+            with self._lock:
+                if not self.outbox.has_pending():
+                    self.outbox.offline = False
+                    self._thread = None
+                    return
+        with self._lock:
+            self._thread = None
+
+
+def _encode(record: Record) -> bytes:
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode()
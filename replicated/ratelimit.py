@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Default (requests per second, burst) for each route.
+DEFAULT_LIMITS: Dict[str, Tuple[float, int]] = {
+    "metrics": (10.0, 20),
+    "instance": (5.0, 10),
+    "customer": (2.0, 5),
+    "default": (10.0, 20),
+}
+
+
+def route_for(method: str, url: str) -> str:
+    """Map a request to the rate-limit route it is counted against."""
+    if url.startswith("/v3/customer"):
+        return "customer"
+    if url.startswith("/api/v1/instances/"):
+        return "metrics" if "/metrics" in url else "instance"
+    if url.startswith("/api/v1/customers/") and url.endswith("/instances"):
+        return "instance"
+    return "default"
+
+
+class TokenBucket:
+    """A token bucket whose refill rate adapts to 429 responses.
+
+    Tokens are reserved rather than waited for under the lock: ``reserve``
+    always takes a token, possibly driving the balance negative, and
+    returns how long the caller must wait before using it. The rate is
+    cut multiplicatively on every 429 and recovers additively on success.
+    A ``Retry-After`` pause is capped at ``max_pause`` seconds.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        min_rate: float = 0.1,
+        decrease_factor: float = 0.5,
+        recovery: float = 0.05,
+        max_pause: float = 10.0,
+    ) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate)
+        self.decrease_factor = decrease_factor
+        self.recovery = recovery
+        self.max_pause = max_pause
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        """Add tokens for the time elapsed; caller holds the lock."""
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+
+    def reserve(self) -> float:
+        """Take one token and return the seconds to wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def refund(self) -> None:
+        """Return a token taken by ``reserve`` that will not be used."""
+        with self._lock:
+            self._tokens = min(float(self.burst), self._tokens + 1.0)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """Slow down after a 429, pausing for ``retry_after`` if given."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            if retry_after:
+                pause = min(retry_after, self.max_pause)
+                self._tokens = min(self._tokens, -pause * self.rate)
+
+    def on_success(self) -> None:
+        """Recover part of the configured rate after a successful request."""
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery)
+
+
+class RateLimiter:
+    """Client-side rate limiter with one token bucket per route.
+
+    A single limiter can be passed to several clients so that everything
+    reporting through the same publishable key shares one budget. Callers
+    wait locally for a token instead of sending requests the server
+    would reject with 429.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, int]]] = None,
+        min_rate: float = 0.1,
+        decrease_factor: float = 0.5,
+        recovery: float = 0.05,
+        max_pause: float = 10.0,
+    ) -> None:
+        merged = dict(DEFAULT_LIMITS)
+        merged.update(limits or {})
+        self.buckets = {
+            route: TokenBucket(
+                rate, burst, min_rate, decrease_factor, recovery, max_pause
+            )
+            for route, (rate, burst) in merged.items()
+        }
+
+    def _bucket(self, route: str) -> TokenBucket:
+        return self.buckets.get(route) or self.buckets["default"]
+
+    def _reserve(self, route: str, timeout: Optional[float]) -> Optional[float]:
+        """Reserve a token, or return None if it is not free within ``timeout``."""
+        bucket = self._bucket(route)
+        delay = bucket.reserve()
+        if timeout is not None and delay > timeout:
+            bucket.refund()
+            return None
+        return delay
+
+    def acquire(self, route: str, timeout: Optional[float] = None) -> bool:
+        """Block until a request on ``route`` may be sent.
+
+        Returns False without waiting if that would take longer than
+        ``timeout`` seconds.
+        """
+        delay = self._reserve(route, timeout)
+        if delay is None:
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    async def acquire_async(self, route: str, timeout: Optional[float] = None) -> bool:
+        """Wait without blocking the event loop until ``route`` may be used."""
+        delay = self._reserve(route, timeout)
+        if delay is None:
+            return False
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return True
+
+    def on_response(
+        self, route: str, status: Optional[int], retry_after: Optional[float] = None
+    ) -> None:
+        """Feed the outcome of a request back into the route's bucket."""
+        bucket = self._bucket(route)
+        if status == 429:
+            bucket.on_rate_limited(retry_after)
+        elif status is not None and status < 400:
+            bucket.on_success()
@@ -1,13 +1,129 @@
-from typing import TYPE_CHECKING, Any, Optional, Union
-
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+
+from .aggregators import Aggregator, Counter, Gauge, Histogram
+from .deadline import clear_deadline, within
 from .enums import InstanceStatus
-from .fingerprint import get_machine_fingerprint
+from .exceptions import ReplicatedDeadlineExceededError, ReplicatedNetworkError
+from .state import to_thread
 
 if TYPE_CHECKING:
     from .async_client import AsyncReplicatedClient
     from .client import ReplicatedClient
 
 
+def _patch_fields(
+    status: Optional[InstanceStatus], version: Optional[str]
+) -> Dict[str, str]:
+    """Build the body of an instance PATCH from the fields being set."""
+    fields = {}
+    if status is not None:
+        fields["status"] = status.value
+    if version is not None:
+        fields["version"] = version
+    return fields
+
+
+# Seconds after which report_metrics re-sends a value that has not changed.
+DEFAULT_METRIC_HEARTBEAT = 300.0
+
+# metric name -> (value last sent by report_metrics, time.monotonic() it was sent)
+_ReportIndex = Dict[str, Tuple[Union[int, float, str], float]]
+
+
+def _diff_snapshot(
+    index: _ReportIndex,
+    snapshot: Mapping[str, Union[int, float, str]],
+    heartbeat: Optional[float],
+    now: float,
+) -> Tuple[List[Tuple[str, Union[int, float, str]]], List[str]]:
+    """Return the metrics to send and the names to delete for ``snapshot``.
+
+    A metric is sent when it is new, its value changed, or it was last
+    sent ``heartbeat`` or more seconds ago.
+    """
+    changed = []
+    for name, value in snapshot.items():
+        last = index.get(name)
+        if (
+            last is None
+            or last[0] != value
+            or (heartbeat is not None and now - last[1] >= heartbeat)
+        ):
+            changed.append((name, value))
+    vanished = [name for name in list(index) if name not in snapshot]
+    return changed, vanished
+
+
+def _cached_instance_id(
+    client: Union["ReplicatedClient", "AsyncReplicatedClient"], customer_id: str
+) -> Optional[str]:
+    """Look up this machine's instance ID for a customer."""
+    if client.tenant_store is not None:
+        return client.tenant_store.get_instance_id(customer_id)
+    return client.state_manager.get_instance_id()
+
+
+async def _cached_instance_id_async(
+    client: "AsyncReplicatedClient", customer_id: str
+) -> Optional[str]:
+    """Look up this machine's instance ID without blocking the event loop."""
+    if client.tenant_store is not None:
+        return await to_thread(client.tenant_store.get_instance_id, customer_id)
+    return await client.state.get_instance_id()
+
+
+async def _store_instance_id_async(
+    client: "AsyncReplicatedClient", customer_id: str, instance_id: str
+) -> None:
+    """Remember this machine's instance ID without blocking the event loop."""
+    if client.tenant_store is not None:
+        await to_thread(client.tenant_store.set_instance_id, customer_id, instance_id)
+    else:
+        await client.state.update(instance_id=instance_id)
+
+
+def _outbox_record(
+    instance: Union["Instance", "AsyncInstance"], op: str, **fields: Any
+) -> Dict[str, Any]:
+    """Build an outbox record, stamped with the time of the call."""
+    return {
+        "op": op,
+        "customer_id": instance.customer_id,
+        "instance_id": instance.instance_id,
+        "ts": time.time(),
+        **fields,
+    }
+
+
+def _store_instance_id(
+    client: Union["ReplicatedClient", "AsyncReplicatedClient"],
+    customer_id: str,
+    instance_id: str,
+) -> None:
+    """Remember this machine's instance ID for a customer."""
+    if client.tenant_store is not None:
+        client.tenant_store.set_instance_id(customer_id, instance_id)
+    else:
+        client.state_manager.set_instance_id(instance_id)
+
+
 class Customer:
     """Represents a Replicated customer."""
 
@@ -63,9 +179,136 @@ class Instance:
         self.customer_id = customer_id
         self.instance_id = instance_id
         self._data = kwargs
+        self._pending_patch: Dict[str, str] = {}
+        self._patch_lock = threading.Lock()
+        self._patch_timer: Optional[threading.Timer] = None
+        self.last_patch_error: Optional[BaseException] = None
+        self._reported: _ReportIndex = {}
+        self._report_lock = threading.Lock()
+
+    def send_metric(
+        self,
+        name: str,
+        value: Union[int, float, str],
+        timeout: Optional[float] = None,
+    ) -> Optional["Future[None]"]:
+        """Send a metric for this instance.
+
+        When the client was created with ``batching``, the metric is queued
+        and sent by the background flush thread instead. ``timeout`` bounds
+        the whole call in seconds: instance creation, retries and waiting
+        for room in the queue. With ``background`` set on the client, the
+        call returns a ``Future`` at once and runs on a worker thread.
+        """
+        self._reported.pop(name, None)
+        future = self._offload("send_metric", self.send_metric, name, value, timeout)
+        if future is not None:
+            return future
+        with within(timeout):
+            batcher = self._client._metric_batcher
+            if batcher is not None:
+                batcher.submit(self, name, value)
+                return None
+
+            self._post_metric(name, value)
+        return None
+
+    def report_metrics(
+        self,
+        snapshot: Mapping[str, Union[int, float, str]],
+        heartbeat: Optional[float] = DEFAULT_METRIC_HEARTBEAT,
+        timeout: Optional[float] = None,
+    ) -> Optional["Future[None]"]:
+        """Report the current value of every metric, sending only changes.
+
+        Metrics whose value differs from the one last reported through this
+        instance are sent, unchanged ones are re-sent once ``heartbeat``
+        seconds have passed (never if None), and metrics reported before
+        but missing from ``snapshot`` are deleted.
+        """
+        future = self._offload(
+            "report_metrics", self.report_metrics, snapshot, heartbeat, timeout
+        )
+        if future is not None:
+            return future
+        with within(timeout), self._report_lock:
+            changed, vanished = _diff_snapshot(
+                self._reported, snapshot, heartbeat, time.monotonic()
+            )
+            for name, value in changed:
+                self.send_metric(name, value)
+                # Batched metrics are indexed by the batcher once sent.
+                if self._client._metric_batcher is None:
+                    self._mark_reported(name, value)
+            for name in vanished:
+                self.delete_metric(name)
+        return None
+
+    def _mark_reported(self, name: str, value: Union[int, float, str]) -> None:
+        """Remember ``value`` as the last one sent for ``name``."""
+        self._reported[name] = (value, time.monotonic())
+
+    def counter(self, name: str) -> Counter:
+        """Return the counter ``name``, reported once per aggregation interval."""
+        return cast(Counter, self._aggregator(name, lambda: Counter(name), "counter"))
+
+    def gauge(self, name: str) -> Gauge:
+        """Return the gauge ``name``, reported once per aggregation interval."""
+        return cast(Gauge, self._aggregator(name, lambda: Gauge(name), "gauge"))
+
+    def histogram(
+        self, name: str, relative_accuracy: float = 0.01, max_buckets: int = 2048
+    ) -> Histogram:
+        """Return the histogram ``name``, summarized once per aggregation interval."""
+        return cast(
+            Histogram,
+            self._aggregator(
+                name,
+                lambda: Histogram(name, relative_accuracy, max_buckets),
+                "histogram",
+            ),
+        )
 
-    def send_metric(self, name: str, value: Union[int, float, str]) -> None:
-        """Send a metric for this instance."""
+    def record_samples(
+        self, name: str, samples: Iterable[float], relative_accuracy: float = 0.01
+    ) -> None:
+        """Add a batch of samples to the histogram ``name`` in one call."""
+        self.histogram(name, relative_accuracy).observe_many(samples)
+
+    def _aggregator(
+        self, name: str, factory: Callable[[], Aggregator], kind: str
+    ) -> Aggregator:
+        return self._client._aggregators_for(self).get(name, factory, kind)
+
+    def _offload(
+        self, operation: str, fn: Callable[..., Any], *args: Any
+    ) -> Optional["Future[None]"]:
+        """Hand a call to the client's worker pool in background mode.
+
+        The last of ``args`` is the call's timeout. Returns None when the
+        call should run here, including on the pool's own threads.
+        """
+        background = self._client._background
+        if background is None or background.in_worker():
+            return None
+        *call_args, timeout = args
+        return background.submit(operation, fn, *call_args, timeout=timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Send buffered metrics and pending updates.
+
+        Returns False if ``timeout`` expired before all metrics were sent.
+        """
+        self._flush_patch()
+        return self._client.flush(timeout)
+
+    def _post_metric(self, name: str, value: Union[int, float, str]) -> None:
+        """Send one metric, or spool it while the API is unreachable."""
+        record = _outbox_record(self, "metric", name=name, value=value)
+        self._send_or_spool(record, lambda: self._send_metric(name, value))
+
+    def _send_metric(self, name: str, value: Union[int, float, str]) -> None:
+        """Send one metric to the API."""
         if not self.instance_id:
             self._ensure_instance()
 
@@ -73,66 +316,191 @@ class Instance:
             "POST",
             f"/api/v1/instances/{self.instance_id}/metrics",
             json_data={"name": name, "value": value},
-            headers=self._client._get_auth_headers(),
+            headers=self._client._get_auth_headers(self.customer_id),
+            idempotent=True,
         )
 
-    def delete_metric(self, name: str) -> None:
+    def delete_metric(
+        self, name: str, timeout: Optional[float] = None
+    ) -> Optional["Future[None]"]:
         """Delete a metric for this instance."""
+        future = self._offload("delete_metric", self.delete_metric, name, timeout)
+        if future is not None:
+            return future
+        record = _outbox_record(self, "delete_metric", name=name)
+        with within(timeout):
+            self._send_or_spool(record, lambda: self._send_delete_metric(name))
+        self._reported.pop(name, None)
+        return None
+
+    def _send_delete_metric(self, name: str) -> None:
         if not self.instance_id:
             self._ensure_instance()
 
         self._client.http_client._make_request(
             "DELETE",
             f"/api/v1/instances/{self.instance_id}/metrics/{name}",
-            headers=self._client._get_auth_headers(),
+            headers=self._client._get_auth_headers(self.customer_id),
         )
 
-    def set_status(self, status: InstanceStatus) -> None:
+    def set_status(
+        self, status: InstanceStatus, timeout: Optional[float] = None
+    ) -> Optional["Future[None]"]:
         """Set the status of this instance."""
-        if not self.instance_id:
-            self._ensure_instance()
-
-        self._client.http_client._make_request(
-            "PATCH",
-            f"/api/v1/instances/{self.instance_id}",
-            json_data={"status": status.value},
-            headers=self._client._get_auth_headers(),
-        )
+        return self.update(status=status, timeout=timeout)
 
-    def set_version(self, version: str) -> None:
+    def set_version(
+        self, version: str, timeout: Optional[float] = None
+    ) -> Optional["Future[None]"]:
         """Set the version of this instance."""
+        return self.update(version=version, timeout=timeout)
+
+    def update(
+        self,
+        status: Optional[InstanceStatus] = None,
+        version: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional["Future[None]"]:
+        """Update the status and/or version of this instance in one PATCH.
+
+        When the client was created with ``patch_debounce``, updates made
+        within that many seconds are merged (last value wins per field)
+        and sent together from a timer thread. ``timeout`` bounds an
+        immediate PATCH in seconds, including retries.
+        """
+        future = self._offload("update", self.update, status, version, timeout)
+        if future is not None:
+            return future
+        fields = _patch_fields(status, version)
+        if not fields:
+            return None
+
+        debounce = self._client.patch_debounce
+        if not debounce:
+            with within(timeout):
+                self._patch(fields)
+            return None
+
+        with self._patch_lock:
+            self._pending_patch.update(fields)
+            if self._patch_timer is None:
+                self._patch_timer = threading.Timer(debounce, self._flush_patch)
+                self._patch_timer.daemon = True
+                self._patch_timer.start()
+                self._client._debounced_instances.add(self)
+        return None
+
+    def _flush_patch(self) -> None:
+        """Send the merged pending update, if any."""
+        with self._patch_lock:
+            fields, self._pending_patch = self._pending_patch, {}
+            timer, self._patch_timer = self._patch_timer, None
+        in_timer = timer is not None and timer is threading.current_thread()
+        if timer is not None and not in_timer:
+            timer.cancel()
+        if not fields:
+            return
+        try:
+            self._patch(fields)
+        except Exception as e:
+            if not in_timer:
+                raise
+            self.last_patch_error = e
+
+    def _patch(self, fields: Dict[str, str]) -> None:
+        """Send one PATCH, or spool it while the API is unreachable."""
+        record = _outbox_record(self, "patch", fields=fields)
+        self._send_or_spool(record, lambda: self._send_patch(fields))
+
+    def _send_patch(self, fields: Dict[str, str]) -> None:
+        """Send one PATCH for this instance."""
         if not self.instance_id:
             self._ensure_instance()
 
         self._client.http_client._make_request(
             "PATCH",
             f"/api/v1/instances/{self.instance_id}",
-            json_data={"version": version},
-            headers=self._client._get_auth_headers(),
+            json_data=fields,
+            headers=self._client._get_auth_headers(self.customer_id),
+            idempotent=True,
         )
 
+    def _send_or_spool(self, record: Dict[str, Any], send: Callable[[], None]) -> None:
+        """Send now, or append ``record`` to the outbox if the API is down.
+
+        Without an outbox this just sends. With one, a network failure
+        marks the outbox offline and later operations go straight to disk
+        until the replayer has drained it, so callers never wait on an
+        unreachable API more than once. The caller's own deadline passing
+        says nothing about the API, so that error is raised instead.
+        """
+        outbox = self._client._outbox
+        if outbox is None:
+            send()
+            return
+        if not outbox.offline:
+            try:
+                send()
+                return
+            except ReplicatedDeadlineExceededError:
+                raise  # The caller gave up; the API may be fine
+            except ReplicatedNetworkError:
+                outbox.offline = True
+        if record["instance_id"] is None:
+            record["instance_id"] = self.instance_id
+        outbox.append(record)
+        self._client._start_outbox_replay()
+
+    def _replay(self, record: Dict[str, Any]) -> None:
+        """Send an operation taken from the outbox."""
+        op = record["op"]
+        if op == "metric":
+            self._send_metric(record["name"], record["value"])
+        elif op == "delete_metric":
+            self._send_delete_metric(record["name"])
+        elif op == "patch":
+            self._send_patch(record["fields"])
+
     def _ensure_instance(self) -> None:
         """Ensure the instance exists and is cached."""
         if self.instance_id:
             return
 
-        # Check if instance ID is cached
-        cached_instance_id = self._client.state_manager.get_instance_id()
-        if cached_instance_id:
-            self.instance_id = cached_instance_id
+        # A cached ID needs no shared call (nor its deadline thread).
+        self.instance_id = _cached_instance_id(self._client, self.customer_id)
+        if self.instance_id:
             return
 
-        # Create new instance
-        fingerprint = get_machine_fingerprint()
-        response = self._client.http_client._make_request(
-            "POST",
-            f"/api/v1/customers/{self.customer_id}/instances",
-            json_data={"fingerprint": fingerprint},
-            headers=self._client._get_auth_headers(),
+        # Concurrent callers share one lookup/creation per customer.
+        self.instance_id = self._client._single_flight.do(
+            ("instance", self.customer_id), self._get_or_create_instance_id
         )
 
-        self.instance_id = response["id"]
-        self._client.state_manager.set_instance_id(self.instance_id)
+    def _get_or_create_instance_id(self) -> str:
+        """Return the cached instance ID or create a new instance."""
+        cached_instance_id = _cached_instance_id(self._client, self.customer_id)
+        if cached_instance_id:
+            return cached_instance_id
+
+        # Hold the creation lock so concurrent processes create one instance.
+        with self._client._creation_lock("instance", self.customer_id):
+            # Another process may have created it while we waited.
+            cached_instance_id = _cached_instance_id(self._client, self.customer_id)
+            if cached_instance_id:
+                return cached_instance_id
+
+            # Create new instance
+            fingerprint = self._client._get_fingerprint()
+            response = self._client.http_client._make_request(
+                "POST",
+                f"/api/v1/customers/{self.customer_id}/instances",
+                json_data={"fingerprint": fingerprint},
+                headers=self._client._get_auth_headers(self.customer_id),
+            )
+
+            instance_id: str = response["id"]
+            _store_instance_id(self._client, self.customer_id, instance_id)
+            return instance_id
 
     def __getattr__(self, name: str) -> Any:
         """Access additional instance data."""
@@ -153,9 +521,110 @@ class AsyncInstance:
         self.customer_id = customer_id
         self.instance_id = instance_id
         self._data = kwargs
+        self._pending_patch: Dict[str, str] = {}
+        self._patch_task: Optional["asyncio.Task[None]"] = None
+        self.last_patch_error: Optional[BaseException] = None
+        self._reported: _ReportIndex = {}
+        self._report_lock: Optional[asyncio.Lock] = None
+
+    async def send_metric(
+        self,
+        name: str,
+        value: Union[int, float, str],
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Send a metric for this instance.
+
+        When the client was created with ``batching``, the metric is queued
+        for the client's sender task instead. ``timeout`` bounds the whole
+        call in seconds: instance creation, retries and waiting for room in
+        the queue.
+        """
+        self._reported.pop(name, None)
+        with within(timeout):
+            if self._client.batching is not None:
+                await self._client._get_metric_batcher().submit(self, name, value)
+                return
+
+            await self._post_metric(name, value)
+
+    async def report_metrics(
+        self,
+        snapshot: Mapping[str, Union[int, float, str]],
+        heartbeat: Optional[float] = DEFAULT_METRIC_HEARTBEAT,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Report the current value of every metric, sending only changes.
+
+        See ``Instance.report_metrics``.
+        """
+        if self._report_lock is None:
+            self._report_lock = asyncio.Lock()
+        with within(timeout):
+            async with self._report_lock:
+                changed, vanished = _diff_snapshot(
+                    self._reported, snapshot, heartbeat, time.monotonic()
+                )
+                for name, value in changed:
+                    await self.send_metric(name, value)
+                    # Batched metrics are indexed by the batcher once sent.
+                    if self._client.batching is None:
+                        self._mark_reported(name, value)
+                for name in vanished:
+                    await self.delete_metric(name)
+
+    def _mark_reported(self, name: str, value: Union[int, float, str]) -> None:
+        """Remember ``value`` as the last one sent for ``name``."""
+        self._reported[name] = (value, time.monotonic())
+
+    def counter(self, name: str) -> Counter:
+        """Return the counter ``name``, reported once per aggregation interval."""
+        return cast(Counter, self._aggregator(name, lambda: Counter(name), "counter"))
+
+    def gauge(self, name: str) -> Gauge:
+        """Return the gauge ``name``, reported once per aggregation interval."""
+        return cast(Gauge, self._aggregator(name, lambda: Gauge(name), "gauge"))
+
+    def histogram(
+        self, name: str, relative_accuracy: float = 0.01, max_buckets: int = 2048
+    ) -> Histogram:
+        """Return the histogram ``name``, summarized once per aggregation interval."""
+        return cast(
+            Histogram,
+            self._aggregator(
+                name,
+                lambda: Histogram(name, relative_accuracy, max_buckets),
+                "histogram",
+            ),
+        )
 
-    async def send_metric(self, name: str, value: Union[int, float, str]) -> None:
-        """Send a metric for this instance."""
+    def record_samples(
+        self, name: str, samples: Iterable[float], relative_accuracy: float = 0.01
+    ) -> None:
+        """Add a batch of samples to the histogram ``name`` in one call."""
+        self.histogram(name, relative_accuracy).observe_many(samples)
+
+    def _aggregator(
+        self, name: str, factory: Callable[[], Aggregator], kind: str
+    ) -> Aggregator:
+        return self._client._aggregators_for(self).get(name, factory, kind)
+
+    def send_metric_nowait(self, name: str, value: Union[int, float, str]) -> bool:
+        """Queue a metric without suspending; returns False if it was dropped."""
+        return self._client._get_metric_batcher().submit_nowait(self, name, value)
+
+    async def drain(self) -> None:
+        """Wait until all queued metrics and pending updates have been sent."""
+        await self._flush_patch()
+        await self._client.drain()
+
+    async def _post_metric(self, name: str, value: Union[int, float, str]) -> None:
+        """Send one metric, or spool it while the API is unreachable."""
+        record = _outbox_record(self, "metric", name=name, value=value)
+        await self._send_or_spool(record, lambda: self._send_metric(name, value))
+
+    async def _send_metric(self, name: str, value: Union[int, float, str]) -> None:
+        """Send one metric to the API."""
         if not self.instance_id:
             await self._ensure_instance()
 
@@ -163,66 +632,178 @@ class AsyncInstance:
             "POST",
             f"/api/v1/instances/{self.instance_id}/metrics",
             json_data={"name": name, "value": value},
-            headers=self._client._get_auth_headers(),
+            headers=await self._client._get_auth_headers(self.customer_id),
+            idempotent=True,
         )
 
-    async def delete_metric(self, name: str) -> None:
+    async def delete_metric(self, name: str, timeout: Optional[float] = None) -> None:
         """Delete a metric for this instance."""
+        record = _outbox_record(self, "delete_metric", name=name)
+        with within(timeout):
+            await self._send_or_spool(record, lambda: self._send_delete_metric(name))
+        self._reported.pop(name, None)
+
+    async def _send_delete_metric(self, name: str) -> None:
         if not self.instance_id:
             await self._ensure_instance()
 
         await self._client.http_client._make_request_async(
             "DELETE",
             f"/api/v1/instances/{self.instance_id}/metrics/{name}",
-            headers=self._client._get_auth_headers(),
+            headers=await self._client._get_auth_headers(self.customer_id),
         )
 
-    async def set_status(self, status: InstanceStatus) -> None:
+    async def set_status(
+        self, status: InstanceStatus, timeout: Optional[float] = None
+    ) -> None:
         """Set the status of this instance."""
-        if not self.instance_id:
-            await self._ensure_instance()
+        await self.update(status=status, timeout=timeout)
 
-        await self._client.http_client._make_request_async(
-            "PATCH",
-            f"/api/v1/instances/{self.instance_id}",
-            json_data={"status": status.value},
-            headers=self._client._get_auth_headers(),
-        )
-
-    async def set_version(self, version: str) -> None:
+    async def set_version(self, version: str, timeout: Optional[float] = None) -> None:
         """Set the version of this instance."""
+        await self.update(version=version, timeout=timeout)
+
+    async def update(
+        self,
+        status: Optional[InstanceStatus] = None,
+        version: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Update the status and/or version of this instance in one PATCH.
+
+        When the client was created with ``patch_debounce``, updates made
+        within that many seconds are merged (last value wins per field)
+        and sent together by a background task. ``timeout`` bounds an
+        immediate PATCH in seconds, including retries.
+        """
+        fields = _patch_fields(status, version)
+        if not fields:
+            return
+
+        debounce = self._client.patch_debounce
+        if not debounce:
+            with within(timeout):
+                await self._patch(fields)
+            return
+
+        self._pending_patch.update(fields)
+        if self._patch_task is None:
+            self._patch_task = asyncio.ensure_future(self._debounced_patch(debounce))
+            self._client._debounced_instances.add(self)
+
+    async def _debounced_patch(self, delay: float) -> None:
+        clear_deadline()
+        await asyncio.sleep(delay)
+        self._patch_task = None
+        try:
+            await self._flush_patch()
+        except Exception as e:
+            self.last_patch_error = e
+
+    async def _flush_patch(self) -> None:
+        """Send the merged pending update, if any."""
+        task, self._patch_task = self._patch_task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        fields, self._pending_patch = self._pending_patch, {}
+        if fields:
+            await self._patch(fields)
+
+    async def _patch(self, fields: Dict[str, str]) -> None:
+        """Send one PATCH, or spool it while the API is unreachable."""
+        record = _outbox_record(self, "patch", fields=fields)
+        await self._send_or_spool(record, lambda: self._send_patch(fields))
+
+    async def _send_patch(self, fields: Dict[str, str]) -> None:
+        """Send one PATCH for this instance."""
         if not self.instance_id:
             await self._ensure_instance()
 
         await self._client.http_client._make_request_async(
             "PATCH",
             f"/api/v1/instances/{self.instance_id}",
-            json_data={"version": version},
-            headers=self._client._get_auth_headers(),
+            json_data=fields,
+            headers=await self._client._get_auth_headers(self.customer_id),
+            idempotent=True,
         )
 
+    async def _send_or_spool(
+        self, record: Dict[str, Any], send: Callable[[], Awaitable[None]]
+    ) -> None:
+        """Send now, or append ``record`` to the outbox if the API is down."""
+        outbox = self._client._outbox
+        if outbox is None:
+            await send()
+            return
+        if not outbox.offline:
+            try:
+                await send()
+                return
+            except ReplicatedDeadlineExceededError:
+                raise  # The caller gave up; the API may be fine
+            except ReplicatedNetworkError:
+                outbox.offline = True
+        if record["instance_id"] is None:
+            record["instance_id"] = self.instance_id
+        await to_thread(outbox.append, record)
+        self._client._start_outbox_replay()
+
+    async def _replay(self, record: Dict[str, Any]) -> None:
+        """Send an operation taken from the outbox."""
+        op = record["op"]
+        if op == "metric":
+            await self._send_metric(record["name"], record["value"])
+        elif op == "delete_metric":
+            await self._send_delete_metric(record["name"])
+        elif op == "patch":
+            await self._send_patch(record["fields"])
+
     async def _ensure_instance(self) -> None:
         """Ensure the instance exists and is cached."""
         if self.instance_id:
             return
 
-        # Check if instance ID is cached
-        cached_instance_id = self._client.state_manager.get_instance_id()
-        if cached_instance_id:
-            self.instance_id = cached_instance_id
+        # A cached ID needs no shared call.
+        self.instance_id = await _cached_instance_id_async(
+            self._client, self.customer_id
+        )
+        if self.instance_id:
             return
 
-        # Create new instance
-        fingerprint = get_machine_fingerprint()
-        response = await self._client.http_client._make_request_async(
-            "POST",
-            f"/api/v1/customers/{self.customer_id}/instances",
-            json_data={"fingerprint": fingerprint},
-            headers=self._client._get_auth_headers(),
+        # Concurrent callers share one lookup/creation per customer.
+        self.instance_id = await self._client._single_flight.do(
+            ("instance", self.customer_id), self._get_or_create_instance_id
         )
 
-        self.instance_id = response["id"]
-        self._client.state_manager.set_instance_id(self.instance_id)
+    async def _get_or_create_instance_id(self) -> str:
+        """Return the cached instance ID or create a new instance."""
+        cached_instance_id = await _cached_instance_id_async(
+            self._client, self.customer_id
+        )
+        if cached_instance_id:
+            return cached_instance_id
+
+        # Hold the creation lock so concurrent processes create one instance.
+        async with self._client._creation_lock("instance", self.customer_id):
+            # Another process may have created it while we waited.
+            cached_instance_id = await _cached_instance_id_async(
+                self._client, self.customer_id
+            )
+            if cached_instance_id:
+                return cached_instance_id
+
+            # Create new instance
+            fingerprint = await self._client._get_fingerprint()
+            response = await self._client.http_client._make_request_async(
+                "POST",
+                f"/api/v1/customers/{self.customer_id}/instances",
+                json_data={"fingerprint": fingerprint},
+                headers=await self._client._get_auth_headers(self.customer_id),
+            )
+
+            instance_id: str = response["id"]
+            await _store_instance_id_async(self._client, self.customer_id, instance_id)
+            return instance_id
 
     def __getattr__(self, name: str) -> Any:
         """Access additional instance data."""
@@ -0,0 +1,121 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Collection, Dict, Optional
+
+import httpx
+
+from .exceptions import ReplicatedError, ReplicatedNetworkError
+
+# Methods that can be repeated without changing the result on the server.
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Statuses whose Retry-After header is honored.
+RETRY_AFTER_STATUSES = frozenset({429, 503})
+
+
+class RetryPolicy:
+    """Controls how failed requests are retried.
+
+    Delays use decorrelated jitter: each delay is drawn uniformly between
+    ``base_delay`` and three times the previous delay, capped at
+    ``max_delay``, so clients that fail together do not retry together.
+    A ``Retry-After`` header on 429 and 503 responses replaces the drawn
+    delay; one asking for longer than ``max_delay`` ends the retries.
+    Only idempotent or idempotency-keyed requests are retried, except
+    for connection failures where the request never left.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        total_timeout: Optional[float] = None,
+        base_delay: float = 0.1,
+        max_delay: float = 10.0,
+        retry_statuses: Collection[int] = (429, 500, 502, 503, 504),
+    ) -> None:
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.total_timeout = total_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def is_retryable_error(
+        self, error: ReplicatedError, request_retryable: bool
+    ) -> bool:
+        """Whether ``error`` may be retried for the request that raised it."""
+        if isinstance(error, ReplicatedNetworkError):
+            if isinstance(error.__cause__, (httpx.ConnectError, httpx.ConnectTimeout)):
+                return True
+            return request_retryable
+        return request_retryable and error.http_status in self.retry_statuses
+
+    def backoff(self, previous_delay: float) -> float:
+        """Draw the next delay from the previous one."""
+        upper = max(self.base_delay, previous_delay * 3)
+        return min(self.max_delay, random.uniform(self.base_delay, upper))
+
+    def next_delay(
+        self,
+        error: ReplicatedError,
+        request_retryable: bool,
+        attempt: int,
+        previous_delay: float,
+        started: float,
+    ) -> Optional[float]:
+        """Return how long to wait before the next attempt, or None to give up.
+
+        ``attempt`` is the number of attempts made so far and ``started``
+        the ``time.monotonic()`` value when the first attempt began.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if not self.is_retryable_error(error, request_retryable):
+            return None
+
+        delay = self.backoff(previous_delay)
+        if error.http_status in RETRY_AFTER_STATUSES:
+            retry_after = parse_retry_after(error.headers)
+            if retry_after is not None:
+                if retry_after > self.max_delay:
+                    return None  # Retrying sooner would ignore the server
+                delay = retry_after
+
+        if self.total_timeout is not None:
+            if time.monotonic() - started + delay > self.total_timeout:
+                return None
+        return delay
+
+
+def parse_retry_after(headers: Optional[Dict[str, str]]) -> Optional[float]:
+    """Parse a ``Retry-After`` header given in seconds or as an HTTP date."""
+    if not headers:
+        return None
+    value = next((v for k, v in headers.items() if k.lower() == "retry-after"), None)
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def is_retryable_request(
+    method: str, idempotent: Optional[bool], idempotency_key: Optional[str]
+) -> bool:
+    """Whether a request is safe to send more than once."""
+    if idempotency_key:
+        return True
+    if idempotent is not None:
+        return idempotent
+    return method.upper() in IDEMPOTENT_METHODS
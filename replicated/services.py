@@ -1,11 +1,16 @@
 from typing import TYPE_CHECKING, Optional
 
+from .deadline import within
+from .log import get_logger
 from .resources import AsyncCustomer, Customer
+from .state import to_thread
 
 if TYPE_CHECKING:
     from .async_client import AsyncReplicatedClient
     from .client import ReplicatedClient
 
+logger = get_logger("services")
+
 
 class CustomerService:
     """Service for managing customers."""
@@ -18,29 +23,69 @@ class CustomerService:
         email_address: str,
         channel: Optional[str] = None,
         name: Optional[str] = None,
+        timeout: Optional[float] = None,
     ) -> Customer:
-        """Get or create a customer."""
-        # Check if customer ID is cached and email matches
-        cached_customer_id = self._client.state_manager.get_customer_id()
-        cached_email = self._client.state_manager.get_customer_email()
-
-        if cached_customer_id and cached_email == email_address:
-            print(
-                f"DEBUG: Using cached customer ID {cached_customer_id} "
-                f"for email {email_address}"
-            )
-            return Customer(
-                self._client,
-                cached_customer_id,
-                email_address,
-                channel,
-            )
-        elif cached_customer_id and cached_email != email_address:
-            print(
-                f"DEBUG: Email changed from {cached_email} to "
-                f"{email_address}, clearing cache"
+        """Get or create a customer.
+
+        ``timeout`` bounds the whole call in seconds, including retries.
+        """
+
+        def get_or_create_locked() -> Customer:
+            customer = self._cached(email_address, channel)
+            if customer is not None:
+                return customer
+            # Hold the creation lock across a second lookup and creation so
+            # that processes starting together create the customer once.
+            with self._client._creation_lock("customer", email_address):
+                return self._get_or_create(email_address, channel, name)
+
+        # A cached customer needs no shared call (nor its deadline thread).
+        customer = self._cached(email_address, channel)
+        if customer is not None:
+            return customer
+
+        # Concurrent callers for the same email share one lookup/creation.
+        with within(timeout):
+            return self._client._single_flight.do(
+                ("customer", email_address), get_or_create_locked
             )
-            self._client.state_manager.clear_state()
+
+    def _cached(self, email_address: str, channel: Optional[str]) -> Optional[Customer]:
+        """Return the customer if its ID is cached for this email."""
+        tenant_store = self._client.tenant_store
+        if tenant_store is not None:
+            record = tenant_store.get_customer(email_address)
+            cached_customer_id = record.customer_id if record else None
+            cached_email: Optional[str] = email_address
+        else:
+            cached_customer_id = self._client.state_manager.get_customer_id()
+            cached_email = self._client.state_manager.get_customer_email()
+
+        if not cached_customer_id or cached_email != email_address:
+            return None
+        logger.debug(
+            "Using cached customer ID %s for %s", cached_customer_id, email_address
+        )
+        return Customer(self._client, cached_customer_id, email_address, channel)
+
+    def _get_or_create(
+        self,
+        email_address: str,
+        channel: Optional[str],
+        name: Optional[str],
+    ) -> Customer:
+        customer = self._cached(email_address, channel)
+        if customer is not None:
+            return customer
+        if self._client.tenant_store is None:
+            cached_email = self._client.state_manager.get_customer_email()
+            if self._client.state_manager.get_customer_id():
+                logger.debug(
+                    "Email changed from %s to %s, clearing cache",
+                    cached_email,
+                    email_address,
+                )
+                self._client.state_manager.clear_state()
 
         # Create or fetch customer
         response = self._client.http_client._make_request(
@@ -53,21 +98,27 @@ class CustomerService:
                 "app_slug": self._client.app_slug,
             },
             headers=self._client._get_auth_headers(),
+            # Looked up by email, so repeating the request is harmless.
+            idempotent=True,
         )
 
-        print(f"DEBUG: API Response: {response}")
         customer_id = response["customer"]["id"]
-        self._client.state_manager.set_customer_id(customer_id)
-        self._client.state_manager.set_customer_email(email_address)
+        logger.debug("Got customer %s for %s", customer_id, email_address)
+        fields = {"customer_id": customer_id, "customer_email": email_address}
 
         # Store dynamic token if provided
         if "dynamic_token" in response:
-            dynamic_token = response["dynamic_token"]
-            self._client.state_manager.set_dynamic_token(dynamic_token)
+            fields["dynamic_token"] = response["dynamic_token"]
         elif "customer" in response and "serviceToken" in response["customer"]:
             service_token = response["customer"]["serviceToken"]
-            self._client.state_manager.set_dynamic_token(service_token)
-            print(f"DEBUG: Stored service token: {service_token[:20]}...")
+            fields["dynamic_token"] = service_token
+
+        if self._client.tenant_store is not None:
+            self._client.tenant_store.put_customer(
+                email_address, customer_id, fields.get("dynamic_token")
+            )
+        else:
+            self._client.state_manager.update(**fields)
 
         response_data = response.copy()
         response_data.pop("email_address", None)
@@ -92,29 +143,71 @@ class AsyncCustomerService:
         email_address: str,
         channel: Optional[str] = None,
         name: Optional[str] = None,
+        timeout: Optional[float] = None,
     ) -> AsyncCustomer:
-        """Get or create a customer."""
-        # Check if customer ID is cached and email matches
-        cached_customer_id = self._client.state_manager.get_customer_id()
-        cached_email = self._client.state_manager.get_customer_email()
-
-        if cached_customer_id and cached_email == email_address:
-            print(
-                f"DEBUG: Using cached customer ID {cached_customer_id} "
-                f"for email {email_address}"
-            )
-            return AsyncCustomer(
-                self._client,
-                cached_customer_id,
-                email_address,
-                channel,
-            )
-        elif cached_customer_id and cached_email != email_address:
-            print(
-                f"DEBUG: Email changed from {cached_email} to "
-                f"{email_address}, clearing cache"
+        """Get or create a customer.
+
+        ``timeout`` bounds the whole call in seconds, including retries.
+        """
+
+        async def get_or_create_locked() -> AsyncCustomer:
+            customer = await self._cached(email_address, channel)
+            if customer is not None:
+                return customer
+            # Hold the creation lock across a second lookup and creation so
+            # that processes starting together create the customer once.
+            async with self._client._creation_lock("customer", email_address):
+                return await self._get_or_create(email_address, channel, name)
+
+        # A cached customer needs no shared call.
+        customer = await self._cached(email_address, channel)
+        if customer is not None:
+            return customer
+
+        # Concurrent callers for the same email share one lookup/creation.
+        with within(timeout):
+            return await self._client._single_flight.do(
+                ("customer", email_address), get_or_create_locked
             )
-            self._client.state_manager.clear_state()
+
+    async def _cached(
+        self, email_address: str, channel: Optional[str]
+    ) -> Optional[AsyncCustomer]:
+        """Return the customer if its ID is cached for this email."""
+        tenant_store = self._client.tenant_store
+        if tenant_store is not None:
+            record = await to_thread(tenant_store.get_customer, email_address)
+            cached_customer_id = record.customer_id if record else None
+            cached_email: Optional[str] = email_address
+        else:
+            cached_customer_id = await self._client.state.get_customer_id()
+            cached_email = await self._client.state.get_customer_email()
+
+        if not cached_customer_id or cached_email != email_address:
+            return None
+        logger.debug(
+            "Using cached customer ID %s for %s", cached_customer_id, email_address
+        )
+        return AsyncCustomer(self._client, cached_customer_id, email_address, channel)
+
+    async def _get_or_create(
+        self,
+        email_address: str,
+        channel: Optional[str],
+        name: Optional[str],
+    ) -> AsyncCustomer:
+        customer = await self._cached(email_address, channel)
+        if customer is not None:
+            return customer
+        if self._client.tenant_store is None:
+            cached_email = await self._client.state.get_customer_email()
+            if await self._client.state.get_customer_id():
+                logger.debug(
+                    "Email changed from %s to %s, clearing cache",
+                    cached_email,
+                    email_address,
+                )
+                await self._client.state.clear_state()
 
         # Create or fetch customer
         response = await self._client.http_client._make_request_async(
@@ -126,22 +219,31 @@ class AsyncCustomerService:
                 "name": name,
                 "app_slug": self._client.app_slug,
             },
-            headers=self._client._get_auth_headers(),
+            headers=await self._client._get_auth_headers(),
+            # Looked up by email, so repeating the request is harmless.
+            idempotent=True,
         )
 
-        print(f"DEBUG: API Response: {response}")
         customer_id = response["customer"]["id"]
-        self._client.state_manager.set_customer_id(customer_id)
-        self._client.state_manager.set_customer_email(email_address)
+        logger.debug("Got customer %s for %s", customer_id, email_address)
+        fields = {"customer_id": customer_id, "customer_email": email_address}
 
         # Store dynamic token if provided
         if "dynamic_token" in response:
-            dynamic_token = response["dynamic_token"]
-            self._client.state_manager.set_dynamic_token(dynamic_token)
+            fields["dynamic_token"] = response["dynamic_token"]
         elif "customer" in response and "serviceToken" in response["customer"]:
             service_token = response["customer"]["serviceToken"]
-            self._client.state_manager.set_dynamic_token(service_token)
-            print(f"DEBUG: Stored service token: {service_token[:20]}...")
+            fields["dynamic_token"] = service_token
+
+        if self._client.tenant_store is not None:
+            await to_thread(
+                self._client.tenant_store.put_customer,
+                email_address,
+                customer_id,
+                fields.get("dynamic_token"),
+            )
+        else:
+            await self._client.state.update(**fields)
 
         response_data = response.copy()
         response_data.pop("email_address", None)
@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+import threading
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Optional,
+    TypeVar,
+    cast,
+)
+
+from .deadline import cap_timeout, clear_deadline, time_remaining
+from .exceptions import ReplicatedDeadlineExceededError
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    """An in-progress call that other threads can wait on."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time across threads.
+
+    The first caller for a key starts the function; callers arriving while
+    it is in progress share its result or exception. The shared call runs
+    without any caller's deadline, so one caller's short deadline cannot
+    fail the others; each caller, the first included, waits for no longer
+    than its own deadline.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call[Any]] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            if time_remaining() is None:
+                self._run(key, call, fn)
+            else:
+                # Run on a thread of its own so the leader can stop waiting
+                # at its deadline while the call goes on for the others.
+                context = contextvars.copy_context()
+                threading.Thread(
+                    target=context.run,
+                    args=(self._run_detached, key, call, fn),
+                    name="replicated-singleflight",
+                    daemon=True,
+                ).start()
+
+        if not call.done.wait(cap_timeout(None)):
+            raise ReplicatedDeadlineExceededError(
+                "Deadline exceeded waiting on a shared call"
+            )
+        if call.error is not None:
+            raise call.error
+        return cast(T, call.result)
+
+    def _run_detached(
+        self, key: Hashable, call: "_Call[T]", fn: Callable[[], T]
+    ) -> None:
+        clear_deadline()
+        self._run(key, call, fn)
+
+    def _run(self, key: Hashable, call: "_Call[T]", fn: Callable[[], T]) -> None:
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """Runs at most one coroutine per key at a time on an event loop.
+
+    The first caller for a key starts the coroutine as a task without any
+    caller's deadline; every caller awaits the shared task for its result
+    or exception, for no longer than its own deadline.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[Hashable, "asyncio.Task[Any]"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._run(key, fn))
+            # Every caller may have given up; mark the exception as retrieved.
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._tasks[key] = task
+
+        # Shield so a cancelled caller does not cancel the shared call.
+        left = cap_timeout(None)
+        if left is None:
+            return cast(T, await asyncio.shield(task))
+        try:
+            return cast(T, await asyncio.wait_for(asyncio.shield(task), left))
+        except asyncio.TimeoutError:
+            raise ReplicatedDeadlineExceededError(
+                "Deadline exceeded waiting on a shared call"
+            ) from None
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        clear_deadline()
+        try:
+            return await fn()
+        finally:
+            del self._tasks[key]
@@ -1,18 +1,77 @@
+import asyncio
+import functools
+import hashlib
 import json
 import os
 import platform
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+# Key locks are spread over this many lock files, so unrelated keys rarely
+# wait on each other while the number of files stays bounded.
+KEY_LOCK_STRIPES = 1024
+
+# (st_ino, st_mtime_ns, st_size) of the state file the cache was loaded from.
+_FileKey = Tuple[int, int, int]
+
+T = TypeVar("T")
+
+
+async def to_thread(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run blocking ``fn`` in the default executor, off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
 
 
 class StateManager:
-    """Manages local SDK state for idempotency and caching."""
+    """Manages local SDK state for idempotency and caching.
+
+    State is kept in memory and written through to disk on every change.
+    Reads only ``stat`` the state file to detect changes made by other
+    processes, and reload it when its inode, mtime or size differ.
+
+    Writes replace the file atomically (temp file, fsync, rename) while
+    holding an advisory ``fcntl`` lock, so concurrent processes never see
+    a torn file or lose each other's updates.
+    """
 
     def __init__(self, app_slug: str) -> None:
         self.app_slug = app_slug
         self._state_dir = self._get_state_directory()
         self._state_file = self._state_dir / "state.json"
         self._ensure_state_dir()
+        self._cache: Optional[Dict[str, Any]] = None
+        # Bumped whenever the in-memory state changes, by a write here or
+        # a reload after another process changed the file.
+        self.generation = 0
+        self._cache_key: Optional[_FileKey] = None
+        self._lock_file = self._state_dir / "state.json.lock"
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_fd: Optional[int] = None
+
+    @property
+    def state_dir(self) -> Path:
+        """Directory holding this app's state files."""
+        return self._state_dir
 
     def _get_state_directory(self) -> Path:
         """Get the platform-specific state directory."""
@@ -40,73 +99,347 @@ class StateManager:
         """Ensure the state directory exists."""
         self._state_dir.mkdir(parents=True, exist_ok=True)
 
+    def _file_key(self) -> Optional[_FileKey]:
+        """Identify the current version of the state file with one stat."""
+        try:
+            st = os.stat(self._state_file)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read_state(self) -> Dict[str, Any]:
+        """Read and parse the state file from disk."""
+        try:
+            with open(self._state_file, "r") as f:
+                data = json.load(f)
+                return data if isinstance(data, dict) else {}
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+    def _load(self) -> Dict[str, Any]:
+        """Return the cached state, reloading it if the file has changed."""
+        key = self._file_key()
+        if self._cache is None or key != self._cache_key:
+            self._cache = self._read_state() if key is not None else {}
+            self._cache_key = key
+            self.generation += 1
+        return self._cache
+
     def get_state(self) -> Dict[str, Any]:
         """Get the current state."""
-        if self._state_file.exists():
+        return dict(self._load())
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Hold the cross-process state lock.
+
+        The lock is re-entrant within a thread, so ``update`` and the
+        setters can be called while it is held.
+        """
+        with self._lock:
+            if self._lock_depth == 0:
+                self._lock_fd = self._acquire_file_lock(self._lock_file)
+            self._lock_depth += 1
             try:
-                with open(self._state_file, "r") as f:
-                    data = json.load(f)
-                    return data if isinstance(data, dict) else {}
-            except (json.JSONDecodeError, OSError):
-                pass
-        return {}
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_fd is not None:
+                    self._release_file_lock(self._lock_fd)
+                    self._lock_fd = None
 
-    def save_state(self, state: Dict[str, Any]) -> None:
-        """Save state to disk."""
+    @contextmanager
+    def key_lock(self, key: str) -> Iterator[None]:
+        """Hold a cross-process lock for ``key``, separate from the state lock.
+
+        Used to create one customer or instance at a time per key without
+        making unrelated keys, or state reads and writes, wait.
+        """
+        fd = self.acquire_key_lock(key)
         try:
-            with open(self._state_file, "w") as f:
+            yield
+        finally:
+            self.release_key_lock(fd)
+
+    def acquire_key_lock(self, key: str) -> Optional[int]:
+        """Block until the lock for ``key`` is held; pass the result to release."""
+        digest = hashlib.sha256(key.encode()).digest()
+        stripe = int.from_bytes(digest[:4], "big") % KEY_LOCK_STRIPES
+        locks_dir = self._state_dir / "locks"
+        locks_dir.mkdir(exist_ok=True)
+        return self._acquire_file_lock(locks_dir / f"{stripe:04d}.lock")
+
+    def release_key_lock(self, fd: Optional[int]) -> None:
+        if fd is not None:
+            self._release_file_lock(fd)
+
+    def _acquire_file_lock(self, path: Path) -> Optional[int]:
+        """Take an exclusive advisory lock on the lock file at ``path``."""
+        if fcntl is None:
+            return None
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError:
+            return None  # Fall back to in-process locking only
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _release_file_lock(self, fd: int) -> None:
+        """Release a lock taken by ``_acquire_file_lock``."""
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _write_state(self, state: Dict[str, Any]) -> None:
+        """Atomically replace the state file with ``state``."""
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=".state.", suffix=".tmp", dir=self._state_dir
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
                 json.dump(state, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._state_file)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._fsync_state_dir()
+
+    def _fsync_state_dir(self) -> None:
+        """Persist the rename itself; not supported on every platform."""
+        try:
+            dir_fd = os.open(self._state_dir, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+    def _save_locked(self, state: Dict[str, Any]) -> None:
+        """Write ``state`` through to disk; the caller holds the lock."""
+        try:
+            self._write_state(state)
         except OSError:
             pass  # Silently ignore write errors
+        # Keep serving the new state from memory even if the write failed.
+        self._cache = dict(state)
+        self._cache_key = self._file_key()
+        self.generation += 1
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Save state to disk."""
+        with self.lock():
+            self._save_locked(state)
+
+    def update(self, **fields: Any) -> None:
+        """Set several fields in one locked read-modify-write.
+
+        Fields passed as ``None`` are removed from the state.
+        """
+        with self.lock():
+            state = dict(self._load())
+            for key, value in fields.items():
+                if value is None:
+                    state.pop(key, None)
+                else:
+                    state[key] = value
+            self._save_locked(state)
 
     def get_customer_id(self) -> Optional[str]:
         """Get the cached customer ID."""
-        state = self.get_state()
-        return state.get("customer_id")
+        return self._load().get("customer_id")
 
     def set_customer_id(self, customer_id: str) -> None:
         """Set the customer ID in state."""
-        state = self.get_state()
-        state["customer_id"] = customer_id
-        self.save_state(state)
+        self.update(customer_id=customer_id)
 
     def get_instance_id(self) -> Optional[str]:
         """Get the cached instance ID."""
-        state = self.get_state()
-        return state.get("instance_id")
+        return self._load().get("instance_id")
 
     def set_instance_id(self, instance_id: str) -> None:
         """Set the instance ID in state."""
-        state = self.get_state()
-        state["instance_id"] = instance_id
-        self.save_state(state)
+        self.update(instance_id=instance_id)
 
     def get_dynamic_token(self) -> Optional[str]:
         """Get the cached dynamic client token."""
-        state = self.get_state()
-        return state.get("dynamic_token")
+        return self._load().get("dynamic_token")
 
     def set_dynamic_token(self, token: str) -> None:
         """Set the dynamic client token in state."""
-        state = self.get_state()
-        state["dynamic_token"] = token
-        self.save_state(state)
+        self.update(dynamic_token=token)
 
     def get_customer_email(self) -> Optional[str]:
         """Get the cached customer email."""
-        state = self.get_state()
-        return state.get("customer_email")
+        return self._load().get("customer_email")
 
     def set_customer_email(self, email: str) -> None:
         """Set the customer email in state."""
-        state = self.get_state()
-        state["customer_email"] = email
-        self.save_state(state)
+        self.update(customer_email=email)
+
+    def get_fingerprint(self) -> Optional[str]:
+        """Get the persisted machine fingerprint."""
+        return self._load().get("fingerprint")
+
+    def set_fingerprint(self, fingerprint: str) -> None:
+        """Persist the machine fingerprint in state."""
+        self.update(fingerprint=fingerprint)
 
     def clear_state(self) -> None:
         """Clear all cached state."""
-        if self._state_file.exists():
-            try:
-                self._state_file.unlink()
-            except OSError:
-                pass
+        with self.lock():
+            if self._state_file.exists():
+                try:
+                    self._state_file.unlink()
+                except OSError:
+                    pass
+            self._cache = {}
+            self._cache_key = self._file_key()
+            self.generation += 1
+
+
+class AsyncStateManager:
+    """Event-loop friendly front end for a ``StateManager``.
+
+    Reads are served from memory. The state file is checked for changes
+    made by other processes at most every ``refresh_interval`` seconds,
+    and that check runs in a worker thread. Updates apply to memory at
+    once and are written by a single writer task; updates made while a
+    write is in flight are coalesced into the next one.
+    """
+
+    def __init__(self, manager: StateManager, refresh_interval: float = 1.0) -> None:
+        self.manager = manager
+        self.refresh_interval = refresh_interval
+        self._state: Optional[Dict[str, Any]] = None
+        self._loaded_at = 0.0
+        self._pending: Dict[str, Any] = {}
+        self._writer: Optional["asyncio.Task[None]"] = None
+        self._io_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def state_dir(self) -> Path:
+        """Directory holding this app's state files."""
+        return self.manager.state_dir
+
+    async def get_state(self) -> Dict[str, Any]:
+        """Get the current state."""
+        return dict(await self._load())
+
+    def expire(self) -> None:
+        """Make the next read check the state file for changes."""
+        self._loaded_at = float("-inf")
+
+    @asynccontextmanager
+    async def key_lock(self, key: str) -> AsyncIterator[None]:
+        """Hold ``StateManager.key_lock``, waiting for it in a worker thread."""
+        loop = asyncio.get_running_loop()
+        acquire = loop.run_in_executor(None, self.manager.acquire_key_lock, key)
+        try:
+            fd = await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # The thread keeps waiting; release the lock once it gets it.
+            acquire.add_done_callback(self._release_acquired)
+            raise
+        try:
+            yield
+        finally:
+            self.manager.release_key_lock(fd)  # Unlocking never blocks
+
+    def _release_acquired(self, acquire: "asyncio.Future[Optional[int]]") -> None:
+        if not acquire.cancelled() and acquire.exception() is None:
+            self.manager.release_key_lock(acquire.result())
+
+    def _stale(self) -> bool:
+        elapsed = time.monotonic() - self._loaded_at
+        return self._state is None or elapsed >= self.refresh_interval
+
+    def _get_io_lock(self) -> asyncio.Lock:
+        # Created lazily so it binds to the loop the client is used on.
+        if self._io_lock is None:
+            self._io_lock = asyncio.Lock()
+        return self._io_lock
+
+    async def _load(self) -> Dict[str, Any]:
+        """Return the in-memory state, refreshing it if it is stale."""
+        if self._stale():
+            # Refreshes and writes take turns, so a refresh never reads
+            # the file from before a write and then hides that write.
+            async with self._get_io_lock():
+                if self._stale():
+                    state = await to_thread(self.manager.get_state)
+                    # Updates not yet on disk win over what was read.
+                    for key, value in self._pending.items():
+                        _apply(state, key, value)
+                    self._state = state
+                    self._loaded_at = time.monotonic()
+        assert self._state is not None
+        return self._state
+
+    async def update(self, **fields: Any) -> None:
+        """Set several fields; ``None`` removes a field.
+
+        Returns once the change has been written to disk.
+        """
+        state = await self._load()
+        for key, value in fields.items():
+            _apply(state, key, value)
+        self._pending.update(fields)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write_pending())
+        await asyncio.shield(self._writer)
+
+    async def _write_pending(self) -> None:
+        async with self._get_io_lock():
+            while self._pending:
+                fields, self._pending = self._pending, {}
+                await to_thread(self.manager.update, **fields)
+
+    async def clear_state(self) -> None:
+        """Clear all cached state."""
+        if self._writer is not None:
+            await asyncio.shield(self._writer)
+        async with self._get_io_lock():
+            self._pending = {}
+            self._state = {}
+            self._loaded_at = time.monotonic()
+            await to_thread(self.manager.clear_state)
+
+    async def get_customer_id(self) -> Optional[str]:
+        """Get the cached customer ID."""
+        return (await self._load()).get("customer_id")
+
+    async def get_instance_id(self) -> Optional[str]:
+        """Get the cached instance ID."""
+        return (await self._load()).get("instance_id")
+
+    async def get_dynamic_token(self) -> Optional[str]:
+        """Get the cached dynamic client token."""
+        return (await self._load()).get("dynamic_token")
+
+    async def get_customer_email(self) -> Optional[str]:
+        """Get the cached customer email."""
+        return (await self._load()).get("customer_email")
+
+    async def get_fingerprint(self) -> Optional[str]:
+        """Get the persisted machine fingerprint."""
+        return (await self._load()).get("fingerprint")
+
+
+def _apply(state: Dict[str, Any], key: str, value: Any) -> None:
+    if value is None:
+        state.pop(key, None)
+    else:
+        state[key] = value
@@ -0,0 +1,191 @@
+import bisect
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .exceptions import ReplicatedError
+from .log import get_logger
+
+logger = get_logger("hooks")
+
+# Upper bounds, in seconds, of the latency histogram buckets. A final
+# bucket counts everything slower than the last bound.
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+HOOK_EVENTS = ("on_request_start", "on_request_end", "on_error", "on_retry")
+
+
+class RequestInfo:
+    """One HTTP request attempt, as passed to hooks.
+
+    ``endpoint`` is the method and rate-limit route (e.g. ``"POST
+    metrics"``), which groups requests whose URLs differ only by IDs.
+    ``elapsed``, ``status``, the byte counts and ``error`` are filled in
+    when the attempt ends; ``bytes_saved`` is how much compression shrank
+    the body. ``retry_delay`` is set for ``on_retry``.
+    """
+
+    __slots__ = (
+        "method",
+        "url",
+        "endpoint",
+        "attempt",
+        "started",
+        "elapsed",
+        "status",
+        "bytes_sent",
+        "bytes_received",
+        "bytes_saved",
+        "error",
+        "retry_delay",
+    )
+
+    def __init__(self, method: str, url: str, endpoint: str, attempt: int) -> None:
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint
+        self.attempt = attempt
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.status: Optional[int] = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.bytes_saved = 0
+        self.error: Optional[ReplicatedError] = None
+        self.retry_delay: Optional[float] = None
+
+
+Hook = Callable[[RequestInfo], None]
+
+
+class Hooks:
+    """Callbacks run around each request attempt.
+
+    A hook that raises is logged and otherwise ignored, so it can never
+    fail the request it observes.
+    """
+
+    def __init__(self) -> None:
+        self._hooks: Dict[str, List[Hook]] = {event: [] for event in HOOK_EVENTS}
+
+    def add(self, event: str, hook: Hook) -> None:
+        if event not in self._hooks:
+            raise ValueError(f"unknown hook event {event!r}")
+        # Replace rather than append so emit never sees a list mid-change.
+        self._hooks[event] = self._hooks[event] + [hook]
+
+    def remove(self, event: str, hook: Hook) -> None:
+        self._hooks[event] = [h for h in self._hooks[event] if h != hook]
+
+    def emit(self, event: str, info: RequestInfo) -> None:
+        for hook in self._hooks[event]:
+            try:
+                hook(info)
+            except Exception:
+                logger.exception("%s hook %r failed", event, hook)
+
+
+class EndpointStats:
+    """Counters and a latency histogram for one endpoint."""
+
+    __slots__ = (
+        "requests",
+        "errors",
+        "retries",
+        "bytes_sent",
+        "bytes_received",
+        "bytes_saved",
+        "latency_sum",
+        "buckets",
+        "errors_by_type",
+    )
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.bytes_saved = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.errors_by_type: Dict[str, int] = {}
+
+    def snapshot(self) -> Dict[str, Any]:
+        bounds: List[Any] = list(LATENCY_BUCKETS) + ["+Inf"]
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "bytes_saved": self.bytes_saved,
+            "errors_by_type": dict(self.errors_by_type),
+            "latency": {
+                "count": self.requests,
+                "sum": self.latency_sum,
+                "buckets": list(zip(bounds, self.buckets)),
+            },
+        }
+
+
+class RequestStats:
+    """Always-on request counters and latency histograms per endpoint.
+
+    Recording an attempt is a few integer updates under a lock; the
+    histogram has fixed buckets, so memory does not grow with traffic.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, EndpointStats] = {}
+
+    def _get(self, endpoint: str) -> EndpointStats:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = EndpointStats()
+        return stats
+
+    def record(self, info: RequestInfo) -> None:
+        """Count a finished attempt."""
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, info.elapsed)
+        with self._lock:
+            stats = self._get(info.endpoint)
+            stats.requests += 1
+            stats.bytes_sent += info.bytes_sent
+            stats.bytes_received += info.bytes_received
+            stats.bytes_saved += info.bytes_saved
+            stats.latency_sum += info.elapsed
+            stats.buckets[bucket] += 1
+            if info.error is not None:
+                stats.errors += 1
+                name = type(info.error).__name__
+                stats.errors_by_type[name] = stats.errors_by_type.get(name, 0) + 1
+
+    def record_retry(self, info: RequestInfo) -> None:
+        with self._lock:
+            self._get(info.endpoint).retries += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return a copy of the counters, keyed by endpoint."""
+        with self._lock:
+            return {
+                endpoint: stats.snapshot()
+                for endpoint, stats in sorted(self._endpoints.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
@@ -0,0 +1,190 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Generic, Hashable, NamedTuple, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """A fixed-capacity mapping that evicts the least recently used entry."""
+
+    def __init__(self, capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._data: "OrderedDict[K, V]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> Optional[V]:
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return None
+        return self._data[key]
+
+    def put(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        self._data.pop(key, None)
+
+
+class CustomerRecord(NamedTuple):
+    """A customer known to the tenant store."""
+
+    customer_id: str
+    email_address: str
+    dynamic_token: Optional[str]
+
+
+class TenantStore:
+    """State for many customers and their instances, keyed by email.
+
+    Records live in a SQLite database next to ``state.json``, indexed by
+    customer email and customer ID, with an in-memory LRU tier in front
+    so repeated lookups never touch disk. Unlike the single-customer
+    state file, switching between customers never clears anything.
+
+    The LRU tier is per process: a record changed by another process is
+    seen once it falls out of this process's cache.
+    """
+
+    def __init__(self, path: Path, cache_size: int = 4096) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(path), timeout=30.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS customers (
+                email_address TEXT PRIMARY KEY,
+                customer_id TEXT NOT NULL,
+                dynamic_token TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS customers_by_id ON customers (customer_id);
+            CREATE TABLE IF NOT EXISTS instances (
+                customer_id TEXT PRIMARY KEY,
+                instance_id TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            """)
+        self._by_email: LRUCache[str, CustomerRecord] = LRUCache(cache_size)
+        self._by_id: LRUCache[str, CustomerRecord] = LRUCache(cache_size)
+        self._instances: LRUCache[str, str] = LRUCache(cache_size)
+
+    def get_customer(self, email_address: str) -> Optional[CustomerRecord]:
+        """Look up a customer by email."""
+        with self._lock:
+            record = self._by_email.get(email_address)
+            if record is None:
+                row = self._conn.execute(
+                    "SELECT customer_id, email_address, dynamic_token "
+                    "FROM customers WHERE email_address = ?",
+                    (email_address,),
+                ).fetchone()
+                if row is None:
+                    return None
+                record = CustomerRecord(*row)
+                self._remember(record)
+            return record
+
+    def get_customer_by_id(self, customer_id: str) -> Optional[CustomerRecord]:
+        """Look up a customer by customer ID."""
+        with self._lock:
+            record = self._by_id.get(customer_id)
+            if record is None:
+                row = self._conn.execute(
+                    "SELECT customer_id, email_address, dynamic_token "
+                    "FROM customers WHERE customer_id = ?",
+                    (customer_id,),
+                ).fetchone()
+                if row is None:
+                    return None
+                record = CustomerRecord(*row)
+                self._remember(record)
+            return record
+
+    def cached_customer_by_id(self, customer_id: str) -> Optional[CustomerRecord]:
+        """Look up a customer in the LRU tier only.
+
+        Never reads the database or waits for another thread, so it is
+        safe on an event loop; a miss (or a busy store) returns None.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self._by_id.get(customer_id)
+        finally:
+            self._lock.release()
+
+    def put_customer(
+        self,
+        email_address: str,
+        customer_id: str,
+        dynamic_token: Optional[str] = None,
+    ) -> None:
+        """Insert or replace a customer record."""
+        record = CustomerRecord(customer_id, email_address, dynamic_token)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO customers "
+                "(email_address, customer_id, dynamic_token, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (email_address, customer_id, dynamic_token, time.time()),
+            )
+            self._remember(record)
+
+    def get_dynamic_token(self, customer_id: str) -> Optional[str]:
+        """Get the dynamic token stored for a customer."""
+        record = self.get_customer_by_id(customer_id)
+        return record.dynamic_token if record else None
+
+    def get_instance_id(self, customer_id: str) -> Optional[str]:
+        """Get this machine's instance ID for a customer."""
+        with self._lock:
+            instance_id = self._instances.get(customer_id)
+            if instance_id is None:
+                row = self._conn.execute(
+                    "SELECT instance_id FROM instances WHERE customer_id = ?",
+                    (customer_id,),
+                ).fetchone()
+                if row is None:
+                    return None
+                instance_id = row[0]
+                self._instances.put(customer_id, instance_id)
+            return instance_id
+
+    def set_instance_id(self, customer_id: str, instance_id: str) -> None:
+        """Store this machine's instance ID for a customer."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO instances "
+                "(customer_id, instance_id, updated_at) VALUES (?, ?, ?)",
+                (customer_id, instance_id, time.time()),
+            )
+            self._instances.put(customer_id, instance_id)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _remember(self, record: CustomerRecord) -> None:
+        """Add a record to the LRU tier; caller holds the lock."""
+        previous = self._by_email.get(record.email_address)
+        if previous is not None and previous.customer_id != record.customer_id:
+            self._by_id.pop(previous.customer_id)
+        self._by_email.put(record.email_address, record)
+        self._by_id.put(record.customer_id, record)
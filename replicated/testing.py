@@ -0,0 +1,516 @@
+"""A fake Replicated API for exercising the SDK without a network.
+
+``FakeReplicatedAPI`` is an ASGI app implementing the endpoints the SDK
+calls, with configurable latency and fault injection, that records every
+request it receives. Use it in-process with ``httpx.ASGITransport``
+(async clients only), or serve it on a local port with
+``FakeReplicatedServer`` and point any client's ``base_url`` at it::
+
+    api = FakeReplicatedAPI(latency=0.01)
+    api.rate_limit(count=3, retry_after=0.5)
+    with FakeReplicatedServer(api) as server:
+        client = ReplicatedClient("pk_test", "my-app", base_url=server.url)
+        ...
+    assert len(api.requests_to("POST", "/v3/customer")) == 1
+"""
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+import httpx
+
+from .compression import ENCODINGS, decompress
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+Latency = Union[float, Callable[[], float]]
+
+_INSTANCES = re.compile(r"^/api/v1/customers/([^/]+)/instances$")
+_INSTANCE = re.compile(r"^/api/v1/instances/([^/]+)$")
+_METRICS = re.compile(r"^/api/v1/instances/([^/]+)/metrics$")
+_METRIC = re.compile(r"^/api/v1/instances/([^/]+)/metrics/([^/]+)$")
+
+
+def uniform_latency(low: float, high: float, seed: Optional[int] = None) -> Latency:
+    """Latency drawn uniformly between ``low`` and ``high`` seconds."""
+    rng = random.Random(seed)
+    return lambda: rng.uniform(low, high)
+
+
+def exponential_latency(mean: float, seed: Optional[int] = None) -> Latency:
+    """Latency drawn from an exponential distribution with ``mean`` seconds."""
+    rng = random.Random(seed)
+    return lambda: rng.expovariate(1.0 / mean)
+
+
+class ConnectionDropped(httpx.RemoteProtocolError):
+    """Raised by the app to drop the connection without a response.
+
+    ``FakeReplicatedServer`` closes the socket; through
+    ``httpx.ASGITransport`` it surfaces as the same httpx error a real
+    dropped connection would.
+    """
+
+
+class RecordedRequest(NamedTuple):
+    """A request received by the fake API."""
+
+    method: str
+    path: str
+    headers: Dict[str, str]
+    body: bytes
+    received_at: float
+
+    def json(self) -> Any:
+        return json.loads(self.body) if self.body else None
+
+
+class _Fault:
+    def __init__(
+        self,
+        kind: str,
+        count: Optional[int],
+        path: Optional[str],
+        probability: float,
+        **params: Any,
+    ) -> None:
+        self.kind = kind
+        self.remaining = count
+        self.path = path
+        self.probability = probability
+        self.params = params
+
+    def applies(self, path: str, rng: random.Random) -> bool:
+        if self.remaining is not None and self.remaining <= 0:
+            return False
+        if self.path is not None and not path.startswith(self.path):
+            return False
+        if self.probability < 1.0 and rng.random() >= self.probability:
+            return False
+        if self.remaining is not None:
+            self.remaining -= 1
+        return True
+
+
+class FakeReplicatedAPI:
+    """ASGI app mimicking the Replicated API endpoints used by the SDK.
+
+    Faults are checked in the order they were added; the first that
+    applies to a request decides its outcome. ``count=None`` makes a
+    fault permanent, ``path`` limits it to paths with that prefix and
+    ``probability`` applies it to only that fraction of requests.
+
+    Request bodies compressed with one of ``accept_encodings`` are
+    decompressed before they are recorded; any other ``Content-Encoding``
+    gets a 415 response listing the accepted ones.
+    """
+
+    def __init__(
+        self,
+        latency: Latency = 0.0,
+        seed: Optional[int] = None,
+        accept_encodings: Tuple[str, ...] = ENCODINGS,
+    ) -> None:
+        self.latency = latency
+        self.accept_encodings = accept_encodings
+        self.requests: List[RecordedRequest] = []
+        self.customers: Dict[str, Dict[str, Any]] = {}
+        self.instances: Dict[str, Dict[str, Any]] = {}
+        self._faults: List[_Fault] = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def rate_limit(
+        self,
+        count: Optional[int] = 1,
+        retry_after: Optional[float] = 1.0,
+        path: Optional[str] = None,
+        probability: float = 1.0,
+    ) -> None:
+        """Answer requests with 429, with a ``Retry-After`` header if given."""
+        self._faults.append(
+            _Fault(
+                "status", count, path, probability, status=429, retry_after=retry_after
+            )
+        )
+
+    def error_burst(
+        self,
+        count: Optional[int] = 1,
+        status: int = 503,
+        path: Optional[str] = None,
+        probability: float = 1.0,
+    ) -> None:
+        """Answer requests with a server error."""
+        self._faults.append(
+            _Fault("status", count, path, probability, status=status, retry_after=None)
+        )
+
+    def drop_connections(
+        self,
+        count: Optional[int] = 1,
+        path: Optional[str] = None,
+        probability: float = 1.0,
+    ) -> None:
+        """Close the connection without sending a response."""
+        self._faults.append(_Fault("drop", count, path, probability))
+
+    def slow_body(
+        self,
+        delay: float,
+        chunks: int = 4,
+        count: Optional[int] = 1,
+        path: Optional[str] = None,
+        probability: float = 1.0,
+    ) -> None:
+        """Send the response body in ``chunks`` pieces, ``delay`` apart."""
+        self._faults.append(
+            _Fault("slow", count, path, probability, delay=delay, chunks=chunks)
+        )
+
+    def clear_faults(self) -> None:
+        self._faults = []
+
+    def requests_to(
+        self, method: Optional[str] = None, path: Optional[str] = None
+    ) -> List[RecordedRequest]:
+        """Recorded requests, filtered by method and path prefix."""
+        return [
+            r
+            for r in self.requests
+            if (method is None or r.method == method)
+            and (path is None or r.path.startswith(path))
+        ]
+
+    def metrics(self, instance_id: str) -> Dict[str, Any]:
+        """The latest value of each metric reported for an instance."""
+        metrics: Dict[str, Any] = self.instances[instance_id]["metrics"]
+        return metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        request_headers = {
+            k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]
+        }
+        encoding = request_headers.get("content-encoding")
+        supported = encoding is None or encoding in self.accept_encodings
+        if encoding is not None and supported:
+            body = decompress(body, encoding)
+
+        # A body in an unsupported encoding is recorded as received.
+        request = RecordedRequest(
+            method=scope["method"],
+            path=scope["path"],
+            headers=request_headers,
+            body=body,
+            received_at=time.time(),
+        )
+        with self._lock:
+            self.requests.append(request)
+            fault = None
+            if supported:
+                fault = next(
+                    (f for f in self._faults if f.applies(request.path, self._rng)),
+                    None,
+                )
+
+        if not supported:
+            accepted = [("accept-encoding", ", ".join(self.accept_encodings))]
+            message_body = {"message": f"unsupported encoding {encoding}"}
+            await _respond(send, 415, message_body, accepted)
+            return
+
+        delay = self.latency() if callable(self.latency) else self.latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if fault is not None and fault.kind == "drop":
+            raise ConnectionDropped("connection dropped by fake API")
+        if fault is not None and fault.kind == "status":
+            status = fault.params["status"]
+            headers = []
+            if fault.params["retry_after"] is not None:
+                headers.append(("retry-after", str(fault.params["retry_after"])))
+            message_body = {"message": f"injected {status}", "code": "fault"}
+            await _respond(send, status, message_body, headers)
+            return
+
+        status, response_body = self._route(request)
+        if fault is not None and fault.kind == "slow":
+            await _respond_slowly(
+                send,
+                status,
+                response_body,
+                fault.params["delay"],
+                fault.params["chunks"],
+            )
+        else:
+            await _respond(send, status, response_body)
+
+    def _route(self, request: RecordedRequest) -> Tuple[int, Any]:
+        """Apply a request to the fake's state and build its response."""
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            return 401, {"message": "missing authorization"}
+        method, path = request.method, request.path
+        payload = request.json() or {}
+        with self._lock:
+            if method == "POST" and path == "/v3/customer":
+                return 201, {"customer": self._customer(payload)}
+            match = _INSTANCES.match(path)
+            if method == "POST" and match:
+                return 201, {"id": self._instance(match.group(1), payload)}
+            match = _INSTANCE.match(path)
+            if method == "PATCH" and match and match.group(1) in self.instances:
+                self.instances[match.group(1)].update(payload)
+                return 200, {}
+            match = _METRICS.match(path)
+            if method == "POST" and match and match.group(1) in self.instances:
+                metrics = self.instances[match.group(1)]["metrics"]
+                metrics[payload["name"]] = payload["value"]
+                return 200, {}
+            match = _METRIC.match(path)
+            if method == "DELETE" and match and match.group(1) in self.instances:
+                self.instances[match.group(1)]["metrics"].pop(match.group(2), None)
+                return 200, {}
+        return 404, {"message": f"no route for {method} {path}"}
+
+    def _customer(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        email = payload["email_address"]
+        customer = self.customers.get(email)
+        if customer is None:
+            number = len(self.customers) + 1
+            customer = self.customers[email] = {
+                "id": f"customer_{number}",
+                "email": email,
+                "name": payload.get("name"),
+                "channel": payload.get("channel"),
+                "serviceToken": f"service_token_{number}",
+            }
+        return customer
+
+    def _instance(self, customer_id: str, payload: Dict[str, Any]) -> str:
+        fingerprint = payload.get("fingerprint")
+        for instance_id, instance in self.instances.items():
+            key = (instance["customer_id"], instance["fingerprint"])
+            if key == (customer_id, fingerprint):
+                return instance_id
+        instance_id = f"instance_{len(self.instances) + 1}"
+        self.instances[instance_id] = {
+            "customer_id": customer_id,
+            "fingerprint": fingerprint,
+            "metrics": {},
+        }
+        return instance_id
+
+
+async def _respond(
+    send: Send,
+    status: int,
+    body: Any,
+    headers: Optional[List[Tuple[str, str]]] = None,
+) -> None:
+    content = json.dumps(body).encode()
+    await send(_start(status, len(content), headers))
+    await send({"type": "http.response.body", "body": content})
+
+
+async def _respond_slowly(
+    send: Send, status: int, body: Any, delay: float, chunks: int
+) -> None:
+    content = json.dumps(body).encode()
+    await send(_start(status, len(content)))
+    size = max(1, -(-len(content) // chunks))
+    for start in range(0, len(content), size):
+        await asyncio.sleep(delay)
+        end = start + size
+        more = end < len(content)
+        await send(
+            {
+                "type": "http.response.body",
+                "body": content[start:end],
+                "more_body": more,
+            }
+        )
+
+
+def _start(
+    status: int, length: int, headers: Optional[List[Tuple[str, str]]] = None
+) -> Message:
+    raw = [(b"content-type", b"application/json"), (b"content-length", b"%d" % length)]
+    raw += [(k.encode(), v.encode()) for k, v in headers or []]
+    return {"type": "http.response.start", "status": status, "headers": raw}
+
+
+class FakeReplicatedServer:
+    """Serves an ASGI app over HTTP/1.1 on localhost from a background thread.
+
+    A minimal server for tests: keep-alive, ``Content-Length`` bodies, and
+    dropping the connection when the app raises. ``port=0`` picks a free
+    port; the address is available as ``url`` once started.
+    """
+
+    def __init__(
+        self,
+        app: Optional[Callable[[Scope, Receive, Send], Awaitable[None]]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.app = app if app is not None else FakeReplicatedAPI()
+        self.host = host
+        self.port = port
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._connections: Set["asyncio.Task[Any]"] = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self) -> "FakeReplicatedServer":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        loop = self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=loop.run_forever, name="fake-replicated-api", daemon=True
+        )
+        self._thread.start()
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, self.host, self.port), loop
+        )
+        self._server = future.result()
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        loop, server, thread = self._loop, self._server, self._thread
+        if loop is None or server is None or thread is None:
+            return
+
+        async def shutdown() -> None:
+            server.close()
+            for task in self._connections:
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        self._loop = self._server = self._thread = None
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._connections.add(task)
+        try:
+            while await self._serve_one(reader, writer):
+                pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass  # Cancelled by stop()
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _serve_one(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> bool:
+        """Serve one request; returns False when the connection should close."""
+        line = await reader.readline()
+        if not line:
+            return False
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+        headers: List[Tuple[bytes, bytes]] = []
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            headers.append((name.strip().lower().encode(), value.strip().encode()))
+        length = int(dict(headers).get(b"content-length", b"0"))
+        body = await reader.readexactly(length) if length else b""
+
+        path, _, query = target.partition("?")
+        scope: Scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "headers": headers,
+            "server": (self.host, self.port),
+            "client": writer.get_extra_info("peername"),
+        }
+        delivered = False
+
+        async def receive() -> Message:
+            nonlocal delivered
+            if delivered:
+                return {"type": "http.disconnect"}
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                head = [
+                    b"HTTP/1.1 %d %s" % (message["status"], _reason(message["status"]))
+                ]
+                head += [k + b": " + v for k, v in message.get("headers", [])]
+                writer.write(b"\r\n".join(head) + b"\r\n\r\n")
+            else:
+                writer.write(message.get("body", b""))
+            await writer.drain()
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            return False  # Drop the connection without (finishing) a response
+        return True
+
+
+def _reason(status: int) -> bytes:
+    try:
+        from http import HTTPStatus
+
+        return HTTPStatus(status).phrase.encode()
+    except ValueError:
+        return b"Unknown"
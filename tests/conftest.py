@@ -0,0 +1,40 @@
+import sys
+import threading
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_state_dir(tmp_path, monkeypatch):
+    """Keep SDK state written by tests out of the real home directory."""
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+    return tmp_path / "state"
+
+
+# Audit events raised by blocking file-system calls.
+FILE_EVENTS = {"open", "os.mkdir", "os.rename", "os.remove", "os.listdir", "os.scandir"}
+
+
+@pytest.fixture(scope="session")
+def file_audit():
+    """Collect file-system audit events raised on ``loop_thread``.
+
+    Audit hooks cannot be removed, so one is installed for the whole
+    session, the first time a test asks for it; it records nothing
+    while ``loop_thread`` is None.
+    """
+    guard = {"loop_thread": None, "events": []}
+
+    def audit(event, args):
+        if event in FILE_EVENTS and guard["loop_thread"] == threading.get_ident():
+            guard["events"].append((event, args[0] if args else None))
+
+    sys.addaudithook(audit)
+    return guard
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr("replicated.http_client.time.sleep", slept.append)
+    return slept
@@ -0,0 +1,56 @@
+"""Plain helpers shared by the test modules; fixtures live in conftest."""
+
+from unittest.mock import AsyncMock, Mock
+
+import httpx
+
+from replicated import AsyncReplicatedClient, ReplicatedClient
+from replicated.http_client import SyncHTTPClient
+from replicated.resources import AsyncInstance, Instance
+
+
+def responder(*responses):
+    """Return a MockTransport handler replaying ``responses`` in order."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        response = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return handler, calls
+
+
+def sync_client(handler, **kwargs):
+    client = SyncHTTPClient(base_url="https://replicated.test", **kwargs)
+    client._client = httpx.Client(transport=httpx.MockTransport(handler))
+    return client
+
+
+def make_instance(**client_kwargs):
+    client = ReplicatedClient(
+        publishable_key="pk_test_123", app_slug="my-app", **client_kwargs
+    )
+    client.http_client._make_request = Mock(return_value={})
+    return client, Instance(client, "customer_123", "instance_456")
+
+
+def make_async_instance(**client_kwargs):
+    client = AsyncReplicatedClient(
+        publishable_key="pk_test_123", app_slug="my-app", **client_kwargs
+    )
+    client.http_client._make_request_async = AsyncMock(return_value={})
+    return client, AsyncInstance(client, "customer_123", "instance_456")
+
+
+def server_client(server, **kwargs):
+    """A client talking to a running ``FakeReplicatedServer``."""
+    return ReplicatedClient(
+        publishable_key="pk_test_123",
+        app_slug="my-app",
+        base_url=server.url,
+        fingerprint="host-1",
+        **kwargs,
+    )
@@ -0,0 +1,245 @@
+import array
+import math
+import random
+import time
+
+import pytest
+
+from replicated import aggregators
+from replicated.aggregators import (
+    AggregateReporter,
+    Aggregators,
+    Counter,
+    Gauge,
+    Histogram,
+    QuantileSketch,
+)
+from tests.helpers import make_async_instance, make_instance
+
+
+def sent_metrics(mock):
+    return {
+        c.kwargs["json_data"]["name"]: c.kwargs["json_data"]["value"]
+        for c in mock.call_args_list
+    }
+
+
+class TestQuantileSketch:
+    def test_quantiles_are_within_relative_accuracy(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(0, 2) for _ in range(20000)]
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        values.sort()
+        for q in (0.5, 0.95, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            assert sketch.quantile(q) == pytest.approx(exact, rel=0.01)
+        assert sketch.count == len(values)
+        assert sketch.min == values[0] and sketch.max == values[-1]
+
+    def test_negative_and_zero_values(self):
+        sketch = QuantileSketch()
+        for value in (-10, -1, 0, 1, 10):
+            sketch.add(value)
+        assert sketch.quantile(0) == -10
+        assert sketch.quantile(0.5) == 0
+        assert sketch.quantile(1) == 10
+
+    def test_buckets_are_bounded(self):
+        sketch = QuantileSketch(relative_accuracy=0.01, max_buckets=64)
+        for exponent in range(-50, 50):
+            sketch.add(10.0**exponent)
+        assert len(sketch._positive) <= 64
+        # Collapsing merges the smallest buckets, so high quantiles stay exact.
+        assert sketch.quantile(1) == pytest.approx(1e49, rel=0.01)
+
+    def test_merge(self):
+        a, b, both = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for i in range(1, 1001):
+            (a if i % 2 else b).add(i)
+            both.add(i)
+        a.merge(b)
+        assert a.count == both.count and a.sum == both.sum
+        assert a.quantile(0.95) == both.quantile(0.95)
+
+        with pytest.raises(ValueError):
+            a.merge(QuantileSketch(relative_accuracy=0.05))
+
+
+class TestAddSamples:
+    VALUES = [random.Random(3).lognormvariate(0, 1) for _ in range(5000)] + [0, -2.5]
+
+    def looped(self):
+        sketch = QuantileSketch()
+        for value in self.VALUES:
+            sketch.add(value)
+        return sketch
+
+    def assert_same(self, sketch, expected):
+        assert sketch._positive == expected._positive
+        assert sketch._negative == expected._negative
+        assert sketch._zero == expected._zero
+        assert sketch.count == expected.count
+        assert sketch.sum == pytest.approx(expected.sum)
+        assert (sketch.min, sketch.max) == (expected.min, expected.max)
+
+    @pytest.mark.parametrize(
+        "convert",
+        [
+            list,
+            iter,
+            lambda v: array.array("d", v),
+            lambda v: memoryview(array.array("d", v)),
+        ],
+    )
+    def test_fallback_matches_add(self, monkeypatch, convert):
+        monkeypatch.setattr(aggregators, "np", None)
+        sketch = QuantileSketch()
+        sketch.add_samples(convert(self.VALUES))
+        self.assert_same(sketch, self.looped())
+
+    @pytest.mark.parametrize(
+        "convert",
+        [list, iter, lambda v: array.array("d", v), lambda v: array.array("f", v)],
+    )
+    def test_numpy_matches_add(self, convert):
+        pytest.importorskip("numpy")
+        values = convert(self.VALUES)
+        expected = QuantileSketch()
+        for value in convert(self.VALUES):
+            expected.add(value)
+        sketch = QuantileSketch()
+        sketch.add_samples(values)
+        self.assert_same(sketch, expected)
+
+    def test_numpy_arrays_are_read_in_place(self):
+        np = pytest.importorskip("numpy")
+        samples = np.arange(12, dtype=np.float64).reshape(3, 4)
+        assert np.shares_memory(aggregators._as_array(samples), samples)
+        sketch = QuantileSketch()
+        sketch.add_samples(samples)
+        assert (sketch.count, sketch.min, sketch.max) == (12, 0, 11)
+
+    @pytest.mark.parametrize("path", ["add", "fallback", "numpy"])
+    def test_non_finite_samples_are_ignored(self, monkeypatch, path):
+        finite = [1.0, 2.0, 3.0, 0.0, -4.0]
+        samples = [math.nan, 1.0, math.inf, 2.0, 3.0, -math.inf, 0.0, -4.0]
+        sketch = QuantileSketch()
+        if path == "add":
+            for value in samples:
+                sketch.add(value)
+        else:
+            if path == "fallback":
+                monkeypatch.setattr(aggregators, "np", None)
+            else:
+                pytest.importorskip("numpy")
+            sketch.add_samples(array.array("d", samples))
+
+        expected = QuantileSketch()
+        for value in finite:
+            expected.add(value)
+        self.assert_same(sketch, expected)
+        assert sketch.quantile(0.5) == expected.quantile(0.5)
+
+    def test_empty_samples(self):
+        sketch = QuantileSketch()
+        sketch.add_samples([])
+        assert sketch.count == 0 and sketch.quantile(0.5) is None
+
+
+class TestAggregators:
+    def test_counter_reports_total_when_changed(self):
+        counter = Counter("requests")
+        counter.inc()
+        counter.inc(2)
+        assert counter.collect() == {"requests": 3.0}
+        assert counter.collect() == {}
+        with pytest.raises(ValueError):
+            counter.inc(-1)
+
+    def test_gauge_reports_last_value(self):
+        gauge = Gauge("queue")
+        assert gauge.collect() == {}
+        gauge.set(5)
+        gauge.set(3)
+        assert gauge.collect() == {"queue": 3}
+        assert gauge.collect() == {}
+
+    def test_histogram_summarizes_each_interval(self):
+        histogram = Histogram("latency")
+        for value in range(1, 101):
+            histogram.observe(value)
+        summary = histogram.collect()
+        assert summary["latency_count"] == 100
+        assert summary["latency_sum"] == 5050
+        assert summary["latency_min"] == 1 and summary["latency_max"] == 100
+        assert summary["latency_p50"] == pytest.approx(50, rel=0.01)
+        assert summary["latency_p99"] == pytest.approx(99, rel=0.01)
+        assert histogram.collect() == {}
+
+    def test_kind_mismatch_raises(self):
+        aggregators = Aggregators()
+        aggregators.get("x", lambda: Counter("x"), "counter")
+        with pytest.raises(ValueError, match="already a counter"):
+            aggregators.get("x", lambda: Gauge("x"), "gauge")
+
+    def test_reporter_runs_every_interval(self):
+        calls = []
+        reporter = AggregateReporter(0.01, lambda: calls.append(1))
+        reporter.start()
+        time.sleep(0.1)
+        reporter.stop()
+        assert calls
+
+
+class TestInstanceAggregation:
+    def test_flush_reports_aggregates(self):
+        client, instance = make_instance()
+        mock = client.http_client._make_request
+        instance.counter("requests").inc(3)
+        instance.gauge("queue").set(7)
+        instance.histogram("latency").observe(0.25)
+
+        client.flush()
+
+        sent = sent_metrics(mock)
+        assert sent["requests"] == 3 and sent["queue"] == 7
+        assert sent["latency_count"] == 1 and sent["latency_p99"] == 0.25
+        client._aggregate_reporter.stop()
+
+    def test_record_samples_folds_into_histogram(self):
+        client, instance = make_instance()
+        mock = client.http_client._make_request
+        instance.histogram("latency").observe(5.0)
+        instance.record_samples("latency", array.array("d", [1.0, 2.0, 3.0]))
+
+        client.flush()
+
+        sent = sent_metrics(mock)
+        assert sent["latency_count"] == 4 and sent["latency_sum"] == 11.0
+        assert (sent["latency_min"], sent["latency_max"]) == (1.0, 5.0)
+        client._aggregate_reporter.stop()
+
+    def test_instances_of_a_customer_share_aggregators(self):
+        client, instance = make_instance()
+        other = type(instance)(client, instance.customer_id, instance.instance_id)
+        assert instance.counter("requests") is other.counter("requests")
+        client._aggregate_reporter.stop()
+
+    def test_exit_reports_final_interval(self):
+        client, instance = make_instance(aggregation_interval=60)
+        mock = client.http_client._make_request
+        with client:
+            instance.counter("requests").inc()
+        assert sent_metrics(mock) == {"requests": 1.0}
+
+    @pytest.mark.asyncio
+    async def test_async_drain_reports_aggregates(self):
+        client, instance = make_async_instance()
+        mock = client.http_client._make_request_async
+        async with client:
+            instance.histogram("latency").observe(2.0)
+            await client.drain()
+            assert sent_metrics(mock)["latency_max"] == 2.0
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import threading
+
+import httpx
+import pytest
+
+from replicated import AsyncReplicatedClient
+from replicated.state import AsyncStateManager, StateManager
+
+
+@pytest.fixture
+def no_blocking_io(file_audit, monkeypatch):
+    """Record file I/O performed on the event loop thread.
+
+    ``open`` and friends are caught through audit hooks; ``os.stat`` raises
+    no audit event, so it is wrapped instead.
+    """
+    real_stat = os.stat
+
+    def stat(*args, **kwargs):
+        if file_audit["loop_thread"] == threading.get_ident():
+            file_audit["events"].append(("os.stat", args[0]))
+        return real_stat(*args, **kwargs)
+
+    monkeypatch.setattr(os, "stat", stat)
+    file_audit["events"] = []
+    file_audit["loop_thread"] = threading.get_ident()
+    yield file_audit["events"]
+    file_audit["loop_thread"] = None
+
+
+def api(request):
+    if request.url.path == "/v3/customer":
+        return httpx.Response(
+            201, json={"customer": {"id": "cust_1", "serviceToken": "svc_token"}}
+        )
+    if request.url.path.endswith("/instances"):
+        return httpx.Response(201, json={"id": "inst_1"})
+    return httpx.Response(200, json={})
+
+
+@pytest.mark.asyncio
+async def test_client_does_no_blocking_file_io_on_the_loop(no_blocking_io):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return api(request)
+
+    # Start the default executor's machinery before watching the loop.
+    await asyncio.get_running_loop().run_in_executor(None, lambda: None)
+    transport = httpx.MockTransport(handler)
+    async with httpx.AsyncClient(transport=transport) as http:
+        for _ in range(2):  # Uncached, then cached by a fresh client
+            client = AsyncReplicatedClient(
+                publishable_key="pk_test_123", app_slug="my-app", http_client=http
+            )
+            no_blocking_io.clear()
+            customer = await client.customer.get_or_create("user@example.com")
+            instance = await customer.get_or_create_instance()
+            await instance.send_metric("cpu", 1)
+            assert no_blocking_io == []
+
+    assert requests[-1].headers["Authorization"] == "Bearer svc_token"
+    assert [r.url.path for r in requests].count("/v3/customer") == 1
+    assert StateManager("my-app").get_instance_id() == "inst_1"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_updates_are_coalesced(monkeypatch):
+    manager = StateManager("my-app")
+    writes = []
+    real_update = manager.update
+
+    def update(**fields):
+        writes.append(fields)
+        real_update(**fields)
+
+    monkeypatch.setattr(manager, "update", update)
+    state = AsyncStateManager(manager)
+
+    await asyncio.gather(*(state.update(**{f"k{i}": i}) for i in range(10)))
+
+    assert len(writes) < 10
+    assert manager.get_state() == {f"k{i}": i for i in range(10)}
+    assert await state.get_state() == manager.get_state()
+
+
+@pytest.mark.asyncio
+async def test_reads_refresh_after_interval():
+    manager = StateManager("my-app")
+    state = AsyncStateManager(manager, refresh_interval=0)
+    await state.update(customer_id="a")
+
+    StateManager("my-app").set_customer_id("b")
+
+    assert await state.get_customer_id() == "b"
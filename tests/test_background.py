@@ -0,0 +1,190 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import httpx
+import pytest
+
+from replicated import (
+    BackgroundConfig,
+    InstanceStatus,
+    OverflowPolicy,
+    ReplicatedClient,
+    ReplicatedNetworkError,
+    ReplicatedQueueFullError,
+    ReplicatedTimeoutError,
+)
+from replicated.background import BackgroundSender
+from replicated.resources import Instance
+from replicated.testing import FakeReplicatedAPI, FakeReplicatedServer
+
+
+def blocking_handler():
+    """A MockTransport handler that holds requests until released."""
+    release = threading.Event()
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        release.wait(5)
+        return httpx.Response(200, json={})
+
+    return handler, calls, release
+
+
+def make_client(handler, **config):
+    return ReplicatedClient(
+        publishable_key="pk_test_123",
+        app_slug="my-app",
+        transport=httpx.MockTransport(handler),
+        background=BackgroundConfig(**config),
+    )
+
+
+class TestBackgroundMode:
+    def test_calls_return_futures_without_waiting(self):
+        handler, calls, release = blocking_handler()
+        client = make_client(handler, max_workers=2)
+        instance = Instance(client, "customer_123", "instance_123")
+
+        start = time.monotonic()
+        futures = [
+            instance.send_metric("cpu", 0.5),
+            instance.set_status(InstanceStatus.RUNNING),
+            instance.delete_metric("mem"),
+        ]
+        assert time.monotonic() - start < 0.1
+        assert all(isinstance(f, Future) for f in futures)
+        assert not client.wait_all(timeout=0.05)
+
+        release.set()
+        assert client.wait_all(timeout=5)
+        assert all(f.result() is None for f in futures)
+        assert sorted(r.method for r in calls) == ["DELETE", "PATCH", "POST"]
+
+    def test_errors_go_to_callback_not_the_caller(self):
+        errors = []
+
+        def handler(request):
+            raise httpx.ConnectError("down")
+
+        client = make_client(handler, on_error=lambda op, e: errors.append((op, e)))
+        instance = Instance(client, "customer_123", "instance_123")
+
+        future = instance.send_metric("cpu", 0.5)
+        assert client.wait_all(timeout=5)
+        assert isinstance(future.exception(), ReplicatedNetworkError)
+        assert [op for op, _ in errors] == ["send_metric"]
+        assert client._background.failed == 1
+
+    def test_full_queue_drops_newest(self):
+        handler, _, release = blocking_handler()
+        errors = []
+        client = make_client(
+            handler,
+            max_workers=1,
+            max_queue_size=1,
+            on_error=lambda op, e: errors.append(e),
+        )
+        instance = Instance(client, "customer_123", "instance_123")
+        try:
+            instance.send_metric("a", 1)
+            instance.send_metric("b", 2)
+            dropped = instance.send_metric("c", 3)
+            assert isinstance(dropped.exception(), ReplicatedQueueFullError)
+            assert isinstance(errors[0], ReplicatedQueueFullError)
+            assert client._background.dropped == 1
+        finally:
+            release.set()
+            client.wait_all(timeout=5)
+
+    def test_full_queue_cancels_oldest_queued(self):
+        handler, calls, release = blocking_handler()
+        errors = []
+        client = make_client(
+            handler,
+            max_workers=1,
+            max_queue_size=1,
+            overflow_policy=OverflowPolicy.DROP_OLDEST,
+            on_error=lambda op, e: errors.append((op, e)),
+        )
+        instance = Instance(client, "customer_123", "instance_123")
+        running = instance.send_metric("a", 1)
+        while not calls:
+            time.sleep(0.01)
+        queued = instance.send_metric("b", 2)
+        newest = instance.send_metric("c", 3)
+        assert queued.cancelled()
+        assert [op for op, _ in errors] == ["send_metric"]
+        assert isinstance(errors[0][1], ReplicatedQueueFullError)
+
+        release.set()
+        assert client.wait_all(timeout=5)
+        assert running.result() is None and newest.result() is None
+        assert [r.read() for r in calls] == [
+            b'{"name":"a","value":1}',
+            b'{"name":"c","value":3}',
+        ]
+
+    def test_blocking_enqueue_is_bounded_by_call_timeout(self):
+        handler, _, release = blocking_handler()
+        client = make_client(
+            handler,
+            max_workers=1,
+            max_queue_size=0,
+            overflow_policy=OverflowPolicy.BLOCK,
+        )
+        instance = Instance(client, "customer_123", "instance_123")
+        try:
+            instance.send_metric("a", 1)
+            start = time.monotonic()
+            dropped = instance.send_metric("b", 2, timeout=0.1)
+            assert time.monotonic() - start < 1
+            assert isinstance(dropped.exception(), ReplicatedQueueFullError)
+        finally:
+            release.set()
+            client.wait_all(timeout=5)
+
+    def test_timeout_includes_time_spent_queued(self):
+        sender = BackgroundSender(BackgroundConfig(max_workers=1))
+        gate = threading.Event()
+        sender.submit("block", lambda timeout: gate.wait(5))
+        future = sender.submit("late", lambda timeout: None, timeout=0.05)
+        time.sleep(0.1)
+        gate.set()
+        assert isinstance(future.exception(timeout=5), ReplicatedTimeoutError)
+        sender.close()
+
+    def test_exit_waits_for_pending_operations(self):
+        api = FakeReplicatedAPI(latency=0.05)
+        with FakeReplicatedServer(api) as server:
+            with ReplicatedClient(
+                publishable_key="pk_test_123",
+                app_slug="my-app",
+                base_url=server.url,
+                fingerprint="host-1",
+                background=BackgroundConfig(),
+            ) as client:
+                customer = client.customer.get_or_create("user@example.com")
+                instance = customer.get_or_create_instance()
+                for i in range(5):
+                    instance.send_metric(f"m{i}", i)
+            assert len(api.metrics(instance.instance_id)) == 5
+
+    def test_blocking_mode_returns_none(self):
+        def handler(request):
+            return httpx.Response(200, json={})
+
+        client = ReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            transport=httpx.MockTransport(handler),
+        )
+        instance = Instance(client, "customer_123", "instance_123")
+        assert instance.send_metric("cpu", 1) is None
+        assert client.wait_all(timeout=0) is True
+
+
+def test_invalid_config():
+    with pytest.raises(ValueError):
+        BackgroundConfig(max_workers=0)
@@ -0,0 +1,264 @@
+import asyncio
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from replicated import (
+    AsyncReplicatedClient,
+    BatchConfig,
+    OverflowPolicy,
+    ReplicatedClient,
+)
+from replicated.batching import AsyncMetricBatcher, MetricBatcher
+from replicated.resources import AsyncInstance, Instance
+
+
+class RecordingInstance:
+    def __init__(self, gate=None):
+        self.sent = []
+        self.gate = gate
+
+    def _post_metric(self, name, value):
+        if self.gate is not None:
+            self.gate.wait()
+        self.sent.append((name, value))
+
+    def _mark_reported(self, name, value):
+        pass
+
+
+class TestMetricBatcher:
+    def test_flush_sends_coalesced_batch(self):
+        batcher = MetricBatcher(BatchConfig(flush_interval=60))
+        instance = RecordingInstance()
+
+        for i in range(5):
+            batcher.submit(instance, "cpu", i)
+        batcher.submit(instance, "mem", 1)
+
+        assert batcher.flush(timeout=5)
+        assert instance.sent == [("cpu", 4), ("mem", 1)]
+        batcher.close()
+
+    def test_batch_size_triggers_flush(self):
+        batcher = MetricBatcher(BatchConfig(max_batch_size=3, flush_interval=60))
+        instance = RecordingInstance()
+        sent = threading.Event()
+        instance._post_metric = lambda name, value: sent.set()
+
+        for name in ("a", "b", "c"):
+            batcher.submit(instance, name, 1)
+
+        assert sent.wait(5)
+        batcher.close()
+
+    def test_interval_triggers_flush(self):
+        batcher = MetricBatcher(BatchConfig(flush_interval=0.01))
+        sent = threading.Event()
+        instance = RecordingInstance()
+        instance._post_metric = lambda name, value: sent.set()
+
+        batcher.submit(instance, "cpu", 1)
+
+        assert sent.wait(5)
+        batcher.close()
+
+    def _fill_blocked(self, policy, **kwargs):
+        gate = threading.Event()
+        config = BatchConfig(
+            max_batch_size=1,
+            max_queue_size=2,
+            flush_interval=60,
+            overflow_policy=policy,
+            **kwargs,
+        )
+        batcher = MetricBatcher(config)
+        instance = RecordingInstance(gate)
+        batcher.submit(instance, "m0", 0)
+        # Wait for the flush thread to pick up m0 and block on the gate.
+        while batcher._in_flight == 0:
+            pass
+        results = [batcher.submit(instance, f"m{i}", i) for i in range(1, 4)]
+        gate.set()
+        batcher.close()
+        return batcher, instance, results
+
+    def test_drop_oldest(self):
+        batcher, instance, results = self._fill_blocked(OverflowPolicy.DROP_OLDEST)
+        assert results == [True, True, True]
+        assert batcher.dropped == 1
+        assert [name for name, _ in instance.sent] == ["m0", "m2", "m3"]
+
+    def test_drop_newest(self):
+        batcher, instance, results = self._fill_blocked(OverflowPolicy.DROP_NEWEST)
+        assert results == [True, True, False]
+        assert batcher.dropped == 1
+        assert [name for name, _ in instance.sent] == ["m0", "m1", "m2"]
+
+    def test_block_gives_up_after_timeout(self):
+        batcher, instance, results = self._fill_blocked(
+            OverflowPolicy.BLOCK, block_timeout=0.01
+        )
+        assert results == [True, True, False]
+        assert [name for name, _ in instance.sent] == ["m0", "m1", "m2"]
+
+    def test_exit_close_is_bounded_and_drops_the_rest(self):
+        gate = threading.Event()
+        batcher = MetricBatcher(
+            BatchConfig(max_batch_size=1, flush_interval=60, flush_timeout=0.1)
+        )
+        instance = RecordingInstance(gate)
+        for i in range(3):
+            batcher.submit(instance, f"m{i}", i)
+
+        start = time.monotonic()
+        batcher._close_at_exit()
+        assert time.monotonic() - start < 1
+        assert batcher.dropped == 2
+        gate.set()
+
+    def test_send_errors_are_counted(self):
+        batcher = MetricBatcher(BatchConfig(flush_interval=60))
+        instance = Mock()
+        instance._post_metric.side_effect = RuntimeError("boom")
+
+        batcher.submit(instance, "cpu", 1)
+        batcher.flush(timeout=5)
+
+        assert batcher.failed == 1
+        assert isinstance(batcher.last_error, RuntimeError)
+        batcher.close()
+
+
+class TestBatchedInstance:
+    @patch("replicated.http_client.httpx.Client")
+    def test_client_exit_drains_buffer(self, mock_httpx):
+        mock_response = Mock()
+        mock_response.is_success = True
+        mock_response.content = b""
+        mock_client = Mock()
+        mock_client.request.return_value = mock_response
+        mock_httpx.return_value = mock_client
+
+        with ReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            batching=BatchConfig(flush_interval=60),
+        ) as client:
+            instance = Instance(client, "customer_123", "instance_456")
+            instance.send_metric("cpu", 0.5)
+            instance.send_metric("cpu", 0.7)
+            assert mock_client.request.call_count == 0
+
+        assert mock_client.request.call_count == 1
+        kwargs = mock_client.request.call_args.kwargs
+        assert kwargs["url"].endswith("/api/v1/instances/instance_456/metrics")
+        assert kwargs["json"] == {"name": "cpu", "value": 0.7}
+
+
+class AsyncRecordingInstance:
+    def __init__(self):
+        self.sent = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def _post_metric(self, name, value):
+        await self.gate.wait()
+        self.sent.append((name, value))
+
+    def _mark_reported(self, name, value):
+        pass
+
+
+class TestAsyncMetricBatcher:
+    @pytest.mark.asyncio
+    async def test_drain_sends_coalesced_batch(self):
+        batcher = AsyncMetricBatcher(BatchConfig(flush_interval=60))
+        instance = AsyncRecordingInstance()
+
+        for i in range(5):
+            assert batcher.submit_nowait(instance, "cpu", i)
+        batcher.submit_nowait(instance, "mem", 1)
+        await asyncio.wait_for(batcher.drain(), 5)
+
+        assert instance.sent == [("cpu", 4), ("mem", 1)]
+        await batcher.close()
+
+    @pytest.mark.asyncio
+    async def test_full_batch_is_sent_without_waiting(self):
+        batcher = AsyncMetricBatcher(BatchConfig(max_batch_size=2, flush_interval=60))
+        instance = AsyncRecordingInstance()
+
+        batcher.submit_nowait(instance, "a", 1)
+        batcher.submit_nowait(instance, "b", 2)
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+        assert instance.sent == [("a", 1), ("b", 2)]
+        await batcher.close()
+
+    @pytest.mark.asyncio
+    async def test_nowait_drops_when_full(self):
+        config = BatchConfig(
+            max_batch_size=1,
+            max_queue_size=1,
+            flush_interval=60,
+            overflow_policy=OverflowPolicy.DROP_NEWEST,
+        )
+        batcher = AsyncMetricBatcher(config)
+        instance = AsyncRecordingInstance()
+        instance.gate.clear()
+
+        batcher.submit_nowait(instance, "m0", 0)
+        await asyncio.sleep(0)  # consumer takes m0 and blocks on the gate
+        assert batcher.submit_nowait(instance, "m1", 1)
+        assert not batcher.submit_nowait(instance, "m2", 2)
+        instance.gate.set()
+        await batcher.close()
+
+        assert instance.sent == [("m0", 0), ("m1", 1)]
+        assert batcher.dropped == 1
+
+    @pytest.mark.asyncio
+    async def test_block_policy_applies_backpressure(self):
+        config = BatchConfig(
+            max_batch_size=1,
+            max_queue_size=1,
+            flush_interval=60,
+            overflow_policy=OverflowPolicy.BLOCK,
+        )
+        batcher = AsyncMetricBatcher(config)
+        instance = AsyncRecordingInstance()
+        instance.gate.clear()
+
+        await batcher.submit(instance, "m0", 0)
+        await asyncio.sleep(0)
+        await batcher.submit(instance, "m1", 1)
+        blocked = asyncio.ensure_future(batcher.submit(instance, "m2", 2))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        instance.gate.set()
+        assert await asyncio.wait_for(blocked, 5)
+        await batcher.close()
+        assert [name for name, _ in instance.sent] == ["m0", "m1", "m2"]
+
+
+class TestBatchedAsyncInstance:
+    @pytest.mark.asyncio
+    async def test_send_metric_nowait_and_drain(self):
+        client = AsyncReplicatedClient(publishable_key="pk_test_123", app_slug="my-app")
+        instance = AsyncInstance(client, "customer_123", "instance_456")
+        sent = []
+
+        async def post_metric(name, value):
+            sent.append((name, value))
+
+        instance._post_metric = post_metric
+        assert instance.send_metric_nowait("cpu", 0.5)
+        await instance.drain()
+
+        assert sent == [("cpu", 0.5)]
+        await client.__aexit__(None, None, None)
@@ -0,0 +1,219 @@
+import asyncio
+
+import httpx
+import pytest
+
+from replicated import (
+    AsyncReplicatedClient,
+    CircuitBreaker,
+    CircuitState,
+    ReplicatedAPIError,
+    ReplicatedCircuitOpenError,
+    ReplicatedNetworkError,
+)
+from replicated.http_client import AsyncHTTPClient
+from tests.helpers import responder, sync_client
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("replicated.circuit.time.monotonic", clock)
+    return clock
+
+
+def network_error():
+    return httpx.ConnectError("connection refused")
+
+
+class TestCircuitBreaker:
+    def test_opens_at_failure_rate_and_fails_fast(self, clock):
+        transitions = []
+        breaker = CircuitBreaker(
+            failure_threshold=0.5,
+            minimum_requests=4,
+            cooldown=10.0,
+            on_state_change=lambda old, new: transitions.append((old, new)),
+        )
+        handler, calls = responder(
+            httpx.Response(200, json={}),
+            httpx.Response(503),
+            httpx.Response(200, json={}),
+            network_error(),
+        )
+        client = sync_client(handler, circuit_breaker=breaker)
+
+        client._make_request("GET", "/x")
+        with pytest.raises(ReplicatedAPIError):
+            client._make_request("GET", "/x")
+        client._make_request("GET", "/x")
+        with pytest.raises(ReplicatedNetworkError):
+            client._make_request("GET", "/x")
+
+        assert breaker.state is CircuitState.OPEN
+        with pytest.raises(ReplicatedCircuitOpenError) as exc_info:
+            client._make_request("GET", "/x")
+        assert isinstance(exc_info.value, ReplicatedNetworkError)
+        assert exc_info.value.retry_in == 10.0
+        assert len(calls) == 4
+        assert transitions == [(CircuitState.CLOSED, CircuitState.OPEN)]
+
+    def test_client_errors_do_not_count_as_failures(self, clock):
+        breaker = CircuitBreaker(minimum_requests=2)
+        handler, _ = responder(httpx.Response(404))
+        client = sync_client(handler, circuit_breaker=breaker)
+
+        for _ in range(5):
+            with pytest.raises(ReplicatedAPIError):
+                client._make_request("GET", "/x")
+        assert breaker.state is CircuitState.CLOSED
+
+    def test_half_open_probe_closes_or_reopens(self, clock):
+        transitions = []
+        breaker = CircuitBreaker(
+            minimum_requests=1,
+            cooldown=5.0,
+            on_state_change=lambda old, new: transitions.append(new),
+        )
+        handler, calls = responder(
+            httpx.Response(500), httpx.Response(500), httpx.Response(200, json={})
+        )
+        client = sync_client(handler, circuit_breaker=breaker)
+
+        with pytest.raises(ReplicatedAPIError):
+            client._make_request("GET", "/x")
+        clock.now += 5.0
+        with pytest.raises(ReplicatedAPIError):
+            client._make_request("GET", "/x")  # The probe fails
+        assert breaker.state is CircuitState.OPEN
+
+        clock.now += 5.0
+        assert client._make_request("GET", "/x") == {}
+        assert breaker.state is CircuitState.CLOSED
+        assert transitions == [
+            CircuitState.OPEN,
+            CircuitState.HALF_OPEN,
+            CircuitState.OPEN,
+            CircuitState.HALF_OPEN,
+            CircuitState.CLOSED,
+        ]
+        assert len(calls) == 3
+
+    def test_half_open_limits_concurrent_probes(self, clock):
+        breaker = CircuitBreaker(minimum_requests=1, cooldown=1.0, half_open_probes=2)
+        breaker.record(ReplicatedNetworkError("down"))
+        clock.now += 1.0
+
+        breaker.before_request()
+        breaker.before_request()
+        with pytest.raises(ReplicatedCircuitOpenError):
+            breaker.before_request()
+
+        breaker.record()
+        assert breaker.state is CircuitState.HALF_OPEN
+        breaker.record()
+        assert breaker.state is CircuitState.CLOSED
+
+    def test_window_forgets_old_outcomes(self, clock):
+        breaker = CircuitBreaker(
+            failure_threshold=0.5, minimum_requests=4, window_size=4
+        )
+        for _ in range(6):
+            breaker.record()
+        breaker.record(ReplicatedNetworkError("down"))
+        assert breaker.state is CircuitState.CLOSED
+        # Two failures in the last four requests, though only two of eight.
+        breaker.record(ReplicatedNetworkError("down"))
+        assert breaker.state is CircuitState.OPEN
+
+    def test_fallback_answers_while_open(self, clock):
+        fallback_calls = []
+
+        def fallback(method, url, json_data):
+            fallback_calls.append((method, url, json_data))
+            return {"cached": True}
+
+        breaker = CircuitBreaker(minimum_requests=1, fallback=fallback)
+        handler, calls = responder(network_error())
+        client = sync_client(handler, circuit_breaker=breaker)
+
+        with pytest.raises(ReplicatedNetworkError):
+            client._make_request("POST", "/m", json_data={"v": 1})
+        assert client._make_request("POST", "/m", json_data={"v": 2}) == {
+            "cached": True
+        }
+        assert fallback_calls == [("POST", "/m", {"v": 2})]
+        assert len(calls) == 1
+
+    def test_callback_errors_are_ignored(self, clock):
+        def callback(old, new):
+            raise RuntimeError("boom")
+
+        breaker = CircuitBreaker(minimum_requests=1, on_state_change=callback)
+        breaker.record(ReplicatedNetworkError("down"))
+        assert breaker.state is CircuitState.OPEN
+
+
+class TestAsyncCircuitBreaker:
+    @pytest.mark.asyncio
+    async def test_open_circuit_fails_fast(self, clock):
+        breaker = CircuitBreaker(minimum_requests=2)
+        handler, calls = responder(network_error())
+        client = AsyncHTTPClient(
+            base_url="https://replicated.test", circuit_breaker=breaker
+        )
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        for _ in range(2):
+            with pytest.raises(ReplicatedNetworkError):
+                await client._make_request_async("GET", "/x")
+        with pytest.raises(ReplicatedCircuitOpenError):
+            await client._make_request_async("GET", "/x")
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_gives_back_its_slot(self, clock):
+        breaker = CircuitBreaker(minimum_requests=1, cooldown=1.0)
+        responses = [network_error(), None, httpx.Response(200, json={})]
+
+        async def handler(request):
+            response = responses.pop(0)
+            if response is None:
+                await asyncio.sleep(10)  # The probe hangs until cancelled
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        client = AsyncHTTPClient(
+            base_url="https://replicated.test", circuit_breaker=breaker
+        )
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with pytest.raises(ReplicatedNetworkError):
+            await client._make_request_async("GET", "/x")
+        clock.now += 2
+
+        probe = asyncio.ensure_future(client._make_request_async("GET", "/x"))
+        while len(responses) > 1:
+            await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert await client._make_request_async("GET", "/x") == {}
+        assert breaker.state is CircuitState.CLOSED
+
+    @pytest.mark.asyncio
+    async def test_client_passes_breaker_to_http_client(self):
+        breaker = CircuitBreaker()
+        async with AsyncReplicatedClient(
+            publishable_key="pk_test_123", app_slug="my-app", circuit_breaker=breaker
+        ) as client:
+            assert client.http_client.circuit_breaker is breaker
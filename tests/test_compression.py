@@ -0,0 +1,139 @@
+import gzip
+import json
+
+import httpx
+import pytest
+
+from replicated import (
+    AsyncReplicatedClient,
+    CompressionConfig,
+    ReplicatedAPIError,
+)
+from replicated.http_client import AsyncHTTPClient
+from replicated.testing import FakeReplicatedAPI, FakeReplicatedServer
+from tests.helpers import responder, server_client, sync_client
+
+LARGE = {"name": "inventory", "value": "sku-0001," * 500}
+
+
+class TestCompression:
+    def test_disabled_by_default(self):
+        handler, calls = responder(httpx.Response(200, json={}))
+        client = sync_client(handler)
+        client._make_request("POST", "/x", json_data=LARGE)
+        assert "content-encoding" not in calls[0].headers
+        assert json.loads(calls[0].content) == LARGE
+
+    def test_large_bodies_are_gzipped(self):
+        handler, calls = responder(httpx.Response(200, json={}))
+        client = sync_client(handler, compression=CompressionConfig())
+        client._make_request("POST", "/api/v1/instances/i1/metrics", json_data=LARGE)
+
+        request = calls[0]
+        assert request.headers["content-encoding"] == "gzip"
+        assert request.headers["content-type"] == "application/json"
+        assert json.loads(gzip.decompress(request.content)) == LARGE
+        stats = client.stats.snapshot()["POST metrics"]
+        assert stats["bytes_sent"] == len(request.content)
+        raw_size = len(json.dumps(LARGE, separators=(",", ":")))
+        assert stats["bytes_saved"] == raw_size - len(request.content) > 0
+
+    def test_small_bodies_are_sent_uncompressed(self):
+        handler, calls = responder(httpx.Response(200, json={}))
+        client = sync_client(handler, compression=CompressionConfig(min_size=1024))
+        client._make_request("POST", "/x", json_data={"name": "cpu", "value": 1})
+        assert "content-encoding" not in calls[0].headers
+        assert json.loads(calls[0].content) == {"name": "cpu", "value": 1}
+        assert client.stats.snapshot()["POST default"]["bytes_saved"] == 0
+
+    def test_zstd(self):
+        zstandard = pytest.importorskip("zstandard")
+        handler, calls = responder(httpx.Response(200, json={}))
+        client = sync_client(handler, compression=CompressionConfig("zstd"))
+        client._make_request("POST", "/x", json_data=LARGE)
+        assert calls[0].headers["content-encoding"] == "zstd"
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        assert json.loads(decompressor.decompress(calls[0].content)) == LARGE
+
+    def test_unknown_encoding_is_rejected(self):
+        with pytest.raises(ValueError):
+            CompressionConfig("brotli")
+
+    def test_415_falls_back_to_an_accepted_encoding(self):
+        pytest.importorskip("zstandard")
+        api = FakeReplicatedAPI(accept_encodings=("gzip",))
+        config = CompressionConfig("zstd", min_size=0)
+        with FakeReplicatedServer(api) as server:
+            with server_client(server, compression=config) as client:
+                customer = client.customer.get_or_create("a@example.com")
+                customer.get_or_create_instance().send_metric("cpu", 1)
+
+        assert client.http_client._content_encoding == "gzip"
+        rejected, accepted = api.requests[:2]
+        assert rejected.headers["content-encoding"] == "zstd"
+        assert accepted.headers["content-encoding"] == "gzip"
+        assert accepted.json()["email_address"] == "a@example.com"
+        assert api.requests_to("POST", "/api/v1/instances/instance_1/metrics")
+
+    def test_415_without_accepted_encodings_disables_compression(self):
+        api = FakeReplicatedAPI(accept_encodings=())
+        config = CompressionConfig(min_size=0)
+        with FakeReplicatedServer(api) as server:
+            with server_client(server, compression=config) as client:
+                client.customer.get_or_create("a@example.com")
+                client.customer.get_or_create("b@example.com")
+
+        assert client.http_client._content_encoding is None
+        rejected, *sent = api.requests
+        assert rejected.headers["content-encoding"] == "gzip"
+        assert len(sent) == 2
+        assert all("content-encoding" not in r.headers for r in sent)
+        stats = client.stats()["POST customer"]
+        assert stats["requests"] == 3 and stats["errors"] == 1
+
+    @pytest.mark.parametrize("plain_status", [200, 415])
+    def test_415_re_encodes_once_then_sends_uncompressed(self, plain_status):
+        pytest.importorskip("zstandard")
+        calls = []
+
+        def handler(request):
+            # Offers both encodings, then refuses whichever one it gets.
+            calls.append(request.headers.get("content-encoding"))
+            if "content-encoding" in request.headers:
+                return httpx.Response(415, headers={"Accept-Encoding": "gzip, zstd"})
+            return httpx.Response(plain_status, json={})
+
+        client = sync_client(handler, compression=CompressionConfig("zstd", min_size=0))
+        if plain_status == 200:
+            assert client._make_request("POST", "/x", json_data={"a": 1}) == {}
+        else:
+            with pytest.raises(ReplicatedAPIError):
+                client._make_request("POST", "/x", json_data={"a": 1})
+        assert calls == ["zstd", "gzip", None]
+
+    def test_415_for_uncompressed_bodies_is_raised(self):
+        handler, calls = responder(httpx.Response(415))
+        client = sync_client(handler, compression=CompressionConfig())
+        with pytest.raises(ReplicatedAPIError):
+            client._make_request("POST", "/x", json_data={"name": "cpu"})
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_async_client_compresses(self):
+        api = FakeReplicatedAPI()
+        client = AsyncReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            fingerprint="host-1",
+            compression=CompressionConfig(min_size=0),
+        )
+        http = client.http_client
+        assert isinstance(http, AsyncHTTPClient)
+        http._client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=api), base_url=http.base_url
+        )
+        async with client:
+            await client.customer.get_or_create("a@example.com")
+
+        assert api.requests[0].headers["content-encoding"] == "gzip"
+        assert api.requests[0].json()["email_address"] == "a@example.com"
@@ -0,0 +1,228 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from replicated import (
+    AsyncReplicatedClient,
+    CircuitBreaker,
+    CircuitState,
+    InstanceStatus,
+    RateLimiter,
+    ReplicatedAPIError,
+    ReplicatedDeadlineExceededError,
+    ReplicatedNetworkError,
+    ReplicatedTimeoutError,
+    RetryPolicy,
+)
+from replicated.deadline import cap_timeout, time_remaining, within
+from replicated.singleflight import AsyncSingleFlight, SingleFlight
+from replicated.testing import FakeReplicatedAPI, FakeReplicatedServer
+from tests.helpers import responder, server_client, sync_client
+
+
+class TestWithin:
+    def test_nested_deadlines_only_shorten(self):
+        assert time_remaining() is None
+        with within(10.0):
+            assert 9.0 < time_remaining() <= 10.0
+            with within(60.0):
+                assert time_remaining() <= 10.0
+            with within(1.0):
+                assert time_remaining() <= 1.0
+                assert cap_timeout(5.0) <= 1.0
+            assert time_remaining() > 9.0
+        assert time_remaining() is None
+        assert cap_timeout(5.0) == 5.0
+
+    def test_expired_deadline_fails_before_sending(self):
+        handler, calls = responder(httpx.Response(200, json={}))
+        client = sync_client(handler)
+        with within(0.0):
+            with pytest.raises(ReplicatedTimeoutError):
+                client._make_request("GET", "/x")
+        assert calls == []
+
+    def test_deadline_caps_the_attempt_timeout_only_when_set(self):
+        handler, calls = responder(
+            httpx.Response(200, json={}), httpx.Response(200, json={})
+        )
+        client = sync_client(handler)
+        client._make_request("GET", "/x")
+        with within(1.0):
+            client._make_request("GET", "/x")
+
+        default, capped = (r.extensions["timeout"] for r in calls)
+        assert default == httpx.Timeout(5.0).as_dict()
+        assert 0 < capped["read"] <= 1.0
+
+
+class TestDeadlines:
+    def test_timeout_covers_a_slow_response(self):
+        api = FakeReplicatedAPI(latency=1.0)
+        with FakeReplicatedServer(api) as server, server_client(server) as client:
+            start = time.monotonic()
+            with pytest.raises(ReplicatedTimeoutError) as exc_info:
+                client.customer.get_or_create("user@example.com", timeout=0.1)
+            assert time.monotonic() - start < 0.5
+        assert isinstance(exc_info.value, ReplicatedNetworkError)
+
+    def test_slow_body_past_the_deadline_is_a_timeout(self):
+        api = FakeReplicatedAPI()
+        api.slow_body(delay=0.15, chunks=8)
+        with FakeReplicatedServer(api) as server, server_client(server) as client:
+            # Every read finishes in time, but the whole body does not.
+            with pytest.raises(ReplicatedTimeoutError):
+                client.customer.get_or_create("user@example.com", timeout=0.2)
+
+    def test_only_timeouts_cut_short_by_the_deadline_are_deadline_errors(self):
+        api = FakeReplicatedAPI(latency=0.3)
+        with FakeReplicatedServer(api) as server:
+            with server_client(server, timeout=0.1) as client:
+                with pytest.raises(ReplicatedTimeoutError) as exc_info:
+                    client.customer.get_or_create("a@example.com", timeout=5.0)
+                assert not isinstance(exc_info.value, ReplicatedDeadlineExceededError)
+            with server_client(server) as client:
+                with pytest.raises(ReplicatedDeadlineExceededError):
+                    client.customer.get_or_create("b@example.com", timeout=0.1)
+
+    def test_instance_creation_and_send_share_one_budget(self):
+        api = FakeReplicatedAPI()
+        with FakeReplicatedServer(api) as server, server_client(server) as client:
+            instance = client.customer.get_or_create("user@example.com")
+            instance = instance.get_or_create_instance()
+            api.latency = 0.2
+            start = time.monotonic()
+            with pytest.raises(ReplicatedTimeoutError):
+                instance.send_metric("cpu", 1, timeout=0.3)
+            assert time.monotonic() - start < 0.45
+        assert instance.instance_id is not None  # Creation fit in the budget
+
+    def test_retry_that_would_overrun_the_deadline_is_skipped(self, sleeps):
+        handler, calls = responder(httpx.Response(503, headers={"Retry-After": "5"}))
+        client = sync_client(handler, retry=RetryPolicy(max_attempts=5))
+        with within(1.0):
+            with pytest.raises(ReplicatedAPIError):
+                client._make_request("GET", "/x")
+        assert len(calls) == 1
+        assert sleeps == []
+
+    def test_rate_limiter_wait_counts_against_the_deadline(self, monkeypatch):
+        slept = []
+        monkeypatch.setattr("replicated.ratelimit.time.sleep", slept.append)
+        handler, calls = responder(httpx.Response(200, json={}))
+        limiter = RateLimiter({"default": (1.0, 1)})
+        client = sync_client(handler, rate_limiter=limiter)
+
+        client._make_request("GET", "/x")
+        with within(0.5):
+            with pytest.raises(ReplicatedTimeoutError):
+                client._make_request("GET", "/x")
+        assert slept == [] and len(calls) == 1
+        # The refused token was given back.
+        assert limiter.buckets["default"].reserve() < 1.0
+
+    def test_waiting_on_a_shared_call_is_bounded(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        leader = threading.Thread(target=lambda: flight.do("k", release.wait))
+        leader.start()
+        time.sleep(0.05)
+        try:
+            with within(0.05):
+                with pytest.raises(ReplicatedTimeoutError):
+                    flight.do("k", lambda: None)
+        finally:
+            release.set()
+            leader.join()
+
+    def test_shared_call_is_not_bound_by_the_leaders_deadline(self):
+        api = FakeReplicatedAPI(latency=0.2)
+        with FakeReplicatedServer(api) as server, server_client(server) as client:
+            errors = []
+
+            def lead():
+                try:
+                    client.customer.get_or_create("user@example.com", timeout=0.05)
+                except ReplicatedDeadlineExceededError as e:
+                    errors.append(e)
+
+            leader = threading.Thread(target=lead)
+            leader.start()
+            time.sleep(0.02)
+            # A follower without a deadline gets the shared result.
+            customer = client.customer.get_or_create("user@example.com")
+            leader.join()
+        assert len(errors) == 1
+        assert customer.customer_id == "customer_1"
+        assert len(api.requests_to("POST", "/v3/customer")) == 1
+
+    def test_deadline_expiry_does_not_open_the_circuit(self):
+        breaker = CircuitBreaker(minimum_requests=5)
+        api = FakeReplicatedAPI()
+        with FakeReplicatedServer(api) as server:
+            with server_client(server, circuit_breaker=breaker) as client:
+                customer = client.customer.get_or_create("user@example.com")
+                instance = customer.get_or_create_instance()
+                api.latency = 0.1
+                for _ in range(6):
+                    with pytest.raises(ReplicatedDeadlineExceededError):
+                        instance.send_metric("cpu", 1, timeout=0.05)
+                instance.send_metric("cpu", 1)
+        assert breaker.state is CircuitState.CLOSED
+
+    @pytest.mark.asyncio
+    async def test_async_shared_call_is_not_bound_by_the_leaders_deadline(self):
+        flight = AsyncSingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.1)
+            return "ok"
+
+        async def lead():
+            with within(0.02):
+                return await flight.do("k", slow)
+
+        leader = asyncio.ensure_future(lead())
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", slow))
+        with pytest.raises(ReplicatedDeadlineExceededError):
+            await leader
+        assert await follower == "ok"
+
+    @pytest.mark.asyncio
+    async def test_async_slow_body_is_cut_off_at_the_deadline(self):
+        api = FakeReplicatedAPI()
+        api.slow_body(delay=0.15, chunks=8)
+        with FakeReplicatedServer(api) as server:
+            async with AsyncReplicatedClient(
+                publishable_key="pk_test_123",
+                app_slug="my-app",
+                base_url=server.url,
+                fingerprint="host-1",
+            ) as client:
+                start = time.monotonic()
+                with pytest.raises(ReplicatedTimeoutError):
+                    await client.customer.get_or_create("user@example.com", timeout=0.2)
+                assert time.monotonic() - start < 0.5
+
+    @pytest.mark.asyncio
+    async def test_async_timeout(self):
+        api = FakeReplicatedAPI()
+        with FakeReplicatedServer(api) as server:
+            async with AsyncReplicatedClient(
+                publishable_key="pk_test_123",
+                app_slug="my-app",
+                base_url=server.url,
+                fingerprint="host-1",
+            ) as client:
+                customer = await client.customer.get_or_create("user@example.com")
+                instance = await customer.get_or_create_instance()
+                await instance.set_status(InstanceStatus.RUNNING, timeout=1.0)
+                api.latency = 1.0
+                start = time.monotonic()
+                with pytest.raises(ReplicatedTimeoutError):
+                    await instance.send_metric("cpu", 1, timeout=0.1)
+                assert time.monotonic() - start < 0.5
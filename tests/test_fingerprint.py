@@ -0,0 +1,57 @@
+import hashlib
+import threading
+
+import pytest
+
+from replicated import AsyncReplicatedClient, ReplicatedClient
+from replicated import fingerprint as fingerprint_module
+from replicated.fingerprint import get_machine_fingerprint
+
+
+@pytest.fixture
+def compute_calls(monkeypatch):
+    calls = []
+
+    def compute():
+        calls.append(threading.current_thread())
+        return "computed"
+
+    monkeypatch.setattr(fingerprint_module, "_fingerprint", None)
+    monkeypatch.setattr(fingerprint_module, "_compute_machine_fingerprint", compute)
+    return calls
+
+
+class TestFingerprint:
+    def test_computed_once_per_process(self, compute_calls):
+        assert get_machine_fingerprint() == "computed"
+        assert get_machine_fingerprint() == "computed"
+        assert len(compute_calls) == 1
+
+    def test_override_is_hashed(self, compute_calls):
+        expected = hashlib.sha256(b"pod-1234").hexdigest()
+        assert get_machine_fingerprint("pod-1234") == expected
+        assert compute_calls == []
+
+    def test_client_persists_fingerprint(self, compute_calls):
+        client = ReplicatedClient(publishable_key="pk_test_123", app_slug="my-app")
+        assert client._get_fingerprint() == "computed"
+        assert client.state_manager.get_fingerprint() == "computed"
+
+        fingerprint_module._fingerprint = None
+        other = ReplicatedClient(publishable_key="pk_test_123", app_slug="my-app")
+        assert other._get_fingerprint() == "computed"
+        assert len(compute_calls) == 1
+
+    def test_client_override(self, compute_calls):
+        client = ReplicatedClient(
+            publishable_key="pk_test_123", app_slug="my-app", fingerprint="pod-1234"
+        )
+        assert client._get_fingerprint() == hashlib.sha256(b"pod-1234").hexdigest()
+        assert compute_calls == []
+
+    @pytest.mark.asyncio
+    async def test_async_client_computes_off_loop(self, compute_calls):
+        client = AsyncReplicatedClient(publishable_key="pk_test_123", app_slug="my-app")
+
+        assert await client._get_fingerprint() == "computed"
+        assert compute_calls[0] is not threading.current_thread()
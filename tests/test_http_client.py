@@ -0,0 +1,203 @@
+import sys
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from replicated import (
+    AsyncReplicatedClient,
+    ReplicatedAPIError,
+    ReplicatedClient,
+    ReplicatedNetworkError,
+    ReplicatedRateLimitError,
+    RetryPolicy,
+)
+from replicated.http_client import AsyncHTTPClient
+from replicated.retry import parse_retry_after
+from tests.helpers import responder, sync_client
+
+
+class TestRetry:
+    def test_no_retries_by_default(self, sleeps):
+        handler, calls = responder(httpx.Response(503))
+        client = sync_client(handler)
+
+        with pytest.raises(ReplicatedAPIError) as exc_info:
+            client._make_request("GET", "/x")
+
+        assert len(calls) == 1
+        assert exc_info.value.attempts == 1
+
+    def test_retries_idempotent_request_until_success(self, sleeps):
+        handler, calls = responder(
+            httpx.Response(503), httpx.Response(502), httpx.Response(200, json={})
+        )
+        client = sync_client(handler, retry=RetryPolicy(max_attempts=5))
+
+        assert client._make_request("GET", "/x") == {}
+        assert len(calls) == 3
+        assert len(sleeps) == 2
+        assert all(0.1 <= delay <= 10.0 for delay in sleeps)
+
+    def test_gives_up_after_max_attempts(self, sleeps):
+        handler, calls = responder(httpx.Response(500))
+        client = sync_client(handler, retry=RetryPolicy(max_attempts=3))
+
+        with pytest.raises(ReplicatedAPIError) as exc_info:
+            client._make_request("DELETE", "/x")
+
+        assert len(calls) == 3
+        assert exc_info.value.attempts == 3
+
+    def test_post_is_not_retried_unless_marked(self, sleeps):
+        handler, calls = responder(httpx.Response(503))
+        client = sync_client(handler, retry=RetryPolicy(max_attempts=3))
+
+        with pytest.raises(ReplicatedAPIError):
+            client._make_request("POST", "/x")
+        assert len(calls) == 1
+
+        with pytest.raises(ReplicatedAPIError):
+            client._make_request("POST", "/x", idempotency_key="key-1")
+        assert len(calls) == 4
+        assert calls[-1].headers["Idempotency-Key"] == "key-1"
+
+    def test_connect_errors_are_always_retried(self, sleeps):
+        handler, calls = responder(
+            httpx.ConnectError("refused"), httpx.Response(200, json={})
+        )
+        client = sync_client(handler, retry=RetryPolicy(max_attempts=2))
+
+        assert client._make_request("POST", "/x") == {}
+        assert len(calls) == 2
+
+    def test_read_errors_are_not_retried_for_unsafe_requests(self, sleeps):
+        handler, calls = responder(httpx.ReadError("reset"))
+        client = sync_client(handler, retry=RetryPolicy(max_attempts=2))
+
+        with pytest.raises(ReplicatedNetworkError):
+            client._make_request("POST", "/x")
+        assert len(calls) == 1
+
+    def test_retry_after_is_honored(self, sleeps):
+        handler, calls = responder(
+            httpx.Response(429, headers={"Retry-After": "7"}),
+            httpx.Response(200, json={}),
+        )
+        client = sync_client(handler, retry=RetryPolicy(max_attempts=2))
+
+        client._make_request("GET", "/x")
+        assert sleeps == [7.0]
+
+    def test_retry_after_beyond_max_delay_gives_up(self, sleeps):
+        handler, calls = responder(
+            httpx.Response(429, headers={"Retry-After": "86400"}),
+            httpx.Response(200, json={}),
+        )
+        client = sync_client(handler, retry=RetryPolicy(max_attempts=2, max_delay=10))
+
+        with pytest.raises(ReplicatedRateLimitError):
+            client._make_request("GET", "/x")
+        assert len(calls) == 1
+        assert sleeps == []
+
+    def test_total_timeout_stops_retries(self, sleeps):
+        handler, calls = responder(httpx.Response(429, headers={"Retry-After": "60"}))
+        client = sync_client(
+            handler, retry=RetryPolicy(max_attempts=5, total_timeout=1.0)
+        )
+
+        with pytest.raises(ReplicatedRateLimitError) as exc_info:
+            client._make_request("GET", "/x")
+        assert len(calls) == 1
+        assert exc_info.value.attempts == 1
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after({"retry-after": "2.5"}) == 2.5
+        assert parse_retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+        assert parse_retry_after({"Retry-After": "soon"}) is None
+        assert parse_retry_after(None) is None
+
+    @pytest.mark.asyncio
+    async def test_async_retries(self, monkeypatch):
+        async def no_sleep(delay):
+            pass
+
+        monkeypatch.setattr("replicated.http_client.asyncio.sleep", no_sleep)
+        handler, calls = responder(httpx.Response(503), httpx.Response(200, json={}))
+        client = AsyncHTTPClient(
+            base_url="https://replicated.test", retry=RetryPolicy(max_attempts=2)
+        )
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        assert await client._make_request_async("PUT", "/x") == {}
+        assert len(calls) == 2
+
+
+class TestConnectionPooling:
+    def test_pool_options_are_passed_to_httpx(self):
+        limits = httpx.Limits(max_connections=5, keepalive_expiry=2.0)
+        timeout = httpx.Timeout(5.0, connect=1.0)
+        client = ReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            timeout=timeout,
+            limits=limits,
+        )
+
+        with patch("replicated.http_client.httpx.Client") as mock_httpx:
+            with client:
+                pass
+
+        mock_httpx.assert_called_once_with(timeout=timeout, http2=False, limits=limits)
+        mock_httpx.return_value.close.assert_called_once()
+
+    def test_http2_without_h2_fails_at_construction(self, monkeypatch):
+        monkeypatch.setitem(sys.modules, "h2", None)  # Makes the import fail
+
+        with pytest.raises(ImportError, match="replicated\\[http2\\]"):
+            ReplicatedClient(
+                publishable_key="pk_test_123", app_slug="my-app", http2=True
+            )
+        with pytest.raises(ImportError):
+            AsyncReplicatedClient(
+                publishable_key="pk_test_123", app_slug="my-app", http2=True
+            )
+
+    def test_shared_client_is_not_closed(self):
+        handler, calls = responder(httpx.Response(200, json={}))
+        shared = httpx.Client(transport=httpx.MockTransport(handler))
+
+        for _ in range(2):
+            with ReplicatedClient(
+                publishable_key="pk_test_123", app_slug="my-app", http_client=shared
+            ) as client:
+                client.http_client._make_request("GET", "/x")
+
+        assert not shared.is_closed
+        assert len(calls) == 2
+
+    def test_transport_is_used(self):
+        handler, calls = responder(httpx.Response(200, json={}))
+        client = ReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            transport=httpx.MockTransport(handler),
+        )
+
+        client.http_client._make_request("GET", "/x")
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_async_shared_client_is_not_closed(self):
+        handler, calls = responder(httpx.Response(200, json={}))
+        shared = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        async with AsyncReplicatedClient(
+            publishable_key="pk_test_123", app_slug="my-app", http_client=shared
+        ) as client:
+            await client.http_client._make_request_async("GET", "/x")
+
+        assert not shared.is_closed
+        assert len(calls) == 1
+        await shared.aclose()
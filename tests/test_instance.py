@@ -0,0 +1,203 @@
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from replicated import BatchConfig, InstanceStatus, ReplicatedNetworkError
+from tests.helpers import make_async_instance, make_instance
+
+
+def patch_bodies(mock):
+    return [c.kwargs["json_data"] for c in mock.call_args_list]
+
+
+class TestInstanceUpdate:
+    def test_update_sends_one_patch(self):
+        client, instance = make_instance()
+
+        instance.update(status=InstanceStatus.RUNNING, version="1.2.0")
+
+        assert patch_bodies(client.http_client._make_request) == [
+            {"status": "running", "version": "1.2.0"}
+        ]
+
+    def test_setters_send_immediately_without_debounce(self):
+        client, instance = make_instance()
+
+        instance.set_status(InstanceStatus.RUNNING)
+        instance.set_version("1.2.0")
+
+        assert client.http_client._make_request.call_count == 2
+
+    def test_debounced_updates_are_merged(self):
+        client, instance = make_instance(patch_debounce=60)
+
+        instance.set_status(InstanceStatus.RUNNING)
+        instance.set_version("1.2.0")
+        instance.set_status(InstanceStatus.DEGRADED)
+        assert client.http_client._make_request.call_count == 0
+
+        client.flush()
+        assert patch_bodies(client.http_client._make_request) == [
+            {"status": "degraded", "version": "1.2.0"}
+        ]
+
+    def test_debounce_timer_sends_patch(self):
+        client, instance = make_instance(patch_debounce=0.05)
+
+        instance.set_status(InstanceStatus.RUNNING)
+        timer = instance._patch_timer
+        timer.join(5)
+
+        assert patch_bodies(client.http_client._make_request) == [{"status": "running"}]
+
+    def test_failed_final_patch_does_not_abort_shutdown(self):
+        client, instance = make_instance(patch_debounce=60)
+        error = ReplicatedNetworkError("down")
+        client.http_client._make_request.side_effect = error
+        client.http_client.__exit__ = Mock()
+
+        instance.set_status(InstanceStatus.RUNNING)
+        client.__exit__(None, None, None)
+
+        assert instance.last_patch_error is error
+        client.http_client.__exit__.assert_called_once()
+
+
+class TestAsyncInstanceUpdate:
+    @pytest.mark.asyncio
+    async def test_update_sends_one_patch(self):
+        client, instance = make_async_instance()
+
+        await instance.update(status=InstanceStatus.RUNNING, version="1.2.0")
+
+        assert patch_bodies(client.http_client._make_request_async) == [
+            {"status": "running", "version": "1.2.0"}
+        ]
+
+    @pytest.mark.asyncio
+    async def test_debounced_updates_are_merged(self):
+        client, instance = make_async_instance(patch_debounce=60)
+
+        await instance.set_status(InstanceStatus.RUNNING)
+        await instance.set_version("1.2.0")
+        await instance.set_status(InstanceStatus.DEGRADED)
+        assert client.http_client._make_request_async.call_count == 0
+
+        await client.drain()
+        assert patch_bodies(client.http_client._make_request_async) == [
+            {"status": "degraded", "version": "1.2.0"}
+        ]
+
+    @pytest.mark.asyncio
+    async def test_failed_final_patch_does_not_abort_shutdown(self):
+        client, instance = make_async_instance(patch_debounce=60)
+        error = ReplicatedNetworkError("down")
+        client.http_client._make_request_async.side_effect = error
+        client.http_client.__aexit__ = AsyncMock()
+
+        await instance.set_status(InstanceStatus.RUNNING)
+        await client.__aexit__(None, None, None)
+
+        assert instance.last_patch_error is error
+        client.http_client.__aexit__.assert_awaited_once()
+
+
+def sent_requests(mock):
+    return [
+        (c.args[0], c.args[1].rsplit("/", 1)[-1], c.kwargs.get("json_data"))
+        for c in mock.call_args_list
+    ]
+
+
+class TestReportMetrics:
+    def test_only_changes_are_sent_and_vanished_metrics_deleted(self):
+        client, instance = make_instance()
+        mock = client.http_client._make_request
+
+        instance.report_metrics({"cpu": 0.5, "mem": 10, "disk": 3})
+        assert mock.call_count == 3
+        mock.reset_mock()
+
+        instance.report_metrics({"cpu": 0.5, "mem": 11})
+        assert sent_requests(mock) == [
+            ("POST", "metrics", {"name": "mem", "value": 11}),
+            ("DELETE", "disk", None),
+        ]
+        mock.reset_mock()
+
+        instance.report_metrics({"cpu": 0.5, "mem": 11})
+        assert mock.call_count == 0
+
+    def test_unchanged_values_are_resent_after_heartbeat(self, monkeypatch):
+        client, instance = make_instance()
+        mock = client.http_client._make_request
+        now = [1000.0]
+        monkeypatch.setattr("replicated.resources.time.monotonic", lambda: now[0])
+
+        instance.report_metrics({"cpu": 0.5, "mem": 10}, heartbeat=60)
+        now[0] += 30
+        instance.report_metrics({"cpu": 0.5, "mem": 12}, heartbeat=60)
+        mock.reset_mock()
+
+        now[0] += 30
+        instance.report_metrics({"cpu": 0.5, "mem": 12}, heartbeat=60)
+        assert sent_requests(mock) == [
+            ("POST", "metrics", {"name": "cpu", "value": 0.5})
+        ]
+
+    def test_failed_send_is_retried_on_next_report(self):
+        client, instance = make_instance()
+        mock = client.http_client._make_request
+        mock.side_effect = [{}, RuntimeError("boom")]
+
+        with pytest.raises(RuntimeError):
+            instance.report_metrics({"cpu": 1, "mem": 2})
+        mock.side_effect = None
+        mock.reset_mock()
+
+        instance.report_metrics({"cpu": 1, "mem": 2})
+        assert sent_requests(mock) == [("POST", "metrics", {"name": "mem", "value": 2})]
+
+    def test_direct_send_invalidates_the_index(self):
+        client, instance = make_instance()
+        mock = client.http_client._make_request
+
+        instance.report_metrics({"cpu": 1})
+        instance.send_metric("cpu", 2)
+        mock.reset_mock()
+
+        instance.report_metrics({"cpu": 1})
+        assert mock.call_count == 1
+
+    def test_batched_metric_is_indexed_once_sent(self):
+        client, instance = make_instance(batching=BatchConfig(flush_interval=60))
+        mock = client.http_client._make_request
+        mock.side_effect = RuntimeError("boom")
+
+        instance.report_metrics({"cpu": 1})
+        client.flush()
+        mock.side_effect = None
+        mock.reset_mock()
+
+        instance.report_metrics({"cpu": 1})
+        client.flush()
+        assert sent_requests(mock) == [("POST", "metrics", {"name": "cpu", "value": 1})]
+        mock.reset_mock()
+
+        instance.report_metrics({"cpu": 1})
+        client.flush()
+        assert mock.call_count == 0
+
+    @pytest.mark.asyncio
+    async def test_async_report_metrics(self):
+        client, instance = make_async_instance()
+        mock = client.http_client._make_request_async
+
+        await instance.report_metrics({"cpu": 0.5, "mem": 10})
+        mock.reset_mock()
+        await instance.report_metrics({"cpu": 0.7})
+
+        assert sent_requests(mock) == [
+            ("POST", "metrics", {"name": "cpu", "value": 0.7}),
+            ("DELETE", "mem", None),
+        ]
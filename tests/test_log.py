@@ -0,0 +1,90 @@
+import logging
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from replicated import ReplicatedAPIError, http_client
+from replicated.http_client import SyncHTTPClient
+from replicated.log import LogRateLimiter, Truncated
+
+
+def failing_client(body):
+    client = SyncHTTPClient(base_url="https://replicated.test")
+    client._client = httpx.Client(
+        transport=httpx.MockTransport(lambda request: httpx.Response(500, text=body))
+    )
+    return client
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiter():
+    with patch("replicated.http_client._error_log_limiter", LogRateLimiter()):
+        yield
+
+
+def test_error_responses_are_logged_not_printed(caplog, capsys):
+    caplog.set_level(logging.DEBUG, logger="replicated")
+
+    with pytest.raises(ReplicatedAPIError):
+        failing_client("x" * 2000)._make_request("GET", "/v3/thing")
+
+    assert capsys.readouterr().out == ""
+    [record] = caplog.records
+    assert record.name == "replicated.http"
+    message = record.getMessage()
+    assert message.startswith("HTTP 500 from GET /v3/thing")
+    assert message.endswith("... (2000 chars)")
+    assert len(message) < 600
+
+
+def test_repeated_errors_are_rate_limited(caplog):
+    caplog.set_level(logging.DEBUG, logger="replicated")
+    client = failing_client("boom")
+
+    for _ in range(20):
+        with pytest.raises(ReplicatedAPIError):
+            client._make_request("GET", "/v3/thing")
+
+    assert len(caplog.records) == 5
+
+
+def test_errors_are_rate_limited_per_route(caplog):
+    caplog.set_level(logging.DEBUG, logger="replicated")
+    client = failing_client("boom")
+
+    for i in range(20):
+        with pytest.raises(ReplicatedAPIError):
+            client._make_request("POST", f"/api/v1/instances/instance_{i}/metrics")
+
+    assert len(caplog.records) == 5
+    assert len(http_client._error_log_limiter._windows) == 1
+
+
+def test_nothing_is_formatted_when_debug_is_disabled(caplog):
+    caplog.set_level(logging.WARNING, logger="replicated")
+
+    with patch.object(Truncated, "__str__") as formatted:
+        with patch.object(SyncHTTPClient, "_log_error_response") as log_error:
+            with pytest.raises(ReplicatedAPIError):
+                failing_client("boom")._make_request("GET", "/v3/thing")
+
+    log_error.assert_not_called()
+    formatted.assert_not_called()
+    assert caplog.records == []
+
+
+def test_limiter_reports_suppressed_count(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("replicated.log.time.monotonic", lambda: now[0])
+    limiter = LogRateLimiter(interval=10, burst=2)
+
+    assert [limiter.allow("k")[0] for _ in range(5)] == [
+        True,
+        True,
+        False,
+        False,
+        False,
+    ]
+    now[0] = 10.0
+    assert limiter.allow("k") == (True, 3)
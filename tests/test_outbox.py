@@ -0,0 +1,316 @@
+import threading
+import time
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from replicated import (
+    AsyncReplicatedClient,
+    InstanceStatus,
+    OutboxConfig,
+    ReplicatedAPIError,
+    ReplicatedClient,
+    ReplicatedDeadlineExceededError,
+    ReplicatedNetworkError,
+)
+from replicated.outbox import Outbox, OutboxReplayer, compact
+from replicated.resources import AsyncInstance, Instance
+from replicated.testing import FakeReplicatedAPI, FakeReplicatedServer
+
+
+def metric(name, value, instance_id="instance_456"):
+    return {
+        "op": "metric",
+        "customer_id": "customer_123",
+        "instance_id": instance_id,
+        "name": name,
+        "value": value,
+    }
+
+
+def patch(**fields):
+    return {
+        "op": "patch",
+        "customer_id": "customer_123",
+        "instance_id": "instance_456",
+        "fields": fields,
+    }
+
+
+class TestCompact:
+    def test_keeps_latest_metric_value(self):
+        records = [metric("cpu", 1), metric("mem", 5), metric("cpu", 2)]
+
+        assert compact(records) == [metric("mem", 5), metric("cpu", 2)]
+
+    def test_delete_supersedes_earlier_sends(self):
+        delete = {**metric("cpu", None), "op": "delete_metric"}
+        del delete["value"]
+
+        assert compact([metric("cpu", 1), delete]) == [delete]
+
+    def test_merges_patch_fields(self):
+        records = [patch(status="running"), patch(version="1.0"), patch(status="ready")]
+
+        assert compact(records) == [patch(status="ready", version="1.0")]
+
+
+class TestOutbox:
+    def test_rotates_segments(self, tmp_path):
+        outbox = Outbox(tmp_path, OutboxConfig(segment_bytes=200))
+
+        for i in range(10):
+            outbox.append(metric(f"m{i}", i))
+
+        assert len(list(tmp_path.glob("*.log"))) > 1
+        records, _ = outbox.take()
+        assert [r["value"] for r in records] == list(range(10))
+
+    def test_stays_within_max_bytes(self, tmp_path):
+        outbox = Outbox(tmp_path, OutboxConfig(max_bytes=2000, segment_bytes=500))
+
+        for i in range(200):
+            outbox.append(metric(f"m{i}", i))
+
+        assert sum(p.stat().st_size for p in tmp_path.glob("*.log")) <= 2000
+        assert outbox.dropped > 0
+        records, _ = outbox.take()
+        assert records[-1]["value"] == 199
+
+    def test_compaction_avoids_drops_for_repeated_metrics(self, tmp_path):
+        outbox = Outbox(tmp_path, OutboxConfig(max_bytes=2000, segment_bytes=500))
+
+        for i in range(200):
+            outbox.append(metric("cpu", i))
+
+        assert outbox.dropped == 0
+        records, _ = outbox.take()
+        assert records == [metric("cpu", 199)]
+
+    def test_replay_keeps_records_after_network_failure(self, tmp_path):
+        outbox = Outbox(tmp_path, OutboxConfig())
+        for name in ("a", "b", "c"):
+            outbox.append(metric(name, 1))
+        sent = []
+
+        def send(record):
+            if record["name"] == "b":
+                raise ReplicatedNetworkError("down")
+            sent.append(record["name"])
+
+        assert outbox.replay(send) is False
+        assert sent == ["a"]
+        assert outbox.replay(lambda record: sent.append(record["name"]))
+        assert sent == ["a", "b", "c"]
+        assert not outbox.has_pending()
+
+    def test_replay_drops_rejected_records(self, tmp_path):
+        outbox = Outbox(tmp_path, OutboxConfig())
+        outbox.append(metric("a", 1))
+
+        def send(record):
+            raise ReplicatedAPIError("bad", http_status=400)
+
+        assert outbox.replay(send) is True
+        assert outbox.dropped == 1
+        assert not outbox.has_pending()
+
+    def test_replay_drops_records_that_cannot_be_sent(self, tmp_path):
+        outbox = Outbox(tmp_path, OutboxConfig())
+        outbox.append({"op": "metric", "customer_id": "customer_123", "name": "a"})
+        outbox.append(metric("b", 1))
+        sent = []
+
+        assert outbox.replay(lambda record: sent.append(record["value"])) is True
+        assert sent == [1]
+        assert outbox.dropped == 1
+        assert not outbox.has_pending()
+
+    def test_replay_checks_stop_between_records(self, tmp_path):
+        outbox = Outbox(tmp_path, OutboxConfig())
+        for name in ("a", "b", "c"):
+            outbox.append(metric(name, 1))
+        stop = threading.Event()
+        sent = []
+
+        def send(record):
+            sent.append(record["name"])
+            stop.set()
+
+        assert outbox.replay(send, stop) is False
+        assert sent == ["a"]
+        records, _ = outbox.take()
+        assert [r["name"] for r in records] == ["b", "c"]
+
+    def test_one_replay_at_a_time_across_outboxes(self, tmp_path):
+        outbox = Outbox(tmp_path, OutboxConfig())
+        other = Outbox(tmp_path, OutboxConfig())
+        outbox.append(metric("a", 1))
+        sent = []
+
+        def send(record):
+            # Another process sharing the directory must not send it too.
+            assert other.replay(sent.append) is False
+            sent.append(record["name"])
+
+        assert outbox.replay(send)
+        assert sent == ["a"]
+        assert other.replay(sent.append)
+
+    def test_stop_does_not_wait_forever_for_a_send(self, tmp_path):
+        outbox = Outbox(tmp_path, OutboxConfig(replay_interval=0))
+        outbox.append(metric("a", 1))
+        started, release = threading.Event(), threading.Event()
+
+        def send(record):
+            started.set()
+            release.wait(5)
+
+        replayer = OutboxReplayer(outbox, send)
+        replayer.start()
+        assert started.wait(5)
+        start = time.monotonic()
+        replayer.stop(timeout=0.1)
+        assert time.monotonic() - start < 1
+        release.set()
+
+    def test_records_appended_during_replay_are_kept(self, tmp_path):
+        outbox = Outbox(tmp_path, OutboxConfig())
+        outbox.append(metric("a", 1))
+
+        outbox.replay(lambda record: outbox.append(metric("b", 2)))
+
+        records, _ = outbox.take()
+        assert records == [metric("b", 2)]
+
+
+def offline_client(**kwargs):
+    client = ReplicatedClient(
+        publishable_key="pk_test_123",
+        app_slug="my-app",
+        outbox=OutboxConfig(replay_interval=3600),
+        **kwargs,
+    )
+    client.http_client._make_request = Mock(side_effect=ReplicatedNetworkError("down"))
+    return client, Instance(client, "customer_123", "instance_456")
+
+
+class TestClientOutbox:
+    def test_failed_operations_are_spooled(self):
+        client, instance = offline_client()
+
+        instance.send_metric("cpu", 1)
+        instance.set_status(InstanceStatus.RUNNING)
+        instance.send_metric("cpu", 2)
+
+        # Only the first call waited on the network.
+        assert client.http_client._make_request.call_count == 1
+        records, _ = client._outbox.take()
+        assert [(r["op"], r.get("value"), r.get("fields")) for r in records] == [
+            ("patch", None, {"status": "running"}),
+            ("metric", 2, None),
+        ]
+        assert all(r["ts"] > 0 for r in records)
+
+    def test_replay_sends_spooled_operations(self):
+        client, instance = offline_client()
+        instance.send_metric("cpu", 1)
+        instance.set_version("1.2.0")
+        client.http_client._make_request = Mock(return_value={})
+
+        assert client._outbox.replay(client._replay_record)
+
+        calls = client.http_client._make_request.call_args_list
+        assert [c.args for c in calls] == [
+            ("POST", "/api/v1/instances/instance_456/metrics"),
+            ("PATCH", "/api/v1/instances/instance_456"),
+        ]
+        assert not client._outbox.has_pending()
+
+    def test_pending_records_survive_restart(self):
+        client, instance = offline_client()
+        instance.send_metric("cpu", 1)
+        client._outbox_replayer.stop()
+
+        restarted = ReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            outbox=OutboxConfig(replay_interval=3600),
+        )
+        restarted._outbox_replayer.stop()
+
+        assert restarted._outbox.offline
+        records, _ = restarted._outbox.take()
+        assert [r["name"] for r in records] == ["cpu"]
+
+    def test_deadline_expiry_is_raised_and_not_spooled(self):
+        api = FakeReplicatedAPI()
+        with FakeReplicatedServer(api) as server:
+            client = ReplicatedClient(
+                publishable_key="pk_test_123",
+                app_slug="my-app",
+                base_url=server.url,
+                fingerprint="host-1",
+                outbox=OutboxConfig(replay_interval=3600),
+            )
+            with client:
+                customer = client.customer.get_or_create("user@example.com")
+                instance = customer.get_or_create_instance()
+                api.latency = 0.3
+                with pytest.raises(ReplicatedDeadlineExceededError):
+                    instance.send_metric("a", 1, timeout=0.1)
+
+                assert not client._outbox.offline
+                assert not client._outbox.has_pending()
+
+    def test_errors_propagate_without_outbox(self):
+        client = ReplicatedClient(publishable_key="pk_test_123", app_slug="my-app")
+        client.http_client._make_request = Mock(
+            side_effect=ReplicatedNetworkError("down")
+        )
+
+        with pytest.raises(ReplicatedNetworkError):
+            Instance(client, "customer_123", "instance_456").send_metric("cpu", 1)
+
+
+@pytest.mark.asyncio
+async def test_async_failed_operations_are_spooled_and_replayed():
+    client = AsyncReplicatedClient(
+        publishable_key="pk_test_123",
+        app_slug="my-app",
+        outbox=OutboxConfig(replay_interval=3600),
+    )
+    client.http_client._make_request_async = AsyncMock(
+        side_effect=ReplicatedNetworkError("down")
+    )
+    instance = AsyncInstance(client, "customer_123", "instance_456")
+
+    await instance.send_metric("cpu", 1)
+    await instance.delete_metric("cpu")
+    assert client._outbox.offline
+
+    client.http_client._make_request_async = AsyncMock(return_value={})
+    assert await client._outbox.replay_async(client._replay_record)
+    calls = client.http_client._make_request_async.call_args_list
+    assert [c.args for c in calls] == [
+        ("DELETE", "/api/v1/instances/instance_456/metrics/cpu")
+    ]
+    client._outbox_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_async_deadline_expiry_does_not_take_the_outbox_offline():
+    client = AsyncReplicatedClient(
+        publishable_key="pk_test_123",
+        app_slug="my-app",
+        outbox=OutboxConfig(replay_interval=3600),
+    )
+    client.http_client._make_request_async = AsyncMock(
+        side_effect=ReplicatedDeadlineExceededError("Deadline exceeded")
+    )
+    instance = AsyncInstance(client, "customer_123", "instance_456")
+
+    with pytest.raises(ReplicatedDeadlineExceededError):
+        await instance.send_metric("cpu", 1)
+    assert not client._outbox.offline
+    assert not client._outbox.has_pending()
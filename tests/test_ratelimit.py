@@ -0,0 +1,90 @@
+import httpx
+import pytest
+
+from replicated import RateLimiter, ReplicatedRateLimitError
+from replicated.http_client import SyncHTTPClient
+from replicated.ratelimit import TokenBucket, route_for
+
+
+class TestTokenBucket:
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=10.0, burst=2)
+
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+        assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+    def test_rate_limited_slows_down_and_recovers(self):
+        bucket = TokenBucket(rate=10.0, burst=1, recovery=0.5)
+
+        bucket.on_rate_limited()
+        assert bucket.rate == 5.0
+        bucket.on_rate_limited()
+        assert bucket.rate == 2.5
+
+        bucket.on_success()
+        assert bucket.rate == 7.5
+        bucket.on_success()
+        assert bucket.rate == 10.0
+
+    def test_retry_after_pauses_bucket(self):
+        bucket = TokenBucket(rate=10.0, burst=5)
+
+        bucket.on_rate_limited(retry_after=2.0)
+
+        assert bucket.reserve() == pytest.approx(2.0 + 1 / 5.0, abs=0.01)
+
+    def test_retry_after_pause_is_capped(self):
+        bucket = TokenBucket(rate=10.0, burst=5, max_pause=3.0)
+
+        bucket.on_rate_limited(retry_after=86400)
+
+        assert bucket.reserve() == pytest.approx(3.0 + 1 / 5.0, abs=0.01)
+
+
+class TestRateLimiter:
+    def test_routes(self):
+        assert route_for("POST", "/v3/customer") == "customer"
+        assert route_for("POST", "/api/v1/instances/i1/metrics") == "metrics"
+        assert route_for("DELETE", "/api/v1/instances/i1/metrics/cpu") == "metrics"
+        assert route_for("PATCH", "/api/v1/instances/i1") == "instance"
+        assert route_for("POST", "/api/v1/customers/c1/instances") == "instance"
+        assert route_for("GET", "/other") == "default"
+
+    def test_shared_between_clients(self, monkeypatch):
+        slept = []
+        monkeypatch.setattr("replicated.ratelimit.time.sleep", slept.append)
+        limiter = RateLimiter({"metrics": (1.0, 1)})
+
+        def handler(request):
+            return httpx.Response(200, json={})
+
+        clients = []
+        for _ in range(2):
+            client = SyncHTTPClient(rate_limiter=limiter)
+            client._client = httpx.Client(transport=httpx.MockTransport(handler))
+            clients.append(client)
+
+        clients[0]._make_request("POST", "/api/v1/instances/i1/metrics")
+        clients[1]._make_request("POST", "/api/v1/instances/i2/metrics")
+        clients[1]._make_request("PATCH", "/api/v1/instances/i2")
+
+        assert len(slept) == 1
+        assert slept[0] == pytest.approx(1.0, abs=0.05)
+
+    def test_429_lowers_route_rate(self, monkeypatch):
+        monkeypatch.setattr("replicated.ratelimit.time.sleep", lambda delay: None)
+        limiter = RateLimiter({"metrics": (8.0, 10)})
+
+        def handler(request):
+            return httpx.Response(429)
+
+        client = SyncHTTPClient(rate_limiter=limiter)
+        client._client = httpx.Client(transport=httpx.MockTransport(handler))
+
+        with pytest.raises(ReplicatedRateLimitError):
+            client._make_request("POST", "/api/v1/instances/i1/metrics")
+
+        assert limiter.buckets["metrics"].rate == 4.0
+        assert limiter.buckets["instance"].rate == 5.0
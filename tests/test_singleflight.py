@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from replicated import AsyncReplicatedClient, ReplicatedClient
+from replicated.resources import AsyncInstance, Instance
+from replicated.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def api_handler(created):
+    """Fake API that counts customer and instance creations."""
+
+    def handler(request):
+        path = request.url.path
+        if path == "/v3/customer":
+            created.append(path)
+            time.sleep(0.05)
+            return httpx.Response(200, json={"customer": {"id": "customer_123"}})
+        if path.endswith("/instances"):
+            created.append(path)
+            time.sleep(0.05)
+            return httpx.Response(200, json={"id": "instance_456"})
+        return httpx.Response(200, json={})
+
+    return handler
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def slow():
+            calls.append(1)
+            started.set()
+            time.sleep(0.05)
+            return "result"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == [1]
+        assert results == ["result"] * 10
+
+    def test_errors_are_shared_and_not_cached(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            flight.do("k", fail)
+        assert flight.do("k", lambda: "ok") == "ok"
+
+    @pytest.mark.asyncio
+    async def test_async_concurrent_calls_share_one_execution(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("k", slow) for _ in range(10)))
+
+        assert calls == [1]
+        assert results == ["result"] * 10
+
+    @pytest.mark.asyncio
+    async def test_async_errors_are_shared(self):
+        flight = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *(flight.do("k", fail) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(r, ValueError) for r in results)
+
+
+class TestColdStart:
+    def test_threads_create_one_instance(self):
+        created = []
+        client = ReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            transport=httpx.MockTransport(api_handler(created)),
+            fingerprint="test-machine",
+        )
+        instance = Instance(client, "customer_123")
+
+        threads = [
+            threading.Thread(target=instance.send_metric, args=("cpu", i))
+            for i in range(50)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert created == ["/api/v1/customers/customer_123/instances"]
+        assert instance.instance_id == "instance_456"
+
+    def test_threads_create_one_customer(self):
+        created = []
+        client = ReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            transport=httpx.MockTransport(api_handler(created)),
+        )
+
+        threads = [
+            threading.Thread(
+                target=client.customer.get_or_create, args=("a@example.com",)
+            )
+            for _ in range(50)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert created == ["/v3/customer"]
+
+    def test_warm_cache_skips_the_shared_call(self, monkeypatch):
+        created = []
+        client = ReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            transport=httpx.MockTransport(api_handler(created)),
+            fingerprint="test-machine",
+        )
+        client.customer.get_or_create("a@example.com")
+        Instance(client, "customer_123").send_metric("cpu", 1)
+
+        spawned = []
+        monkeypatch.setattr(
+            client._single_flight, "do", lambda key, fn: spawned.append(key)
+        )
+        customer = client.customer.get_or_create("a@example.com", timeout=5)
+        Instance(client, "customer_123").send_metric("cpu", 2, timeout=5)
+
+        assert customer.customer_id == "customer_123"
+        assert spawned == []
+        assert len(created) == 2
+
+    @pytest.mark.asyncio
+    async def test_tasks_create_one_instance_and_customer(self):
+        created = []
+
+        async def handler(request):
+            await asyncio.sleep(0.01)
+            return api_handler(created)(request)
+
+        client = AsyncReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            transport=httpx.MockTransport(handler),
+            fingerprint="test-machine",
+        )
+        await asyncio.gather(
+            *(client.customer.get_or_create("a@example.com") for _ in range(50))
+        )
+        instance = AsyncInstance(client, "customer_123")
+        await asyncio.gather(*(instance.send_metric("cpu", i) for i in range(50)))
+
+        assert created == [
+            "/v3/customer",
+            "/api/v1/customers/customer_123/instances",
+        ]
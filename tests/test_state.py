@@ -0,0 +1,122 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from replicated.state import StateManager
+
+
+class TestStateManager:
+    def test_round_trip(self):
+        manager = StateManager("my-app")
+        manager.set_customer_id("customer_123")
+        manager.set_dynamic_token("token_abc")
+
+        assert manager.get_customer_id() == "customer_123"
+        assert manager.get_dynamic_token() == "token_abc"
+        assert StateManager("my-app").get_customer_id() == "customer_123"
+
+    def test_reads_are_served_from_memory(self, monkeypatch):
+        manager = StateManager("my-app")
+        manager.set_dynamic_token("token_abc")
+
+        opened = []
+        real_open = open
+        monkeypatch.setattr(
+            "builtins.open", lambda *a, **kw: opened.append(a) or real_open(*a, **kw)
+        )
+        for _ in range(10):
+            assert manager.get_dynamic_token() == "token_abc"
+        assert opened == []
+
+    def test_external_changes_are_picked_up(self):
+        manager = StateManager("my-app")
+        manager.set_customer_id("customer_123")
+
+        other = StateManager("my-app")
+        other.set_customer_id("customer_4567")
+
+        assert manager.get_customer_id() == "customer_4567"
+
+    def test_external_rewrite_with_new_inode(self):
+        manager = StateManager("my-app")
+        manager.set_instance_id("instance_1")
+
+        path = manager._state_file
+        tmp = path.with_name("state.json.new")
+        tmp.write_text(json.dumps({"instance_id": "instance_2"}))
+        os.replace(tmp, path)
+
+        assert manager.get_instance_id() == "instance_2"
+
+    def test_clear_state(self):
+        manager = StateManager("my-app")
+        manager.set_customer_id("customer_123")
+        manager.clear_state()
+
+        assert manager.get_customer_id() is None
+        assert not manager._state_file.exists()
+
+    def test_update_writes_all_fields_at_once(self, monkeypatch):
+        manager = StateManager("my-app")
+        writes = []
+        real_write = manager._write_state
+        monkeypatch.setattr(
+            manager, "_write_state", lambda s: writes.append(s) or real_write(s)
+        )
+
+        manager.update(customer_id="customer_123", customer_email="a@example.com")
+        manager.update(customer_email=None)
+
+        assert len(writes) == 2
+        assert manager.get_state() == {"customer_id": "customer_123"}
+
+    def test_writes_leave_no_temp_files(self):
+        manager = StateManager("my-app")
+        for i in range(5):
+            manager.set_instance_id(f"instance_{i}")
+
+        names = sorted(p.name for p in manager._state_dir.iterdir())
+        assert names == ["state.json", "state.json.lock"]
+        assert json.loads(manager._state_file.read_text()) == {
+            "instance_id": "instance_4"
+        }
+
+    def test_key_locks_exclude_only_the_same_key(self):
+        manager = StateManager("my-app")
+        pool = ThreadPoolExecutor(2)
+        with manager.key_lock("customer:a"):
+            same = pool.submit(_hold_key_lock, manager, "customer:a")
+            other = pool.submit(_hold_key_lock, manager, "customer:b")
+            assert other.result(timeout=1)
+            time.sleep(0.05)
+            assert not same.done()
+        assert same.result(timeout=1)
+        pool.shutdown()
+
+    def test_concurrent_processes_do_not_lose_updates(self):
+        import multiprocessing
+
+        ctx = multiprocessing.get_context("fork")
+        procs = [
+            ctx.Process(target=_write_many_fields, args=(worker,))
+            for worker in range(4)
+        ]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+
+        state = StateManager("my-app").get_state()
+        assert len(state) == 4 * 25
+
+
+def _write_many_fields(worker):
+    manager = StateManager("my-app")
+    for i in range(25):
+        manager.update(**{f"w{worker}_{i}": i})
+
+
+def _hold_key_lock(manager, key):
+    with manager.key_lock(key):
+        return True
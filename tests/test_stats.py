@@ -0,0 +1,138 @@
+import httpx
+import pytest
+
+from replicated import (
+    AsyncReplicatedClient,
+    ReplicatedAPIError,
+    ReplicatedClient,
+    RetryPolicy,
+)
+from replicated.stats import LATENCY_BUCKETS, RequestInfo, RequestStats
+from tests.helpers import responder
+
+
+def make_client(handler, **kwargs):
+    return ReplicatedClient(
+        publishable_key="pk_test_123",
+        app_slug="my-app",
+        transport=httpx.MockTransport(handler),
+        **kwargs,
+    )
+
+
+def record_events(client):
+    events = []
+    for event in ("on_request_start", "on_request_end", "on_error", "on_retry"):
+        client.add_hook(
+            event,
+            lambda info, event=event: events.append((event, info, info.status)),
+        )
+    return events
+
+
+class TestHooks:
+    def test_hooks_follow_each_attempt(self, sleeps):
+        handler, _ = responder(httpx.Response(503), httpx.Response(200, json={}))
+        client = make_client(handler, retry=RetryPolicy(max_attempts=2))
+        events = record_events(client)
+
+        client.http_client._make_request("PUT", "/api/v1/instances/i/metrics")
+
+        assert [(e, info.attempt, status) for e, info, status in events] == [
+            ("on_request_start", 1, None),
+            ("on_request_end", 1, 503),
+            ("on_error", 1, 503),
+            ("on_retry", 1, 503),
+            ("on_request_start", 2, None),
+            ("on_request_end", 2, 200),
+        ]
+        assert events[3][1].retry_delay == sleeps[0]
+        assert events[-1][1].endpoint == "PUT metrics"
+        assert events[-1][1].elapsed > 0
+
+    def test_failing_hook_does_not_fail_the_request(self, caplog):
+        handler, _ = responder(httpx.Response(200, json={"ok": True}))
+        client = make_client(handler)
+        client.add_hook("on_request_end", lambda info: 1 / 0)
+
+        assert client.http_client._make_request("GET", "/x") == {"ok": True}
+        assert "on_request_end hook" in caplog.text
+
+    def test_unknown_event_is_rejected(self):
+        client = make_client(responder(httpx.Response(200))[0])
+
+        with pytest.raises(ValueError):
+            client.add_hook("on_everything", print)
+
+    def test_removed_hook_is_not_called(self):
+        handler, _ = responder(httpx.Response(200, json={}))
+        client = make_client(handler)
+        calls = []
+        client.add_hook("on_request_end", calls.append)
+        client.remove_hook("on_request_end", calls.append)
+
+        client.http_client._make_request("GET", "/x")
+
+        assert calls == []
+
+
+class TestStats:
+    def test_counts_requests_errors_and_bytes(self, sleeps):
+        handler, _ = responder(
+            httpx.Response(429), httpx.Response(200, json={"id": "abc"})
+        )
+        client = make_client(handler, retry=RetryPolicy(max_attempts=2))
+
+        client.http_client._make_request(
+            "POST",
+            "/api/v1/instances/i/metrics",
+            json_data={"name": "cpu"},
+            idempotent=True,
+        )
+        handler, _ = responder(httpx.Response(400))
+        client.http_client._client = httpx.Client(
+            transport=httpx.MockTransport(handler)
+        )
+        with pytest.raises(ReplicatedAPIError):
+            client.http_client._make_request("GET", "/v3/customer")
+
+        stats = client.stats()
+        metrics = stats["POST metrics"]
+        assert metrics["requests"] == 2
+        assert metrics["errors"] == 1
+        assert metrics["retries"] == 1
+        assert metrics["errors_by_type"] == {"ReplicatedRateLimitError": 1}
+        assert metrics["bytes_sent"] == 2 * len(b'{"name":"cpu"}')
+        assert metrics["bytes_received"] == len(b'{"id":"abc"}')
+        assert metrics["latency"]["count"] == 2
+        assert sum(c for _, c in metrics["latency"]["buckets"]) == 2
+        assert stats["GET customer"]["errors_by_type"] == {"ReplicatedAPIError": 1}
+
+    def test_histogram_buckets(self):
+        stats = RequestStats()
+        for elapsed in (0.001, 0.005, 0.3, 60.0):
+            info = RequestInfo("GET", "/x", "GET default", 1)
+            info.elapsed = elapsed
+            stats.record(info)
+
+        buckets = dict(stats.snapshot()["GET default"]["latency"]["buckets"])
+        assert len(buckets) == len(LATENCY_BUCKETS) + 1
+        assert buckets[0.005] == 2
+        assert buckets[0.5] == 1
+        assert buckets["+Inf"] == 1
+
+
+@pytest.mark.asyncio
+async def test_async_client_hooks_and_stats():
+    handler, _ = responder(httpx.Response(200, json={}))
+    client = AsyncReplicatedClient(
+        publishable_key="pk_test_123",
+        app_slug="my-app",
+        transport=httpx.MockTransport(handler),
+    )
+    events = record_events(client)
+
+    await client.http_client._make_request_async("GET", "/x")
+
+    assert [e for e, _, _ in events] == ["on_request_start", "on_request_end"]
+    assert client.stats()["GET default"]["requests"] == 1
@@ -0,0 +1,157 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from replicated import AsyncReplicatedClient, ReplicatedClient
+from replicated.store import LRUCache, TenantStore
+from replicated.testing import FakeReplicatedAPI, FakeReplicatedServer
+
+
+class TestLRUCache:
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert len(cache) == 2
+
+
+class TestTenantStore:
+    def test_round_trip_and_persistence(self, tmp_path):
+        store = TenantStore(tmp_path / "tenants.db")
+        store.put_customer("a@example.com", "customer_a", "token_a")
+        store.set_instance_id("customer_a", "instance_a")
+        store.close()
+
+        store = TenantStore(tmp_path / "tenants.db", cache_size=1)
+        assert store.get_customer("a@example.com").customer_id == "customer_a"
+        assert store.get_dynamic_token("customer_a") == "token_a"
+        assert store.get_instance_id("customer_a") == "instance_a"
+        assert store.get_customer("b@example.com") is None
+
+    def test_many_tenants_with_small_cache(self, tmp_path):
+        store = TenantStore(tmp_path / "tenants.db", cache_size=16)
+        for i in range(1000):
+            store.put_customer(f"user{i}@example.com", f"customer_{i}", f"t{i}")
+
+        assert store.get_customer("user3@example.com").customer_id == "customer_3"
+        assert store.get_dynamic_token("customer_999") == "t999"
+
+    def test_cached_lookup_never_reads_the_database_or_waits(self, tmp_path):
+        store = TenantStore(tmp_path / "tenants.db")
+        store.put_customer("a@example.com", "customer_a", "token_a")
+        assert store.cached_customer_by_id("customer_a").dynamic_token == "token_a"
+
+        store = TenantStore(tmp_path / "tenants.db")
+        assert store.cached_customer_by_id("customer_a") is None
+        store.get_customer_by_id("customer_a")
+        with store._lock:
+            assert store.cached_customer_by_id("customer_a") is None
+        assert store.cached_customer_by_id("customer_a") is not None
+
+
+class TestMultiTenantClient:
+    def test_switching_customers_does_not_recreate(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            path = request.url.path
+            if path == "/v3/customer":
+                customer_id = (
+                    "customer_a"
+                    if b"a@example.com" in request.content
+                    else "customer_b"
+                )
+                return httpx.Response(
+                    200,
+                    json={
+                        "customer": {
+                            "id": customer_id,
+                            "serviceToken": f"token_{customer_id}",
+                        }
+                    },
+                )
+            if path.endswith("/instances"):
+                customer_id = path.split("/")[-2]
+                return httpx.Response(200, json={"id": f"instance_{customer_id}"})
+            return httpx.Response(200, json={})
+
+        client = ReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            transport=httpx.MockTransport(handler),
+            fingerprint="test-machine",
+            multi_tenant=True,
+        )
+
+        for _ in range(3):
+            for email in ("a@example.com", "b@example.com"):
+                customer = client.customer.get_or_create(email)
+                instance = customer.get_or_create_instance()
+                instance.send_metric("cpu", 1)
+
+        creations = [r.url.path for r in requests if r.method == "POST"]
+        creations = [path for path in creations if not path.endswith("/metrics")]
+        assert creations == [
+            "/v3/customer",
+            "/api/v1/customers/customer_a/instances",
+            "/v3/customer",
+            "/api/v1/customers/customer_b/instances",
+        ]
+        metric_auth = {
+            r.url.path: r.headers["Authorization"]
+            for r in requests
+            if r.url.path.endswith("/metrics")
+        }
+        assert metric_auth == {
+            "/api/v1/instances/instance_customer_a/metrics": "Bearer token_customer_a",
+            "/api/v1/instances/instance_customer_b/metrics": "Bearer token_customer_b",
+        }
+
+    @pytest.mark.asyncio
+    async def test_async_cached_token_is_read_on_the_loop(self, monkeypatch):
+        api = FakeReplicatedAPI()
+        async with AsyncReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            base_url="http://fake",
+            transport=httpx.ASGITransport(app=api),
+            multi_tenant=True,
+        ) as client:
+            customer = await client.customer.get_or_create("a@example.com")
+
+            async def to_thread(fn, *args, **kwargs):
+                raise AssertionError("left the event loop for a cached token")
+
+            with monkeypatch.context() as patched:
+                patched.setattr("replicated.async_client.to_thread", to_thread)
+                headers = await client._get_auth_headers(customer.customer_id)
+
+        assert headers == {"Authorization": "Bearer service_token_1"}
+
+    def test_tenants_are_created_in_parallel(self):
+        api = FakeReplicatedAPI(latency=0.2)
+        with FakeReplicatedServer(api) as server:
+            client = ReplicatedClient(
+                publishable_key="pk_test_123",
+                app_slug="my-app",
+                base_url=server.url,
+                fingerprint="test-machine",
+                multi_tenant=True,
+            )
+            emails = [f"user{i}@example.com" for i in range(5)]
+            start = time.monotonic()
+            with ThreadPoolExecutor(len(emails)) as pool:
+                customers = list(pool.map(client.customer.get_or_create, emails))
+            elapsed = time.monotonic() - start
+
+        assert len({c.customer_id for c in customers}) == 5
+        assert elapsed < 0.6  # Not one after another (5 x 0.2s)
@@ -0,0 +1,128 @@
+import threading
+import time
+
+import httpx
+import pytest
+
+from replicated import AsyncReplicatedClient, RetryPolicy
+from replicated.exceptions import ReplicatedNetworkError, ReplicatedRateLimitError
+from replicated.testing import FakeReplicatedAPI, FakeReplicatedServer
+from tests.helpers import server_client
+
+
+class TestFakeReplicatedServer:
+    def test_customer_instance_and_metrics_round_trip(self):
+        api = FakeReplicatedAPI()
+        with FakeReplicatedServer(api) as server, server_client(server) as client:
+            customer = client.customer.get_or_create("user@example.com")
+            instance = customer.get_or_create_instance()
+            instance.send_metric("cpu", 0.5)
+            instance.set_version("1.2.3")
+            instance.delete_metric("cpu")
+            instance.send_metric("mem", 42)
+
+        assert customer.customer_id == "customer_1"
+        assert api.metrics(instance.instance_id) == {"mem": 42}
+        assert api.instances[instance.instance_id]["version"] == "1.2.3"
+        [created] = api.requests_to("POST", "/v3/customer")
+        assert created.json()["email_address"] == "user@example.com"
+        assert created.headers["authorization"] == "Bearer pk_test_123"
+
+    def test_rate_limit_is_retried_after_retry_after(self):
+        api = FakeReplicatedAPI()
+        api.rate_limit(count=2, retry_after=0.05)
+        retry = RetryPolicy(max_attempts=3, base_delay=0.01)
+        with FakeReplicatedServer(api) as server, server_client(
+            server, retry=retry
+        ) as client:
+            client.customer.get_or_create("user@example.com")
+
+        attempts = api.requests_to("POST", "/v3/customer")
+        assert len(attempts) == 3
+        assert attempts[2].received_at - attempts[0].received_at >= 0.1
+
+    def test_error_burst_exhausts_retries(self):
+        api = FakeReplicatedAPI()
+        api.rate_limit(count=None, retry_after=None, path="/v3/")
+        with FakeReplicatedServer(api) as server, server_client(
+            server, retry=RetryPolicy(max_attempts=2, base_delay=0.01)
+        ) as client:
+            with pytest.raises(ReplicatedRateLimitError):
+                client.customer.get_or_create("user@example.com")
+        assert len(api.requests) == 2
+
+    def test_dropped_connection_is_a_network_error(self):
+        api = FakeReplicatedAPI()
+        api.drop_connections(count=1)
+        with FakeReplicatedServer(api) as server, server_client(server) as client:
+            with pytest.raises(ReplicatedNetworkError):
+                client.customer.get_or_create("user@example.com")
+            # The next connection is served normally.
+            client.customer.get_or_create("user@example.com")
+
+    def test_slow_body_and_latency(self):
+        api = FakeReplicatedAPI(latency=0.05)
+        api.slow_body(delay=0.05, chunks=2)
+        with FakeReplicatedServer(api) as server, server_client(server) as client:
+            start = time.monotonic()
+            client.customer.get_or_create("user@example.com")
+            assert time.monotonic() - start >= 0.15
+
+    def test_faults_can_target_a_path(self):
+        api = FakeReplicatedAPI()
+        api.error_burst(count=1, status=500, path="/api/v1/instances/")
+        retry = RetryPolicy(max_attempts=2, base_delay=0.01)
+        with FakeReplicatedServer(api) as server, server_client(
+            server, retry=retry
+        ) as client:
+            instance = client.customer.get_or_create(
+                "a@example.com"
+            ).get_or_create_instance()
+            instance.send_metric("cpu", 1)  # Retried past the 500
+        assert [r.path for r in api.requests_to("POST", "/api/v1/instances/")] == [
+            f"/api/v1/instances/{instance.instance_id}/metrics"
+        ] * 2
+
+    def test_stop_ends_open_connections_cleanly(self):
+        api = FakeReplicatedAPI(latency=5)
+        server = FakeReplicatedServer(api)
+        server.start()
+        errors = []
+
+        def request():
+            try:
+                httpx.post(f"{server.url}/v3/customer", json={}, timeout=5)
+            except httpx.HTTPError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        while not api.requests:
+            time.sleep(0.01)
+        connections = list(server._connections)
+        server.stop()
+        thread.join(5)
+
+        assert connections and not any(task.cancelled() for task in connections)
+        assert errors
+
+
+class TestFakeReplicatedAPIInProcess:
+    @pytest.mark.asyncio
+    async def test_async_client_through_asgi_transport(self):
+        api = FakeReplicatedAPI()
+        api.drop_connections(count=1, path="/api/v1/instances/")
+        async with AsyncReplicatedClient(
+            publishable_key="pk_test_123",
+            app_slug="my-app",
+            base_url="http://fake",
+            fingerprint="host-1",
+            transport=httpx.ASGITransport(app=api),
+        ) as client:
+            customer = await client.customer.get_or_create("user@example.com")
+            instance = await customer.get_or_create_instance()
+            with pytest.raises(ReplicatedNetworkError):
+                await instance.send_metric("cpu", 1)
+            await instance.send_metric("cpu", 2)
+
+        assert api.metrics(instance.instance_id) == {"cpu": 2}